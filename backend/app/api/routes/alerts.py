@@ -1,36 +1,80 @@
 """
 告警管理API路由
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import Optional, List
 from app.models.schemas import AlertAcknowledge, AlertResolve, AlertResponse
 from app.services.alert_service import alert_service
+from app.services.presigned_url_cache import with_image_urls
 
 router = APIRouter(prefix="/api/alerts", tags=["alerts"])
 
+# 下一页游标放在响应头中，响应体保持为告警数组，旧客户端不受影响
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
 @router.get("", response_model=List[dict])
 async def get_alerts(
+    request: Request,
+    response: Response,
     patient_id: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     severity: Optional[str] = Query(None),
-    limit: int = Query(50, le=200)
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值")
 ):
-    """获取告警列表"""
+    """获取告警列表（按创建时间倒序，还有下一页时响应头 X-Next-Cursor 返回游标）"""
     try:
-        results = await alert_service.get_alerts(
+        results, next_cursor = await alert_service.get_alerts_page(
             patient_id=patient_id,
             status=status,
             severity=severity,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
-        return results
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        # 列表页使用缩略图（私有Bucket时批量签名）
+        return with_image_urls([dict(alert) for alert in results], str(request.base_url))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/pipeline-stats", response_model=dict)
+async def get_alert_pipeline_stats():
+    """获取告警处理统计（规则命中、时间确认窗口、重复告警抑制、未确认升级、在床状态计时、定时器、接收人缓存）"""
+    from app.services.alert_confirmation import alert_confirmer
+    from app.services.alert_escalation import alert_escalation
+    from app.services.alert_rules import alert_rule_engine
+    from app.services.alert_suppression import alert_suppressor
+    from app.services.bed_occupancy import bed_occupancy_tracker
+    from app.services.recipient_directory import recipient_directory
+    from app.services.timer_wheel import timer_wheel
+    
+    return {
+        "rules": alert_rule_engine.get_stats(),
+        "confirmation": alert_confirmer.get_stats(),
+        "suppression": alert_suppressor.get_stats(),
+        "escalation": alert_escalation.get_stats(),
+        "bed_occupancy": bed_occupancy_tracker.get_stats(),
+        "timers": timer_wheel.get_stats(),
+        "recipients": recipient_directory.get_stats()
+    }
+
+
+@router.get("/pending-counts", response_model=dict)
+async def get_pending_alert_counts(patient_id: Optional[str] = Query(None)):
+    """护士站看板：各患者未处理告警数（按严重程度），一次请求取全部患者"""
+    try:
+        return await alert_service.get_pending_counts(patient_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{alert_id}", response_model=dict)
-async def get_alert(alert_id: str):
+async def get_alert(alert_id: str, request: Request):
     """获取单个告警详情"""
     from app.core.database import execute_query
     import logging
@@ -56,6 +100,7 @@ async def get_alert(alert_id: str):
         # 优先使用alerts表的image_url，如果没有则使用analysis_results的
         if not alert.get('image_url'):
             alert['image_url'] = alert.get('analysis_image_url') or alert.get('snapshot_url')
+        with_image_urls([alert], str(request.base_url))
         
         logger.info(f"📥 [API] 获取告警详情: {alert_id}")
         logger.info(f"📥 [API] 告警类型: {alert.get('alert_type')}")
@@ -104,52 +149,27 @@ async def resolve_alert(alert_id: str, request: AlertResolve):
 
 
 @router.get("/family/{patient_id}", response_model=List[dict])
-async def get_family_alerts(patient_id: str):
-    """家属端获取告警列表（分级显示）"""
-    from app.core.database import execute_query
-    
+async def get_family_alerts(
+    patient_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值")
+):
+    """家属端获取告警列表（分级显示：严重程度高的在前，同级按时间倒序；还有下一页时响应头 X-Next-Cursor 返回游标）"""
     try:
-        # 获取所有告警，按优先级和创建时间排序
-        alerts = await execute_query(
-            """SELECT a.*, ar.snapshot_url as image_url
-               FROM alerts a
-               LEFT JOIN ai_analysis_results ar ON a.analysis_result_id = ar.result_id
-               WHERE a.patient_id = ?
-               ORDER BY 
-                 CASE a.severity 
-                   WHEN 'critical' THEN 1
-                   WHEN 'high' THEN 2
-                   WHEN 'medium' THEN 3
-                   WHEN 'low' THEN 4
-                 END,
-                 a.created_at DESC
-               LIMIT 100""",
-            (patient_id,)
-        )
-        
-        # 分类告警
-        critical_alerts = []
-        high_alerts = []
-        medium_alerts = []
-        low_alerts = []
+        alerts, next_cursor = await alert_service.get_family_alerts_page(patient_id, limit=limit, cursor=cursor)
         
         for alert in alerts:
-            alert_dict = dict(alert)
-            severity = alert_dict.get('severity', 'medium')
-            
-            if severity == 'critical':
-                critical_alerts.append(alert_dict)
-            elif severity == 'high':
-                high_alerts.append(alert_dict)
-            elif severity == 'medium':
-                medium_alerts.append(alert_dict)
-            else:
-                low_alerts.append(alert_dict)
-        
-        # 合并返回，高优先级在前
-        result = critical_alerts + high_alerts + medium_alerts + low_alerts
+            # 优先使用alerts表的image_url，如果没有则使用analysis_results的
+            if not alert.get('image_url'):
+                alert['image_url'] = alert.get('analysis_image_url')
         
-        return result
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return with_image_urls(alerts, str(request.base_url))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取告警列表失败: {str(e)}")
 
@@ -268,6 +288,7 @@ async def trigger_sos(
     """SOS紧急报警"""
     from app.core.database import execute_query, execute_insert
     from app.services.websocket_manager import websocket_manager
+    from app.services.recipient_directory import recipient_directory
     from datetime import datetime
     import uuid
     
@@ -302,11 +323,8 @@ async def trigger_sos(
         )
         
         # 推送到护士站和家属端
-        # 1. 查找护士用户
-        nurses = await execute_query(
-            "SELECT user_id FROM users WHERE role = 'nurse' AND is_active = 1 LIMIT 10",
-            ()
-        )
+        # 1. 查找护士用户（接收人目录）
+        nurses = (await recipient_directory.get_nurses())[:10]
         for nurse in nurses:
             await websocket_manager.send_to_user(
                 nurse['user_id'],
@@ -325,15 +343,8 @@ async def trigger_sos(
                 }
             )
         
-        # 2. 查找家属用户（通过patient_guardians表）
-        guardians = await execute_query(
-            """SELECT u.user_id 
-               FROM patient_guardians pg
-               JOIN users u ON pg.guardian_user_id = u.user_id
-               WHERE pg.patient_id = ? AND u.is_active = 1
-               LIMIT 3""",
-            (patient_id,)
-        )
+        # 2. 查找家属用户（接收人目录，按优先级取前3位）
+        guardians = (await recipient_directory.get_patient(patient_id)).guardians[:3]
         for guardian in guardians:
             await websocket_manager.send_to_user(
                 guardian['user_id'],
@@ -1,12 +1,13 @@
 """
 AI分析API路由
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Form, Request
 from typing import Optional, List
 from datetime import datetime
 import json
 from app.models.schemas import AnalysisResponse
 from app.services.ai_analysis_service import ai_analysis_service
+from app.services.presigned_url_cache import with_image_urls
 
 router = APIRouter(prefix="/api/analysis", tags=["analysis"])
 
@@ -131,6 +132,61 @@ async def analyze_batch(
         raise HTTPException(status_code=500, detail=f"批量分析失败: {str(e)}")
 
 
+@router.get("/model-stats", response_model=dict)
+async def get_model_stats():
+    """获取视觉模型调用统计（各模型滚动延迟/错误率/token用量、路由命中、对冲请求、帧缓存队列、检测调度、区域裁剪、图片上传统计）"""
+    from app.services.gemini_service import gemini_analyzer
+    from app.services.model_stats import model_stats
+    from app.services.frame_spool import frame_spool
+    from app.services.detection_scheduler import detection_scheduler
+    from app.services.roi_service import roi_service
+    from app.services.image_store import get_upload_stats
+    
+    return {
+        "models": model_stats.snapshot(),
+        "routing": gemini_analyzer.get_route_stats(),
+        "hedging": gemini_analyzer.get_hedge_stats(),
+        "spool": await frame_spool.get_stats(),
+        "scheduler": detection_scheduler.get_stats(),
+        "roi": roi_service.get_stats(),
+        "uploads": get_upload_stats()
+    }
+
+
+@router.get("/usage", response_model=dict)
+async def get_model_usage(
+    group_by: str = Query("patient", description="汇总维度: patient/ward/model/hour"),
+    days: int = Query(1, ge=1, le=90, description="统计最近几天")
+):
+    """获取模型token用量与费用汇总（容量规划），以及当日预算使用情况"""
+    from app.services.usage_service import usage_service
+
+    try:
+        items = await usage_service.get_usage_summary(group_by=group_by, days=days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询用量失败: {str(e)}")
+
+    return {
+        "group_by": group_by,
+        "days": days,
+        "items": items,
+        "budget": await usage_service.get_budget_status()
+    }
+
+
+@router.get("/iv-drip/{patient_id}", response_model=dict)
+async def get_iv_drip_prediction(patient_id: str):
+    """获取患者当前吊瓶的余量预测（滴速、预计输完时间、下次检测时间）"""
+    from app.services.iv_drip_predictor import iv_drip_predictor
+    
+    return {
+        "patient_id": patient_id,
+        "prediction": iv_drip_predictor.get_state(patient_id)
+    }
+
+
 @router.get("/history/{patient_id}", response_model=list)
 async def get_analysis_history(
     patient_id: str,
@@ -219,6 +275,7 @@ async def upload_video(
 @router.get("/timeline/{patient_id}", response_model=list)
 async def get_timeline(
     patient_id: str,
+    request: Request,
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     limit: int = Query(100, le=1000)
@@ -247,12 +304,13 @@ async def get_timeline(
                     "detection_type": result['detection_type'],
                     "analysis_data": analysis_data,
                     "snapshot_url": result.get('snapshot_url'),
+                    "image_url": result.get('image_url'),
                     "is_alert_triggered": result.get('is_alert_triggered', 0) == 1,
                 })
             except:
                 continue
         
-        return timeline
+        return with_image_urls(timeline, str(request.base_url))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
     except Exception as e:
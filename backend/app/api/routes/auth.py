@@ -9,6 +9,7 @@ import re
 from datetime import datetime, timedelta
 from app.models.schemas import LoginRequest, LoginResponse, RegisterRequest, RegisterResponse
 from app.core.database import execute_query, execute_insert, execute_update
+from app.services.recipient_directory import recipient_directory
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -72,6 +73,8 @@ async def register(request: RegisterRequest):
                 1  # is_active
             )
         )
+        # 新注册的护士需要加入告警接收人
+        recipient_directory.invalidate()
         
         return RegisterResponse(
             user_id=user_id,
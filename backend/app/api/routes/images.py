@@ -2,11 +2,15 @@
 图片代理接口
 用于解决前端访问腾讯云COS图片的CORS跨域问题
 """
-from fastapi import APIRouter, Query, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Query, HTTPException, Request
+from fastapi.responses import StreamingResponse, FileResponse, Response
 import httpx
 import logging
+from urllib.parse import urlparse
 from typing import Optional
+from app.services.image_proxy_cache import image_proxy_cache
+from app.services.presigned_url_cache import presigned_url_cache
+from app.services.image_store import is_content_addressed, local_store_key, LOCAL_STORE_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -14,14 +18,26 @@ router = APIRouter(prefix="/api/images", tags=["images"])
 
 
 @router.get("/proxy")
-async def proxy_image(url: str = Query(..., description="图片URL")):
+async def proxy_image(
+    request: Request,
+    url: str = Query(..., description="图片URL"),
+    w: Optional[int] = Query(None, ge=16, le=2048, description="缩放宽度（像素，不放大）"),
+    q: Optional[int] = Query(None, ge=30, le=95, description="编码质量"),
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(jpeg|webp|auto)$", description="输出格式: jpeg/webp/auto")
+):
     """
     图片代理接口
     
-    通过后端代理访问外部图片，解决CORS跨域问题
+    通过后端代理访问外部图片，解决CORS跨域问题；
+    命中缓存时直接返回，客户端携带匹配的 If-None-Match 时返回304。
+    带 w/q/format 参数时返回缩放后的图片（按参数缓存），移动端列表无需下载原图；
+    本地图片存储（/api/images/store/...）的图片同样支持缩放
     
     Args:
         url: 要代理的图片URL（需要URL编码）
+        w: 缩放宽度
+        q: 编码质量（默认75）
+        format: 输出格式，auto 时按 Accept 头选择 webp
     
     Returns:
         图片流响应
@@ -29,6 +45,13 @@ async def proxy_image(url: str = Query(..., description="图片URL")):
     if not url:
         raise HTTPException(status_code=400, detail="URL参数不能为空")
     
+    # 本地图片存储的图片直接从磁盘读取（不回源，不受域名限制）；相对/绝对URL共用缓存
+    store_key = local_store_key(url)
+    if store_key:
+        if w is None and q is None and fmt is None:
+            return await get_stored_image(store_key)
+        return await _proxy_transformed(request, f"{LOCAL_STORE_PATH}{store_key}", w, q or 75, fmt or "auto")
+    
     # 验证URL是否为腾讯云COS地址（安全限制）
     allowed_domains = [
         "cos.na-siliconvalley.myqcloud.com",
@@ -39,36 +62,37 @@ async def proxy_image(url: str = Query(..., description="图片URL")):
         "portraitquest-1253756459.cos.na-siliconvalley.myqcloud.com",
     ]
     
-    url_lower = url.lower()
-    if not any(domain in url_lower for domain in allowed_domains):
+    # 按主机名匹配（子串匹配会放行把COS域名放在路径或查询参数中的任意地址）
+    host = (urlparse(url).hostname or "").lower()
+    if not any(host == domain or host.endswith("." + domain) for domain in allowed_domains):
         logger.warning(f"⚠️ 拒绝代理非授权域名: {url}")
         raise HTTPException(
             status_code=403,
             detail="只能代理腾讯云COS图片"
         )
     
+    # 本Bucket的签名URL去掉签名参数后作为缓存键（回源时重新签名）
+    url = presigned_url_cache.canonical(url)
+    
+    if w is not None or q is not None or fmt is not None:
+        return await _proxy_transformed(request, url, w, q or 75, fmt or "auto")
+    
+    # 先查缓存（过期的缓存会向源站条件请求重新验证）
+    entry, cache_status = await image_proxy_cache.get_cached(url)
+    if entry is not None:
+        headers = _proxy_headers(url, entry.etag, entry.headers.get("last-modified"), cache_status)
+        if _client_has_fresh_copy(request, entry.etag):
+            image_proxy_cache.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=entry.body,
+            media_type=entry.headers.get("content-type", "image/jpeg"),
+            headers=headers
+        )
+    
     try:
-        logger.info(f"🖼️ 代理图片: {url}")
-        
-        # 使用httpx异步请求图片
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, follow_redirects=True)
-            response.raise_for_status()
-            
-            # 获取Content-Type
-            content_type = response.headers.get("Content-Type", "image/jpeg")
-            
-            # 返回图片流
-            return StreamingResponse(
-                iter([response.content]),
-                media_type=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=3600",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET",
-                }
-            )
-            
+        logger.info(f"🖼️ 代理图片（未命中缓存）: {url}")
+        upstream = await image_proxy_cache.open_upstream(url)
     except httpx.TimeoutException:
         logger.error(f"❌ 图片代理超时: {url}")
         raise HTTPException(status_code=504, detail="图片加载超时")
@@ -81,4 +105,109 @@ async def proxy_image(url: str = Query(..., description="图片URL")):
     except Exception as e:
         logger.error(f"❌ 图片代理异常: {str(e)} - {url}")
         raise HTTPException(status_code=500, detail=f"图片代理失败: {str(e)}")
+    
+    etag = upstream.headers.get("etag")
+    if etag and _client_has_fresh_copy(request, etag):
+        await upstream.aclose()
+        image_proxy_cache.stats["not_modified"] += 1
+        return Response(status_code=304, headers=_proxy_headers(url, etag, upstream.headers.get("last-modified"), "MISS"))
+    
+    # 分块流式转发，同时写入缓存
+    headers = _proxy_headers(url, etag, upstream.headers.get("last-modified"), "MISS")
+    if "content-length" in upstream.headers:
+        headers["Content-Length"] = upstream.headers["content-length"]
+    return StreamingResponse(
+        image_proxy_cache.stream_and_cache(url, upstream),
+        media_type=upstream.headers.get("Content-Type", "image/jpeg"),
+        headers=headers
+    )
+
+
+async def _proxy_transformed(request: Request, url: str, width: Optional[int], quality: int, fmt: str) -> Response:
+    """返回缩放后的图片"""
+    vary_accept = fmt == "auto"
+    if vary_accept:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    
+    try:
+        entry, cache_status = await image_proxy_cache.get_transformed(url, width, quality, fmt)
+    except httpx.TimeoutException:
+        logger.error(f"❌ 图片代理超时: {url}")
+        raise HTTPException(status_code=504, detail="图片加载超时")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"❌ 图片代理HTTP错误: {e.response.status_code} - {url}")
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"图片加载失败: {e.response.status_code}"
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="图片不存在")
+    except Exception as e:
+        logger.error(f"❌ 图片缩放失败: {str(e)} - {url}")
+        raise HTTPException(status_code=500, detail=f"图片代理失败: {str(e)}")
+    
+    headers = _proxy_headers(url, entry.etag, None, cache_status)
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    if _client_has_fresh_copy(request, entry.etag):
+        image_proxy_cache.stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.headers["content-type"], headers=headers)
+
+
+def _client_has_fresh_copy(request: Request, etag: str) -> bool:
+    """客户端条件请求（If-None-Match）与当前ETag一致"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # 弱比较：忽略 W/ 前缀
+    candidates = {tag.strip().replace("W/", "") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag.replace("W/", "") in candidates
+
+
+def _proxy_headers(url: str, etag: Optional[str], last_modified: Optional[str], cache_status: str) -> dict:
+    headers = {
+        # 内容寻址的图片永久不变
+        "Cache-Control": "public, max-age=31536000, immutable" if is_content_addressed(url) else "public, max-age=3600",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET",
+        "X-Cache": cache_status,
+    }
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
 
+
+@router.get("/cache-stats")
+async def get_proxy_cache_stats():
+    """获取图片代理缓存和预签名URL缓存统计"""
+    return {**image_proxy_cache.get_stats(), "presigned": presigned_url_cache.get_stats()}
+
+
+@router.get("/store/{key:path}")
+async def get_stored_image(key: str):
+    """
+    读取本地图片存储中的图片或缩略图（image_store_backend 为 local 时图片URL指向此接口）
+    
+    图片按内容哈希命名、内容不会变化，可长期缓存
+    """
+    from app.services.image_store import get_image_store, LocalImageStore
+    
+    image_store = get_image_store()
+    if not isinstance(image_store, LocalImageStore):
+        raise HTTPException(status_code=404, detail="未启用本地图片存储")
+    
+    path = image_store.resolve(key)
+    if not path:
+        raise HTTPException(status_code=404, detail="图片不存在")
+    
+    return FileResponse(
+        path,
+        media_type="image/webp" if path.suffix == ".webp" else "image/jpeg",
+        headers={
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "Access-Control-Allow-Origin": "*",
+        }
+    )
@@ -5,6 +5,10 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import Optional, List
 from app.models.schemas import PatientCreate, PatientResponse, MonitoringConfigUpdate
 from app.core.database import execute_query, execute_insert, execute_update
+from app.services.alert_service import alert_service
+from app.services.monitoring_schedule import compile_schedule, monitoring_schedule_service
+from app.services.recipient_directory import recipient_directory
+import json
 import uuid
 
 router = APIRouter(prefix="/api/patients", tags=["patients"])
@@ -130,6 +134,21 @@ async def update_monitoring_config(
             update_fields.append("bed_exit_threshold_minutes = ?")
             params.append(config.bed_exit_threshold_minutes)
         
+        if config.prolonged_bed_threshold_hours is not None:
+            update_fields.append("prolonged_bed_threshold_hours = ?")
+            params.append(config.prolonged_bed_threshold_hours)
+        
+        schedule_json = None
+        if config.monitoring_schedule is not None:
+            # 保存前先编译校验，空对象/空列表表示清除时间表（全天监测）
+            try:
+                compile_schedule(config.monitoring_schedule)
+            except (ValueError, TypeError) as e:
+                raise HTTPException(status_code=400, detail=f"监测时间表格式错误: {str(e)}")
+            schedule_json = json.dumps(config.monitoring_schedule, ensure_ascii=False) if config.monitoring_schedule else None
+            update_fields.append("monitoring_schedule = ?")
+            params.append(schedule_json)
+        
         if not update_fields:
             return {"status": "success", "message": "无需更新"}
         
@@ -146,8 +165,8 @@ async def update_monitoring_config(
                 """INSERT INTO monitoring_configs 
                    (config_id, patient_id, fall_detection_enabled, bed_exit_detection_enabled,
                     facial_analysis_enabled, abnormal_activity_enabled, iv_drip_monitoring_enabled,
-                    bed_exit_threshold_minutes)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    bed_exit_threshold_minutes, prolonged_bed_threshold_hours, monitoring_schedule)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
                 (
                     config_id,
                     patient_id,
@@ -156,10 +175,13 @@ async def update_monitoring_config(
                     1 if config.facial_analysis_enabled else 0,
                     1 if config.abnormal_activity_enabled else 0,
                     1 if config.iv_drip_monitoring_enabled else 0,
-                    config.bed_exit_threshold_minutes or 10
+                    config.bed_exit_threshold_minutes or 10,
+                    config.prolonged_bed_threshold_hours or 12,
+                    schedule_json
                 )
             )
         
+        monitoring_schedule_service.invalidate(patient_id)
         return {"status": "success"}
     except HTTPException:
         raise
@@ -191,19 +213,17 @@ async def get_live_status(patient_id: str):
             (patient_id, one_hour_ago)
         )
         
-        # 获取所有未处理的告警数量（用于显示历史告警列表）
-        all_pending_count = await execute_query(
-            """SELECT COUNT(*) as count FROM alerts 
-               WHERE patient_id = ? AND status = 'pending'""",
-            (patient_id,)
-        )
-        pending_count = all_pending_count[0]["count"] if all_pending_count else 0
+        # 获取所有未处理的告警数量（用于显示历史告警列表，读取触发器维护的计数）
+        pending_counts = (await alert_service.get_pending_counts(patient_id)).get(patient_id, {})
         
         return {
             "patient_id": patient_id,
             "latest_analysis": results[0] if results else None,
             "latest_alert": latest_alerts[0] if latest_alerts else None,  # 只返回最新的一条告警
-            "pending_alerts_count": pending_count,  # 未处理告警总数
+            "pending_alerts_count": pending_counts.get("total", 0),  # 未处理告警总数
+            "pending_alerts_by_severity": {  # 按严重程度的未处理告警数
+                severity: pending_counts.get(severity, 0) for severity in ("critical", "high", "medium", "low")
+            },
             "status": "monitoring" if results else "no_data"
         }
     except Exception as e:
@@ -215,21 +235,10 @@ async def get_patient_contacts(patient_id: str):
     """获取患者联系人（护士站和家属）"""
     try:
         # 获取护士站信息（可以从配置或数据库获取）
-        nurses = await execute_query(
-            "SELECT user_id, full_name, phone FROM users WHERE role = 'nurse' AND is_active = 1 LIMIT 1",
-            ()
-        )
+        nurses = (await recipient_directory.get_nurses())[:1]
         
-        # 获取家属联系人
-        guardians = await execute_query(
-            """SELECT u.user_id, u.full_name, u.phone, pg.relationship
-               FROM patient_guardians pg
-               JOIN users u ON pg.guardian_user_id = u.user_id
-               WHERE pg.patient_id = ? AND u.is_active = 1
-               ORDER BY pg.priority ASC
-               LIMIT 3""",
-            (patient_id,)
-        )
+        # 获取家属联系人（按优先级取前3位）
+        guardians = (await recipient_directory.get_patient(patient_id)).guardians[:3]
         
         contacts = {
             "nurse_station": {
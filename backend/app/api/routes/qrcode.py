@@ -10,6 +10,7 @@ import base64
 from datetime import datetime, timedelta
 from app.models.schemas import QRCodeGenerateResponse, QRCodeScanRequest
 from app.core.database import execute_query, execute_insert, execute_update
+from app.services.recipient_directory import recipient_directory
 
 router = APIRouter(prefix="/api/qrcode", tags=["qrcode"])
 
@@ -128,6 +129,7 @@ async def scan_qrcode(request: QRCodeScanRequest):
                VALUES (?, ?, ?, ?, ?)""",
             (guardian_id, patient_id, request.user_id, "家属", 1)
         )
+        recipient_directory.invalidate(patient_id)
         
         # 标记token为已使用
         await execute_update(
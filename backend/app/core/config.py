@@ -48,7 +48,129 @@ class Settings(BaseSettings):
     TENCENT_COS_REGION: str = "ap-beijing"
     TENCENT_COS_BUCKET: Optional[str] = None
     TENCENT_COS_IMAGE_PREFIX: str = "smartguard/alerts/"
+    cos_upload_workers: int = 4  # 图片上传专用线程数（COS/本地存储共用）
+    cos_upload_max_pending: int = 64  # 等待上传的图片上限（超出时放弃上传，防止内存堆积）
+    cos_known_objects_cache_size: int = 10000  # 已上传对象（内容哈希）缓存条数，命中时不再查询存储
+    cos_private_bucket: bool = False  # 私有读Bucket：接口返回预签名URL，图片代理回源时签名
+    cos_presign_expires_seconds: int = 3600
+    cos_presign_min_remaining_seconds: float = 600.0  # 返回的签名URL至少剩余的有效期，不足两倍时后台刷新
+    cos_presign_cache_size: int = 20000
     
+    # 图片存储后端: auto（配置了COS时用COS，否则本地）/cos/local/none
+    image_store_backend: str = "auto"
+    local_image_store_dir: Optional[str] = None  # 本地图片目录（默认 data/images）
+    local_image_store_max_bytes: int = 5 * 1024 * 1024 * 1024  # 本地图片总大小上限，超出时淘汰最旧的图片
+    local_image_store_base_url: str = ""  # 本地图片URL前缀（为空时返回相对路径 /api/images/store/...）
+    image_variants: dict = {"small": 320, "medium": 960}  # 上传时生成的缩略图规格（长边像素），为空不生成
+    image_variant_format: str = "webp"  # 缩略图格式: webp/jpeg
+    image_variant_quality: int = 75
+    
+    # 图片代理缓存（内存+磁盘两级LRU，按URL缓存；内容寻址的图片不需要重新验证）
+    image_proxy_cache_ttl_seconds: float = 300.0  # 超过该时长后向源站条件请求重新验证
+    image_proxy_memory_cache_bytes: int = 32 * 1024 * 1024
+    image_proxy_disk_cache_bytes: int = 512 * 1024 * 1024
+    image_proxy_max_object_bytes: int = 10 * 1024 * 1024  # 超过该大小的响应只转发不缓存
+    image_transform_workers: int = 2  # 图片缩放进程数
+    image_transform_concurrency: int = 2  # 同时进行的缩放数上限，超出的请求排队等待
+    
+    # 视觉分析对冲请求（高危患者降低尾延迟）
+    vision_hedge_enabled: bool = False
+    vision_hedge_risk_levels: list = ["critical"]  # 触发对冲的风险等级
+    vision_hedge_model: Optional[str] = None  # 对冲请求使用的模型（默认使用 one_api_gemini_model）
+    vision_hedge_percentile: float = 0.9  # 主请求超过该延迟分位数仍未返回则发出对冲请求
+    vision_hedge_min_samples: int = 20  # 计算分位数所需的最少样本数
+    vision_hedge_default_delay_seconds: float = 8.0  # 样本不足时的对冲等待时间
+    vision_hedge_min_delay_seconds: float = 1.0
+    vision_hedge_max_per_minute: int = 6  # 对冲成本上限：每分钟最多对冲次数
+    vision_hedge_max_ratio: float = 0.2  # 对冲成本上限：对冲次数占符合条件调用的最大比例
+
+    # 视觉模型路由（按检测模式/场景/风险等级选择模型，JSON列表，为空时使用内置路由表）
+    # 示例: [{"name": "iv_only", "modes_subset": ["iv_drip"], "model": "gemini-2.0-flash"}]
+    vision_model_routes: list = []
+    vision_light_model: Optional[str] = None  # 仅吊瓶等轻量检测使用的模型（默认 one_api_gemini_model）
+    vision_route_p95_budget_seconds: float = 30.0  # 主模型p95超过该值时自动降级到快速模型
+    vision_route_min_samples: int = 10
+    
+    # 模型用量与预算（token预算为0表示不限制）
+    # 每千token价格，示例: {"gemini-2.0-flash": {"prompt": 0.0007, "completion": 0.0028}}
+    vision_token_prices: dict = {}
+    patient_daily_token_budget: int = 0  # 每位患者每日token预算
+    ward_daily_token_budget: int = 0  # 每个病区每日token预算
+    over_budget_min_interval_seconds: float = 300.0  # 超出预算后该患者两次分析的最小间隔（紧急告警期间不限制）
+    
+    # 各检测模式的检测间隔（秒），0表示每帧检测；未到期的模式不写入本帧提示词
+    detection_mode_intervals: dict = {
+        "fall": 0,
+        "bed_exit": 0,
+        "activity": 0,
+        "facial": 120,
+        "iv_drip": 300,
+    }
+    
+    # 吊瓶余量预测（根据余量变化安排下次吊瓶检测，并提前通知护士）
+    iv_drip_alert_percent: float = 15.0  # 视为需要换液的余量百分比
+    iv_drip_check_fraction: float = 0.5  # 下次检测间隔 = 预计剩余时间 × 该比例
+    iv_drip_min_check_seconds: float = 30.0
+    iv_drip_max_check_seconds: float = 1200.0
+    iv_drip_min_fit_span_seconds: float = 120.0  # 观测跨度不足时不做预测
+    iv_drip_preemptive_notice_seconds: float = 600.0  # 预计剩余时间低于该值时提前通知护士
+    
+    # 帧缓存队列（模型全部故障时缓存失败的帧，恢复后回放）
+    frame_spool_enabled: bool = True
+    frame_spool_max_bytes: int = 200 * 1024 * 1024  # 缓存文件中帧数据总大小上限
+    frame_spool_max_age_seconds: float = 900.0  # 超过该时长的帧不再回放
+    frame_spool_replay_concurrency: int = 2  # 回放并发数
+    frame_spool_probe_min_seconds: float = 5.0  # 模型故障探测的退避区间
+    frame_spool_probe_max_seconds: float = 120.0
+    
+    # 感兴趣区域裁剪（完整画面记住吊瓶/监护仪位置，之后只发送裁剪后的小图）
+    roi_crop_enabled: bool = True
+    roi_scene_change_bits: int = 10  # 平均哈希（64位）差异超过该值视为画面明显变化，重新完整分析
+    roi_max_age_seconds: float = 1800.0  # 区域有效期，过期后重新完整分析
+    roi_padding: float = 0.15  # 裁剪时向四周扩展的比例（相对区域宽高）
+    roi_max_area_ratio: float = 0.5  # 区域面积超过画面该比例时裁剪意义不大，不使用
+    roi_jpeg_quality: int = 85
+    
+    # 告警去重（同一患者同类告警在窗口内重复出现时只累加原告警的出现次数，严重程度升高时升级）
+    alert_suppression_window_seconds: float = 300.0  # 距最后一次出现超过该时长视为新事件，0表示不抑制
+    alert_suppression_windows: dict = {}  # 按告警类型覆盖窗口，示例: {"heart_rate_flat": 60}
+    
+    # 告警确认窗口（最近 k 次检测了该项目的分析中至少 m 次出现、且在 seconds 秒内才触发；未列出的类型立即触发）
+    alert_confirmation_policies: dict = {
+        "facial_pain": {"m": 3, "k": 5, "seconds": 900},
+        "facial_cyanotic": {"m": 2, "k": 3, "seconds": 600},
+        "abnormal_activity": {"m": 2, "k": 3, "seconds": 120},
+        "iv_drip_empty": {"m": 2, "k": 3, "seconds": 1800},
+    }
+    alert_confirmation_ring_size: int = 8  # 每位患者每个检测项目保留的最近判断结果数（需不小于各策略的k）
+    alert_confirmation_bypass_severities: list = ["critical"]  # 这些严重程度的告警不需要确认
+    alert_rules_file: Optional[str] = None  # 告警规则文件（默认 app/services/alert_rules.json），修改后自动重新加载
+    alert_rules_reload_interval_seconds: float = 5.0  # 检查规则文件是否修改的间隔
+    
+    # 在床状态计时（离床/卧床时长阈值见监测配置 bed_exit_threshold_minutes、prolonged_bed_threshold_hours）
+    timer_wheel_tick_seconds: float = 1.0  # 时间轮刻度（定时精度）
+    timer_wheel_slots: int = 3600
+    bed_occupancy_confirm_frames: int = 2  # 在床/离床状态变化需要连续确认的帧数
+    bed_occupancy_stale_seconds: float = 900.0  # 超过该时长没有离床检测结果时不触发超时告警
+    
+    # 告警通知推送
+    notification_send_timeout_seconds: float = 5.0  # 单个接收人的WebSocket推送超时，超时不影响其他接收人
+    recipient_directory_ttl_seconds: float = 600.0  # 接收人缓存有效期（兜底脚本等进程外修改用户/家属关联）
+    
+    # 未确认告警升级：after_seconds 从告警创建时算起；notify 可选 nurses/doctors/admins/guardians/next_guardian
+    alert_escalation_steps: dict = {
+        "critical": [
+            {"after_seconds": 60, "notify": ["nurses"]},
+            {"after_seconds": 180, "notify": ["nurses", "doctors", "next_guardian"]},
+            {"after_seconds": 600, "notify": ["doctors", "admins", "next_guardian"]},
+        ],
+        "high": [
+            {"after_seconds": 300, "notify": ["nurses"]},
+            {"after_seconds": 900, "notify": ["nurses", "doctors"]},
+        ],
+    }
+    alert_escalation_max_age_seconds: float = 86400.0  # 重启时不再恢复超过该时长的未确认告警
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -56,6 +56,19 @@ async def execute_update(query: str, params: tuple = ()) -> int:
         await conn.close()
 
 
+async def execute_many(query: str, params_list: list) -> int:
+    """批量执行同一语句（一个事务内提交），返回影响的行数"""
+    if not params_list:
+        return 0
+    conn = await get_db_connection()
+    try:
+        cursor = await conn.executemany(query, params_list)
+        await conn.commit()
+        return cursor.rowcount
+    finally:
+        await conn.close()
+
+
 async def execute_script(script: str):
     """执行SQL脚本（用于初始化）"""
     conn = await get_db_connection()
@@ -30,6 +30,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 告警列表分页游标
 )
 
 # 注册路由
@@ -45,6 +46,32 @@ app.include_router(call.router)
 app.include_router(images.router)
 
 
+@app.on_event("startup")
+async def startup_event():
+    """启动后台任务"""
+    from app.services.frame_spool import frame_spool
+    from app.services.alert_suppression import alert_suppressor
+    from app.services.alert_escalation import alert_escalation
+    from app.services.timer_wheel import timer_wheel
+    await frame_spool.start()
+    await alert_suppressor.restore()
+    await alert_escalation.restore()
+    await timer_wheel.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止后台任务"""
+    from app.services.frame_spool import frame_spool
+    from app.services.ai_analysis_service import ai_analysis_service
+    from app.services.image_proxy_cache import image_proxy_cache
+    from app.services.timer_wheel import timer_wheel
+    await timer_wheel.stop()
+    await frame_spool.stop()
+    await ai_analysis_service.drain_uploads()
+    await image_proxy_cache.close()
+
+
 @app.get("/")
 async def root():
     """根路径"""
@@ -3,7 +3,7 @@ Pydantic数据模型
 用于API请求和响应验证
 """
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
 
 
@@ -40,6 +40,8 @@ class MonitoringConfigUpdate(BaseModel):
     abnormal_activity_enabled: Optional[bool] = None
     iv_drip_monitoring_enabled: Optional[bool] = None
     bed_exit_threshold_minutes: Optional[int] = None
+    prolonged_bed_threshold_hours: Optional[int] = None
+    monitoring_schedule: Optional[Union[dict, list]] = None  # 监测时间表（格式见 monitoring_schedule 服务）
 
 
 class AlertAcknowledge(BaseModel):
@@ -67,6 +69,9 @@ class AnalysisResponse(BaseModel):
     result_id: Optional[str] = None
     analysis: Optional[dict] = None
     error: Optional[str] = None
+    timings: Optional[dict] = None  # 各处理阶段耗时（秒）
+    spooled: Optional[bool] = None  # 模型不可用时帧是否已写入缓存队列等待回放
+    image_upload_pending: Optional[bool] = None  # 图片是否仍在后台上传（完成后回填 image_url）
 
 
 # 移动端相关模型
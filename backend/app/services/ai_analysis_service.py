@@ -3,12 +3,21 @@ AI分析服务
 调用Gemini服务，保存分析结果，触发告警
 """
 import json
+import asyncio
 import logging
 import uuid
 from datetime import datetime
-from typing import Dict, Optional
-from app.core.database import execute_insert, execute_query
+from typing import Dict, Optional, Set
+from app.core.config import settings
+from app.core.database import execute_insert, execute_query, execute_update
 from app.services.gemini_service import gemini_analyzer
+from app.services.usage_service import usage_service
+from app.services.detection_scheduler import detection_scheduler
+from app.services.alert_confirmation import alert_confirmer
+from app.services.monitoring_schedule import monitoring_schedule_service
+from app.services.iv_drip_predictor import iv_drip_predictor
+from app.services.roi_service import roi_service
+from app.services.bed_occupancy import bed_occupancy_tracker
 # 延迟导入避免循环依赖
 def get_alert_service():
     from app.services.alert_service import alert_service
@@ -20,12 +29,22 @@ logger = logging.getLogger(__name__)
 class AIAnalysisService:
     """AI分析服务"""
     
+    def __init__(self):
+        # patient_id -> 上一次分析的整体状态（用于高危患者对冲请求判断）
+        self._last_overall_status: Dict[str, str] = {}
+        # patient_id -> 上一次识别的场景类型（用于模型路由）
+        self._last_scene_type: Dict[str, str] = {}
+        # 进行中的后台图片上传任务
+        self._upload_tasks: Set[asyncio.Task] = set()
+    
     async def analyze_patient_image(
         self,
         image_bytes: bytes,
         patient_id: str,
         camera_id: Optional[str] = None,
-        timestamp_ms: Optional[int] = None
+        timestamp_ms: Optional[int] = None,
+        captured_at: Optional[datetime] = None,
+        spool_on_failure: bool = True
     ) -> Dict:
         """
         分析患者图像
@@ -34,19 +53,24 @@ class AIAnalysisService:
             image_bytes: 图片字节流
             patient_id: 患者ID
             camera_id: 摄像头ID（可选）
+            captured_at: 画面采集时间（回放缓存帧时传入，默认当前时间）
+            spool_on_failure: 模型调用失败时是否写入帧缓存队列（回放时为False）
         
         Returns:
             分析结果字典
         """
         import traceback
         start_time = datetime.now()
+        # 各阶段耗时（秒），随结果返回，供压测工具统计
+        timings = {}
         
         try:
             logger.info(f"📊 [AI分析] 开始分析患者图像 - patient_id: {patient_id}, timestamp_ms: {timestamp_ms}")
             logger.info(f"📊 [AI分析] 图片大小: {len(image_bytes)} bytes")
             
             # 1. 获取患者信息和监测配置
-            logger.info(f"📊 [AI分析] 步骤1/7: 获取患者信息...")
+            logger.info(f"📊 [AI分析] 步骤1/8: 获取患者信息...")
+            stage_start = datetime.now()
             patient_info = await self._get_patient_info(patient_id)
             if not patient_info:
                 logger.error(f"❌ [AI分析] 患者不存在: {patient_id}")
@@ -54,92 +78,179 @@ class AIAnalysisService:
             
             logger.info(f"📊 [AI分析] 患者信息: {patient_info.get('full_name')} ({patient_info.get('risk_level')}风险)")
             
+            # 超出token预算时降低采样频率（存在紧急告警时不限制）
+            should_sample, exceeded_budget = await usage_service.should_sample(patient_id, patient_info.get("ward_id"))
+            if not should_sample:
+                logger.info(f"⏭️ [AI分析] 患者超出{'病区' if exceeded_budget == 'ward' else '患者'}每日token预算，跳过本帧分析")
+                timings["context"] = (datetime.now() - stage_start).total_seconds()
+                return {
+                    "status": "skipped",
+                    "analysis": {"skip_reason": "over_budget", "budget": exceeded_budget},
+                    "timings": timings
+                }
+            
             monitoring_config = await self._get_monitoring_config(patient_id)
             logger.info(f"📊 [AI分析] 监测配置: {monitoring_config}")
+            timings["context"] = (datetime.now() - stage_start).total_seconds()
             
             # 2. 确定检测模式
-            logger.info(f"📊 [AI分析] 步骤2/7: 确定检测模式...")
-            detection_modes = self._get_detection_modes(monitoring_config)
-            logger.info(f"📊 [AI分析] 检测模式: {detection_modes}")
+            logger.info(f"📊 [AI分析] 步骤2/8: 确定检测模式...")
+            enabled_modes = self._get_detection_modes(monitoring_config)
+            # 按监测时间表过滤当前时段生效的模式，监测时段之外不分析
+            enabled_modes = monitoring_schedule_service.filter_modes(
+                patient_id,
+                monitoring_config.get("monitoring_schedule") if monitoring_config else None,
+                enabled_modes
+            )
+            if not enabled_modes:
+                logger.info(f"⏭️ [AI分析] 当前不在监测时段内，跳过分析")
+                return {
+                    "status": "skipped",
+                    "analysis": {"skip_reason": "outside_schedule"},
+                    "timings": timings
+                }
+            # 按各模式的检测频率选出本帧到期的模式，只有到期模式写入提示词
+            detection_modes = detection_scheduler.due_modes(patient_id, enabled_modes)
+            logger.info(f"📊 [AI分析] 检测模式: {detection_modes}（已启用: {enabled_modes}）")
+            if not detection_modes:
+                logger.info(f"⏭️ [AI分析] 本帧没有到期的检测模式，跳过分析")
+                return {
+                    "status": "skipped",
+                    "analysis": {
+                        "skip_reason": "no_modes_due",
+                        "next_due_in_seconds": detection_scheduler.seconds_until_due(patient_id, enabled_modes)
+                    },
+                    "timings": timings
+                }
             
             # 3. 构建患者上下文
-            logger.info(f"📊 [AI分析] 步骤3/7: 构建患者上下文...")
+            logger.info(f"📊 [AI分析] 步骤3/8: 构建患者上下文...")
             patient_context = {
                 "name": patient_info.get("full_name", "未知"),
                 "age": patient_info.get("age", "未知"),
                 "diagnosis": patient_info.get("diagnosis", "未知"),
-                "risk_level": patient_info.get("risk_level", "medium")
+                "risk_level": patient_info.get("risk_level", "medium"),
+                "last_overall_status": self._last_overall_status.get(patient_id),
+                "last_scene_type": self._last_scene_type.get(patient_id)
             }
+            # 只需检查吊瓶/监护仪时发送记住的区域裁剪图，完整画面时请模型定位区域
+            camera_key = camera_id or f"patient:{patient_id}"
+            roi_plan = None
+            model_image_bytes = image_bytes
+            if settings.roi_crop_enabled:
+                roi_plan = await roi_service.prepare(camera_key, image_bytes, detection_modes)
+                model_image_bytes = roi_plan["image_bytes"]
+                if roi_plan["region"]:
+                    patient_context["roi_crop"] = roi_plan["region"]
+                else:
+                    patient_context["request_regions"] = True
             logger.info(f"📊 [AI分析] 患者上下文: {patient_context}")
             
             # 4. 调用Gemini分析
-            logger.info(f"📊 [AI分析] 步骤4/7: 调用Gemini AI分析...")
+            logger.info(f"📊 [AI分析] 步骤4/8: 调用Gemini AI分析...")
             analysis_start = datetime.now()
             analysis_result = await gemini_analyzer.analyze_hospital_scene(
-                image_bytes=image_bytes,
+                image_bytes=model_image_bytes,
                 patient_context=patient_context,
                 detection_modes=detection_modes
             )
             analysis_duration = (datetime.now() - analysis_start).total_seconds()
+            timings["model"] = analysis_duration
             logger.info(f"📊 [AI分析] Gemini分析完成，耗时: {analysis_duration:.2f}秒")
             
+            # 记录token用量（解析失败的调用同样计入）
+            try:
+                await usage_service.record_usage(patient_id, patient_info.get("ward_id"), analysis_result.get("usage"))
+            except Exception as e:
+                logger.warning(f"⚠️ [AI分析] 记录模型用量失败（不影响分析）: {e}")
+            
             if analysis_result.get("status") == "failed" or "error" in analysis_result:
                 error_msg = analysis_result.get('error', '未知错误')
                 logger.error(f"❌ [AI分析] AI分析失败: {error_msg}")
                 logger.error(f"❌ [AI分析] 完整错误信息: {analysis_result}")
+                # 模型调用异常（重试后仍失败）可以稍后回放；响应解析失败重放也无济于事
+                retryable = analysis_result.get("status") == "failed" and "error_type" in analysis_result
+                spooled = False
+                if retryable and spool_on_failure and settings.frame_spool_enabled:
+                    try:
+                        from app.services.frame_spool import frame_spool
+                        spooled = await frame_spool.enqueue(
+                            image_bytes=image_bytes,
+                            patient_id=patient_id,
+                            camera_id=camera_id,
+                            timestamp_ms=timestamp_ms,
+                            error=error_msg,
+                            captured_at=start_time.timestamp()
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ [AI分析] 写入帧缓存失败: {e}")
                 return {
                     "error": error_msg,
                     "status": "failed",
-                    "details": analysis_result
+                    "retryable": retryable,
+                    "spooled": spooled,
+                    "details": analysis_result,
+                    "timings": timings
                 }
             
             logger.info(f"📊 [AI分析] 分析结果状态: {analysis_result.get('overall_status')}")
+            detection_scheduler.mark_evaluated(patient_id, detection_modes)
+            if 'iv_drip' in detection_modes:
+                # 根据吊瓶余量变化预测输完时间，安排下一次吊瓶检测
+                next_check_at = await iv_drip_predictor.observe(
+                    patient_id,
+                    analysis_result.get("detections", {}).get("iv_drip"),
+                    patient_info.get("full_name", ""),
+                    observed_at=captured_at.timestamp() if captured_at else None
+                )
+                if next_check_at:
+                    detection_scheduler.schedule_next(patient_id, 'iv_drip', next_check_at)
+            self._last_overall_status[patient_id] = analysis_result.get("overall_status")
+            if roi_plan and roi_plan["region"]:
+                # 裁剪图看不到完整场景，场景类型沿用完整画面的判断
+                analysis_result["roi"] = {
+                    "region": roi_plan["region"],
+                    "box": roi_plan["box"],
+                    "original_bytes": len(image_bytes),
+                    "cropped_bytes": len(model_image_bytes)
+                }
+            else:
+                self._last_scene_type[patient_id] = analysis_result.get("scene_type")
+                if roi_plan:
+                    roi_service.update(camera_key, roi_plan, analysis_result)
             logger.info(f"📊 [AI分析] 检测结果: {json.dumps(analysis_result.get('detections', {}), ensure_ascii=False, indent=2)}")
             
             # 5. 保存分析结果到数据库
-            logger.info(f"📊 [AI分析] 步骤5/7: 保存分析结果到数据库...")
+            logger.info(f"📊 [AI分析] 步骤5/8: 保存分析结果到数据库...")
+            stage_start = datetime.now()
             result_id = await self._save_analysis_result(
                 patient_id=patient_id,
                 camera_id=camera_id,
                 analysis_result=analysis_result,
                 detection_modes=detection_modes,
-                timestamp_ms=timestamp_ms
+                timestamp_ms=timestamp_ms,
+                captured_at=captured_at
             )
             logger.info(f"📊 [AI分析] 结果已保存: {result_id}")
+            timings["db_save"] = (datetime.now() - stage_start).total_seconds()
+            if 'bed_exit' in detection_modes:
+                # 在床/离床计时（超时告警由定时器触发）
+                bed_exit = analysis_result.get("detections", {}).get("bed_exit")
+                bed_occupancy_tracker.observe(
+                    patient_id,
+                    bed_exit.get("patient_in_bed") if isinstance(bed_exit, dict) else None,
+                    monitoring_config,
+                    camera_id=camera_id,
+                    analysis_result_id=result_id,
+                    observed_at=captured_at.timestamp() if captured_at else None
+                )
             
-            # 6. 上传图片到腾讯云（如果配置了）
-            image_url = None
-            try:
-                from app.services.tencent_cos_service import get_cos_client
-                cos_client = get_cos_client()
-                if cos_client:
-                    logger.info(f"📊 [AI分析] 步骤6/8: 上传图片到腾讯云...")
-                    upload_result = cos_client.upload_image(
-                        image_bytes=image_bytes,
-                        patient_id=patient_id,
-                        alert_id=None,  # 先上传，告警创建后再关联
-                        filename=f"analysis_{result_id[:8]}.jpg"
-                    )
-                    image_url = upload_result["url"]
-                    logger.info(f"📊 [AI分析] 图片上传成功: {image_url}")
-                    
-                    # 更新分析结果记录，保存图片URL（如果数据库有image_url字段）
-                    try:
-                        from app.core.database import execute_update
-                        await execute_update(
-                            "UPDATE ai_analysis_results SET image_url = ? WHERE result_id = ?",
-                            (image_url, result_id)
-                        )
-                        logger.info(f"📊 [AI分析] 图片URL已保存到分析结果记录")
-                    except Exception as e:
-                        logger.warning(f"⚠️ [AI分析] 保存图片URL到分析结果失败（可能字段不存在）: {e}")
-                else:
-                    logger.info(f"📊 [AI分析] 腾讯云COS未配置，跳过图片上传")
-            except Exception as e:
-                logger.warning(f"⚠️ [AI分析] 图片上传失败（不影响分析）: {e}")
+            # 6. 后台上传图片到图片存储（COS或本地），上传完成后回填分析结果和告警的图片URL
+            upload_task = self._schedule_image_upload(image_bytes, patient_id, result_id)
             
             # 7. 检查是否需要触发告警
             logger.info(f"📊 [AI分析] 步骤7/8: 检查告警条件...")
+            stage_start = datetime.now()
             overall_status = analysis_result.get("overall_status", "")
             # 支持中英文状态值
             should_trigger_alert = overall_status in ["attention", "critical", "注意", "紧急"]
@@ -147,38 +258,28 @@ class AIAnalysisService:
             if should_trigger_alert:
                 logger.warning(f"⚠️ [AI分析] 检测到异常状态: {analysis_result.get('overall_status')}，触发告警检查")
                 alert_service = get_alert_service()
-                # 如果告警创建时需要图片，先上传图片（如果还没有）
-                alert_image_url = image_url
-                if not alert_image_url:
-                    try:
-                        from app.services.tencent_cos_service import get_cos_client
-                        cos_client = get_cos_client()
-                        if cos_client:
-                            logger.info(f"📊 [AI分析] 告警需要图片，上传图片到腾讯云...")
-                            upload_result = cos_client.upload_image(
-                                image_bytes=image_bytes,
-                                patient_id=patient_id,
-                                alert_id=None,
-                                filename=f"alert_{result_id[:8]}.jpg"
-                            )
-                            alert_image_url = upload_result["url"]
-                            logger.info(f"📊 [AI分析] 告警图片上传成功: {alert_image_url}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ [AI分析] 告警图片上传失败: {e}")
-                
+                # 图片仍在后台上传时告警先不带图片，上传完成后按分析结果ID回填
                 await alert_service.check_and_create_alert(
                     patient_id=patient_id,
                     camera_id=camera_id,
                     analysis_result_id=result_id,
                     analysis_data=analysis_result,
-                    image_url=alert_image_url  # 传递图片URL
+                    detection_modes=detection_modes
                 )
+                if upload_task and upload_task.done() and not upload_task.cancelled() and upload_task.result():
+                    # 上传在告警写入前已完成时，回填刚创建的告警
+                    await self._backfill_alert_image(result_id, upload_task.result())
                 logger.info(f"📊 [AI分析] 告警检查完成")
             else:
+                # 正常帧计入告警确认窗口
+                alert_confirmer.observe(patient_id, None, detection_modes)
                 logger.info(f"📊 [AI分析] 状态正常，无需告警")
             
+            timings["alert"] = (datetime.now() - stage_start).total_seconds()
+            
             # 8. 返回结果
             total_duration = (datetime.now() - start_time).total_seconds()
+            timings["total"] = total_duration
             logger.info(f"✅ [AI分析] 分析完成，总耗时: {total_duration:.2f}秒")
             logger.info(f"📊 [AI分析] 步骤8/8: 返回结果")
             
@@ -186,7 +287,9 @@ class AIAnalysisService:
                 "status": "success",
                 "result_id": result_id,
                 "analysis": analysis_result,
-                "duration_seconds": total_duration
+                "duration_seconds": total_duration,
+                "image_upload_pending": bool(upload_task and not upload_task.done()),
+                "timings": timings
             }
             
         except Exception as e:
@@ -205,6 +308,64 @@ class AIAnalysisService:
                 "duration_seconds": total_duration
             }
     
+    def _schedule_image_upload(self, image_bytes: bytes, patient_id: str, result_id: str) -> Optional[asyncio.Task]:
+        """在后台上传分析图片，返回上传任务（未启用图片存储时返回None）"""
+        from app.services.image_store import get_image_store
+        image_store = get_image_store()
+        if not image_store:
+            logger.info(f"📊 [AI分析] 未启用图片存储，跳过图片上传")
+            return None
+        logger.info(f"📊 [AI分析] 步骤6/8: 后台上传图片（{image_store.backend}）...")
+        task = asyncio.create_task(self._upload_and_backfill(image_store, image_bytes, patient_id, result_id))
+        # 保留任务引用，防止被垃圾回收；关闭时等待未完成的上传
+        self._upload_tasks.add(task)
+        task.add_done_callback(self._upload_tasks.discard)
+        return task
+    
+    async def _upload_and_backfill(self, image_store, image_bytes: bytes, patient_id: str, result_id: str) -> Optional[str]:
+        """上传图片并回填分析结果、告警记录的图片URL，返回图片URL（失败返回None）"""
+        try:
+            upload_result = await image_store.upload_image_async(
+                image_bytes=image_bytes,
+                patient_id=patient_id
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [AI分析] 图片上传失败（不影响分析）: {e}")
+            return None
+        if not upload_result:
+            return None
+        
+        image_url = upload_result["url"]
+        logger.info(f"📊 [AI分析] 图片上传成功: {image_url}")
+        try:
+            await execute_update(
+                "UPDATE ai_analysis_results SET image_url = ? WHERE result_id = ?",
+                (image_url, result_id)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [AI分析] 保存图片URL到分析结果失败（可能字段不存在）: {e}")
+        await self._backfill_alert_image(result_id, image_url)
+        return image_url
+    
+    async def _backfill_alert_image(self, result_id: str, image_url: str):
+        """为该分析结果产生的、尚无图片的告警回填图片URL"""
+        try:
+            updated = await execute_update(
+                "UPDATE alerts SET image_url = ? WHERE analysis_result_id = ? AND image_url IS NULL",
+                (image_url, result_id)
+            )
+            if updated:
+                logger.info(f"📊 [AI分析] 已为 {updated} 条告警回填图片URL")
+        except Exception as e:
+            logger.warning(f"⚠️ [AI分析] 回填告警图片URL失败: {e}")
+    
+    async def drain_uploads(self, timeout: float = 10.0):
+        """等待后台图片上传完成（服务关闭时调用）"""
+        if not self._upload_tasks:
+            return
+        logger.info(f"📊 [AI分析] 等待 {len(self._upload_tasks)} 个图片上传任务完成...")
+        await asyncio.wait(set(self._upload_tasks), timeout=timeout)
+    
     async def _get_patient_info(self, patient_id: str) -> Optional[Dict]:
         """获取患者信息"""
         results = await execute_query(
@@ -247,12 +408,16 @@ class AIAnalysisService:
         camera_id: Optional[str],
         analysis_result: Dict,
         detection_modes: list,
-        timestamp_ms: Optional[int] = None
+        timestamp_ms: Optional[int] = None,
+        captured_at: Optional[datetime] = None
     ) -> str:
         """保存分析结果到数据库"""
         result_id = str(uuid.uuid4())
         # 如果有相对时间戳，使用它；否则使用当前时间
-        if timestamp_ms is not None:
+        if captured_at is not None:
+            # 回放的缓存帧使用原始采集时间，保证时间轴顺序正确
+            timestamp = captured_at
+        elif timestamp_ms is not None:
             # 从患者开始监控时间计算绝对时间（简化处理，使用当前时间减去相对时间）
             timestamp = datetime.now()
         else:
@@ -262,8 +427,11 @@ class AIAnalysisService:
         detection_type = "general"
         detections = analysis_result.get("detections", {})
         for mode in detection_modes:
-            if mode in detections and detections[mode].get("detected") or \
-               (mode == "bed_exit" and not detections.get("bed_exit", {}).get("patient_in_bed")):
+            # 裁剪图无法判断的检测项为 null
+            detection = detections.get(mode)
+            if not isinstance(detection, dict):
+                continue
+            if detection.get("detected") or (mode == "bed_exit" and not detection.get("patient_in_bed")):
                 detection_type = mode
                 break
         
@@ -271,7 +439,7 @@ class AIAnalysisService:
         confidence_score = None
         if "detections" in analysis_result:
             for mode in detection_modes:
-                if mode in analysis_result["detections"]:
+                if isinstance(analysis_result["detections"].get(mode), dict):
                     conf = analysis_result["detections"][mode].get("confidence")
                     if conf:
                         confidence_score = float(conf)
@@ -0,0 +1,101 @@
+"""
+告警时间确认窗口
+单帧模型判断容易误报，每位患者按检测项目用定长环形缓冲记录最近若干次的判断结果
+（面部、吊瓶等按间隔检测的项目只记录检测了该项目的帧）；
+告警类型按各自的策略确认：最近 K 次分析中至少 M 次出现且都在 T 秒内才触发。
+心跳变平等未配置策略的告警、以及危急（critical）级别的告警不需要确认，立即触发
+"""
+import time
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DETECTION_MODES = ("fall", "bed_exit", "facial", "activity", "iv_drip")
+
+# 告警类型 -> 产生该告警的检测模式（未列出的类型每帧都会检测，如生命体征）
+ALERT_TYPE_MODES = {
+    "fall_detected": "fall",
+    "bed_exit_timeout": "bed_exit",
+    "prolonged_bed": "bed_exit",
+    "facial_cyanotic": "facial",
+    "facial_pain": "facial",
+    "abnormal_activity": "activity",
+    "iv_drip_empty": "iv_drip",
+    "iv_drip_bag_empty": "iv_drip",
+    "iv_drip_completely_empty": "iv_drip",
+}
+
+
+class AlertConfirmer:
+    """按患者记录最近的判断结果，M/K/T 策略确认告警"""
+
+    def __init__(self):
+        # patient_id -> 检测模式（""表示每帧都检测的项目）-> [(时间, 告警类型或None)]
+        self._rings: Dict[str, Dict[str, Deque[Tuple[float, Optional[str]]]]] = {}
+        self.stats = {"frames": 0, "immediate": 0, "confirmed": 0, "unconfirmed": 0}
+
+    @staticmethod
+    def policy(alert_type: str) -> Optional[Dict]:
+        """告警类型的确认策略 {"m", "k", "seconds"}，未配置或 m<=1 时立即触发"""
+        policy = settings.alert_confirmation_policies.get(alert_type)
+        if not policy or int(policy.get("m", 1)) <= 1:
+            return None
+        return policy
+
+    def observe(self, patient_id: str, alert_type: Optional[str],
+                detection_modes: Optional[List[str]] = None, severity: Optional[str] = None,
+                now: Optional[float] = None) -> bool:
+        """
+        记录一帧的判断结果（正常帧 alert_type 为None），返回该告警类型是否已确认
+
+        Args:
+            detection_modes: 本帧检测的模式（None表示全部），未检测的项目不计入该项目的窗口
+            severity: 告警严重程度，alert_confirmation_bypass_severities 中的等级不需要确认
+        """
+        now = now or time.time()
+        rings = self._rings.get(patient_id)
+        if rings is None:
+            rings = self._rings[patient_id] = {}
+        entry = (now, alert_type)
+        modes = {""}
+        modes.update(detection_modes if detection_modes is not None else DETECTION_MODES)
+        if alert_type:
+            modes.add(ALERT_TYPE_MODES.get(alert_type, ""))
+        for mode in modes:
+            ring = rings.get(mode)
+            if ring is None:
+                ring = rings[mode] = deque(maxlen=settings.alert_confirmation_ring_size)
+            ring.append(entry)
+        self.stats["frames"] += 1
+        if not alert_type:
+            return False
+
+        policy = self.policy(alert_type)
+        if policy is None or severity in settings.alert_confirmation_bypass_severities:
+            self.stats["immediate"] += 1
+            return True
+
+        m, k, window = int(policy["m"]), int(policy.get("k", policy["m"])), float(policy.get("seconds", 0) or 0)
+        considered = hits = 0
+        for timestamp, observed_type in reversed(rings[ALERT_TYPE_MODES.get(alert_type, "")]):
+            if (window and now - timestamp > window) or considered >= k:
+                break
+            considered += 1
+            if observed_type == alert_type:
+                hits += 1
+        if hits >= m:
+            self.stats["confirmed"] += 1
+            return True
+        self.stats["unconfirmed"] += 1
+        logger.info(f"⏳ [告警确认] 患者 {patient_id} {alert_type} 待确认: 最近{considered}次中出现{hits}次（需要{m}/{k}）")
+        return False
+
+    def get_stats(self) -> Dict:
+        return {"patients": len(self._rings), **self.stats}
+
+
+# 创建全局实例
+alert_confirmer = AlertConfirmer()
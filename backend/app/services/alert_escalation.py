@@ -0,0 +1,240 @@
+"""
+未确认告警升级
+严重告警推送后如果一直没有人确认，按 alert_escalation_steps 配置的时间点（从告警创建时算起）
+逐级再次提醒护士、升级到医生/管理员、按优先级逐个通知家属。
+升级计时放在时间轮中：确认/处理告警时 O(1) 取消，不需要轮询数据库；
+已执行的升级级数写入 alerts.escalation_level，进程重启后从未确认的告警恢复计时
+"""
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.database import execute_query, execute_update
+from app.services.alert_rules import alert_rule_engine
+from app.services.alert_suppression import _to_timestamp
+from app.services.recipient_directory import recipient_directory
+from app.services.timer_wheel import timer_wheel, TimerHandle
+
+logger = logging.getLogger(__name__)
+
+# 升级目标 -> 用户角色
+ROLE_TARGETS = {"nurses": "nurse", "doctors": "doctor", "admins": "admin"}
+# 其余目标: guardians（全部家属）、next_guardian（下一优先级的家属）
+
+
+class EscalationState:
+    """单个告警的升级状态"""
+
+    __slots__ = ("alert_id", "patient_id", "alert_type", "severity", "created_at", "level", "timer")
+
+    def __init__(self, alert_id: str, patient_id: str, alert_type: str, severity: str, created_at: float, level: int):
+        self.alert_id = alert_id
+        self.patient_id = patient_id
+        self.alert_type = alert_type
+        self.severity = severity
+        self.created_at = created_at
+        self.level = level  # 已执行的升级级数（即下一级的序号）
+        self.timer: Optional[TimerHandle] = None
+
+
+class AlertEscalationScheduler:
+    """未确认告警升级调度"""
+
+    def __init__(self):
+        self._states: Dict[str, EscalationState] = {}
+        self.stats = {"scheduled": 0, "escalations": 0, "cancelled": 0, "closed": 0, "restored": 0, "errors": 0}
+
+    @staticmethod
+    def steps(severity: str) -> List[Dict]:
+        """严重程度对应的升级步骤（按 after_seconds 排列），不升级时返回空列表"""
+        return settings.alert_escalation_steps.get(severity) or []
+
+    def schedule(
+        self,
+        alert_id: str,
+        patient_id: str,
+        alert_type: str,
+        severity: str,
+        created_at: Optional[float] = None,
+        level: int = 0
+    ):
+        """开始（或按新的严重程度重新开始）告警的升级计时"""
+        self._drop(alert_id)
+        if level >= len(self.steps(severity)):
+            return
+        state = EscalationState(alert_id, patient_id, alert_type, severity, created_at or time.time(), level)
+        self._states[alert_id] = state
+        self.stats["scheduled"] += 1
+        self._arm(state)
+
+    def _arm(self, state: EscalationState):
+        steps = self.steps(state.severity)
+        elapsed = time.time() - state.created_at
+        # 停机等原因错过多级时直接执行已到期的最高一级，不逐级补发
+        while state.level + 1 < len(steps) and steps[state.level + 1]["after_seconds"] <= elapsed:
+            state.level += 1
+        state.timer = timer_wheel.schedule(
+            state.created_at + steps[state.level]["after_seconds"] - time.time(),
+            self._on_timer, state.alert_id, state.level
+        )
+
+    def cancel(self, alert_id: str) -> bool:
+        """告警已确认或已处理，取消升级（O(1)）"""
+        if self._drop(alert_id):
+            self.stats["cancelled"] += 1
+            return True
+        return False
+
+    def _drop(self, alert_id: str) -> bool:
+        state = self._states.pop(alert_id, None)
+        if state is None:
+            return False
+        timer_wheel.cancel(state.timer)
+        return True
+
+    async def _on_timer(self, alert_id: str, level: int):
+        state = self._states.get(alert_id)
+        if state is None or state.level != level:
+            return
+        state.timer = None
+        try:
+            escalated = await self._escalate(state)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ [告警升级] 执行失败: alert_id={alert_id}, 级别={level + 1}, 错误: {e}")
+            escalated = True  # 继续后续级别
+        if self._states.get(alert_id) is not state:
+            return  # 执行期间已取消或重新计时
+        if not escalated:
+            self._states.pop(alert_id, None)
+            return
+        state.level = level + 1
+        if state.level < len(self.steps(state.severity)):
+            self._arm(state)
+        else:
+            self._states.pop(alert_id, None)
+
+    async def _escalate(self, state: EscalationState) -> bool:
+        """
+        执行一级升级
+
+        Returns:
+            False 表示告警已被确认/处理（绕过 acknowledge/resolve 接口修改时），不再升级
+        """
+        rows = await execute_query(
+            """SELECT a.status, a.title, p.full_name
+               FROM alerts a
+               LEFT JOIN patients p ON a.patient_id = p.patient_id
+               WHERE a.alert_id = ?""",
+            (state.alert_id,)
+        )
+        if not rows or rows[0]["status"] != "pending":
+            self.stats["closed"] += 1
+            return False
+        alert = rows[0]
+
+        step = self.steps(state.severity)[state.level]
+        targets = list(step.get("notify") or [])
+        flags = alert_rule_engine.rule_flags(state.alert_type)
+        if flags.get("requires_family_notification") and "guardians" not in targets:
+            targets.append("guardians")
+        user_ids = await self._resolve_targets(state, targets)
+
+        minutes = max(1, int((time.time() - state.created_at) // 60))
+        level = state.level + 1
+        patient_name = alert.get("full_name") or "患者"
+        message = f"患者{patient_name}的「{alert.get('title') or '告警'}」已{minutes}分钟无人确认，请立即处理！"
+        logger.warning(f"⏫ [告警升级] {message} alert_id={state.alert_id}, 级别={level}, 目标={targets}, 通知{len(user_ids)}人")
+
+        from app.services.alert_service import alert_service
+        delivered = await alert_service.notify_users(state.alert_id, user_ids, "告警升级提醒", message, {
+            "type": "alert_escalation",
+            "alert_id": state.alert_id,
+            "patient_id": state.patient_id,
+            "alert_type": state.alert_type,
+            "severity": state.severity,
+            "title": "告警升级提醒",
+            "message": message,
+            "escalation_level": level,
+            "unacknowledged_minutes": minutes,
+            "requires_phone_call": bool(flags.get("requires_phone_call")),
+            "timestamp": datetime.now().isoformat()
+        })
+        self.stats["escalations"] += 1
+        logger.info(f"✅ [告警升级] 已推送 {delivered}/{len(user_ids)} 人在线送达: alert_id={state.alert_id}")
+
+        try:
+            await execute_update(
+                "UPDATE alerts SET escalation_level = ?, escalated_at = ? WHERE alert_id = ?",
+                (level, datetime.now(), state.alert_id)
+            )
+        except Exception as e:
+            # 未执行迁移（缺少 escalation_level/escalated_at 字段）时只在内存中记录，重启后会从头计算
+            logger.warning(f"⚠️ 保存告警升级级别失败（请执行 scripts/add_alert_escalation_columns.py）: {e}")
+        return True
+
+    async def _resolve_targets(self, state: EscalationState, targets: List[str]) -> List[str]:
+        """把升级目标解析为用户ID（去重，保持顺序）"""
+        user_ids: Dict[str, None] = {}
+        for target in targets:
+            if target in ROLE_TARGETS:
+                users = await recipient_directory.get_staff(ROLE_TARGETS[target])
+            elif target == "guardians":
+                users = (await recipient_directory.get_patient(state.patient_id)).guardians
+            elif target == "next_guardian":
+                # 第 n 次 next_guardian 通知第 n 个优先级的家属，超出后通知最后一个优先级
+                guardians = (await recipient_directory.get_patient(state.patient_id)).guardians
+                priorities = sorted({g["priority"] or 0 for g in guardians})
+                if not priorities:
+                    continue
+                tier = sum(
+                    1 for step in self.steps(state.severity)[:state.level]
+                    if "next_guardian" in (step.get("notify") or [])
+                )
+                priority = priorities[min(tier, len(priorities) - 1)]
+                users = [g for g in guardians if (g["priority"] or 0) == priority]
+            else:
+                logger.warning(f"⚠️ [告警升级] 未知的升级目标: {target}")
+                continue
+            for user in users:
+                user_ids[user["user_id"]] = None
+        return list(user_ids)
+
+    async def restore(self):
+        """从未确认的告警恢复升级计时（进程重启后）"""
+        severities = tuple(severity for severity in settings.alert_escalation_steps if self.steps(severity))
+        if not severities:
+            return
+        placeholders = ",".join("?" * len(severities))
+        try:
+            rows = await execute_query(
+                f"""SELECT * FROM alerts
+                    WHERE status = 'pending' AND severity IN ({placeholders})
+                    ORDER BY created_at""",
+                severities
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 恢复告警升级计时失败: {e}")
+            return
+        now = time.time()
+        restored = 0
+        for row in rows:
+            created_at = _to_timestamp(row.get("created_at"))
+            if created_at is None or now - created_at > settings.alert_escalation_max_age_seconds:
+                continue  # 很久以前的未确认告警不再升级
+            level = row.get("escalation_level") or 0
+            if level >= len(self.steps(row["severity"])):
+                continue
+            self.schedule(row["alert_id"], row["patient_id"], row["alert_type"], row["severity"], created_at, level)
+            restored += 1
+        self.stats["restored"] = restored
+        if restored:
+            logger.info(f"🔁 已从未确认告警恢复 {restored} 个升级计时")
+
+    def get_stats(self) -> Dict:
+        return {"pending": len(self._states), **self.stats}
+
+
+# 创建全局实例
+alert_escalation = AlertEscalationScheduler()
@@ -0,0 +1,427 @@
+"""
+告警规则引擎
+告警判断规则写在声明式规则表（alert_rules.json：优先级、条件、严重程度、文案模板）中，
+加载时生成并编译成一个 Python 判断函数：条件展开成 and/or 表达式，文案模板展开成字符串拼接，
+每个文本字段用到的关键词集合合并成一个正则，最多扫描一次。
+规则文件修改后自动重新加载，新规则编译失败时继续使用旧规则
+"""
+import os
+import re
+import copy
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = Path(__file__).parent / "alert_rules.json"
+SEVERITIES = ("critical", "high", "medium", "low")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+_EMPTY: Dict = {}
+_SMALL_KEYWORD_SET = 6  # 不超过该数量的关键词逐个查找，否则合并成正则
+
+
+class RuleError(ValueError):
+    """规则文件格式错误"""
+
+
+class KeywordMatcher:
+    """
+    多关键词集合匹配器：关键词合并成一个正则（长关键词优先），返回文本命中的关键词集合位掩码。
+    每个关键词的掩码包含其中所含较短关键词所属的集合；每次命中后从下一个字符继续查找，
+    部分重叠的关键词也不会漏掉。正则引擎按关键词首字跳过无关字符，关键词较多时比逐个 in 查找更快
+    """
+
+    def __init__(self, keyword_sets: Dict[str, List[str]]):
+        self.keyword_sets = keyword_sets
+        self.set_bits: Dict[str, int] = {}
+        for index, (name, keywords) in enumerate(keyword_sets.items()):
+            if not isinstance(keywords, list) or not all(isinstance(k, str) and k for k in keywords):
+                raise RuleError(f"关键词集合 {name} 必须是非空字符串列表")
+            self.set_bits[name] = 1 << index
+
+    def scanner(self, set_names: List[str]) -> Callable[[Any], int]:
+        """生成只匹配指定关键词集合的扫描函数"""
+        keyword_masks: Dict[str, int] = {}
+        for name in set_names:
+            for keyword in self.keyword_sets[name]:
+                keyword_masks[keyword] = keyword_masks.get(keyword, 0) | self.set_bits[name]
+        if len(keyword_masks) <= _SMALL_KEYWORD_SET:
+            # 关键词很少时逐个 in 查找更快
+            pairs = tuple(keyword_masks.items())
+
+            def scan_small(text: Any) -> int:
+                if not text or not isinstance(text, str):
+                    return 0
+                mask = 0
+                for keyword, bits in pairs:
+                    if keyword in text:
+                        mask |= bits
+                return mask
+            return scan_small
+
+        # 长关键词命中时，其中包含的短关键词也视为命中
+        masks = {
+            keyword: mask | sum(keyword_masks[other] for other in keyword_masks if other != keyword and other in keyword)
+            for keyword, mask in keyword_masks.items()
+        }
+        search = re.compile("|".join(re.escape(k) for k in sorted(masks, key=len, reverse=True))).search
+
+        def scan(text: Any) -> int:
+            if not text or not isinstance(text, str):
+                return 0
+            mask = 0
+            match = search(text)
+            while match is not None:
+                mask |= masks[match.group()]
+                match = search(text, match.start() + 1)
+            return mask
+        return scan
+
+
+def _is_in(value: Any, values: frozenset) -> bool:
+    try:
+        return value in values
+    except TypeError:  # 不可哈希的值（列表等）
+        return False
+
+
+class CompiledRule:
+    """编译后的单条规则"""
+
+    def __init__(self, alert_type: str, priority: int, extra: Optional[Dict] = None):
+        self.alert_type = alert_type
+        self.priority = priority
+        self.extra = extra or {}  # 规则的附加标记（requires_phone_call 等）
+        self.hits = 0
+
+
+class RuleSet:
+    """编译后的规则表"""
+
+    def __init__(self, rules: List[CompiledRule], source: str, evaluator: Callable, code: str):
+        self.rules = rules
+        self.source = source
+        self._evaluate = evaluator
+        self.code = code  # 生成的判断函数源码（排查规则问题时查看）
+
+    def evaluate(self, detections: Dict, patient_name: str, patient_address: str = "您") -> Tuple[Optional[str], Dict]:
+        """按优先级返回第一条命中规则的 (告警类型, 告警信息)，无命中返回 (None, {})"""
+        index, alert_info = self._evaluate(detections, patient_name, patient_address)
+        if index is None:
+            return None, {}
+        rule = self.rules[index]
+        rule.hits += 1
+        return rule.alert_type, alert_info
+
+
+def _parse_path(path: Any) -> Tuple[str, str]:
+    if not isinstance(path, str) or path.count(".") != 1:
+        raise RuleError(f"字段路径必须是 检测项.字段 格式: {path!r}")
+    group, field = path.split(".")
+    return group, field
+
+
+class RuleCompiler:
+    """
+    把规则表（dict）编译成 RuleSet
+
+    所有规则的条件和严重程度分支生成为一个 Python 函数：每个检测项只取一次存到局部变量，
+    条件展开成 and/or 表达式，文本字段的关键词掩码在第一次用到时扫描并缓存到局部变量
+    """
+
+    def __init__(self, spec: Dict):
+        if not isinstance(spec, dict) or not isinstance(spec.get("rules"), list):
+            raise RuleError("规则文件缺少 rules 列表")
+        self.spec = spec
+        self.matcher = KeywordMatcher(spec.get("keyword_sets") or {})
+        self.translations = spec.get("translations") or {}
+        self.groups: Dict[str, int] = {}  # 检测项 -> 局部变量序号
+        self.mask_fields: Dict[Tuple[int, str], int] = {}  # 文本字段 -> 关键词掩码变量序号
+        self.mask_sets: Dict[int, Dict[str, None]] = {}  # 关键词掩码变量序号 -> 用到的关键词集合
+        self.constants: List[Any] = []
+
+    def path(self, path: Any) -> Tuple[int, str]:
+        group, field = _parse_path(path)
+        return self.groups.setdefault(group, len(self.groups)), field
+
+    def constant(self, value: Any) -> str:
+        self.constants.append(value)
+        return f"_c{len(self.constants) - 1}"
+
+    # ---------- 条件（生成表达式源码）----------
+
+    def predicate(self, node: Any) -> str:
+        if not isinstance(node, dict) or len(node) != 1:
+            raise RuleError(f"条件必须是只有一个键的对象: {node!r}")
+        (op, arg), = node.items()
+        if op in ("all", "any"):
+            if not isinstance(arg, list) or not arg:
+                raise RuleError(f"{op} 需要非空条件列表")
+            joiner = " and " if op == "all" else " or "
+            return "(" + joiner.join(self.predicate(child) for child in arg) + ")"
+        if op == "not":
+            return f"(not {self.predicate(arg)})"
+        if op == "truthy":
+            group, field = self.path(arg)
+            return f"_g{group}.get({field!r})"
+        if op == "is_false":
+            group, field = self.path(arg)
+            return f"(_g{group}.get({field!r}) is False)"
+        if op in ("in", "contains_any") and not isinstance(arg, dict):
+            raise RuleError(f"{op} 条件需要对象参数: {arg!r}")
+        if op == "in":
+            group, field = self.path(arg.get("path"))
+            values = arg.get("values")
+            if not isinstance(values, list) or not values:
+                raise RuleError(f"in 条件缺少 values: {arg!r}")
+            try:
+                values = frozenset(values)
+            except TypeError:
+                raise RuleError(f"in 条件的 values 只能是字符串、数字或布尔值: {arg!r}")
+            return f"_is_in(_g{group}.get({field!r}), {self.constant(values)})"
+        if op == "contains_any":
+            group, field = self.path(arg.get("path"))
+            keywords = arg.get("keywords")
+            bit = self.matcher.set_bits.get(keywords)
+            if bit is None:
+                raise RuleError(f"未定义的关键词集合: {keywords!r}")
+            mask = self.mask_fields.setdefault((group, field), len(self.mask_fields))
+            self.mask_sets.setdefault(mask, {})[keywords] = None
+            scan = f"(_m{mask} := _s{mask}(_g{group}.get({field!r})))"
+            return f"((_m{mask} if _m{mask} >= 0 else {scan}) & {bit})"
+        raise RuleError(f"未知的条件类型: {op}")
+
+    def severity(self, spec: Any) -> str:
+        if isinstance(spec, str):
+            if spec not in SEVERITIES:
+                raise RuleError(f"未知的严重程度: {spec}")
+            return repr(spec)
+        if not isinstance(spec, dict) or spec.get("default") not in SEVERITIES:
+            raise RuleError(f"severity 必须是严重程度或 {{cases, default}}: {spec!r}")
+        expression = repr(spec["default"])
+        for case in reversed(spec.get("cases") or []):
+            if not isinstance(case, dict) or case.get("value") not in SEVERITIES:
+                raise RuleError(f"未知的严重程度: {case!r}")
+            expression = f"({case['value']!r} if {self.predicate(case.get('when'))} else {expression})"
+        return expression
+
+    # ---------- 变量和文案 ----------
+
+    def variable(self, name: str, spec: Dict) -> str:
+        """编译变量，返回取值表达式源码"""
+        if not name.isidentifier():
+            raise RuleError(f"变量名必须是合法标识符: {name!r}")
+        if not isinstance(spec, dict):
+            raise RuleError(f"变量 {name} 定义必须是对象")
+        group, field = self.path(spec.get("path"))
+        default = spec.get("default", "")
+        mapping = spec.get("map")
+        translation = spec.get("translate")
+        min_length = int(spec.get("min_length", 0))
+        truncate = spec.get("truncate")
+        if not isinstance(default, str) or (mapping is not None and not (
+                isinstance(mapping, dict) and all(isinstance(v, str) for v in mapping.values()))):
+            raise RuleError(f"变量 {name} 的 default 和 map 取值必须是字符串")
+        if translation is not None and translation not in self.translations:
+            raise RuleError(f"变量 {name} 引用了未定义的翻译表: {translation}")
+        replacements = [tuple(pair) for pair in self.translations.get(translation, [])]
+
+        def resolve(value):
+            if mapping is not None:
+                try:
+                    return mapping.get(value, default)
+                except TypeError:
+                    return default
+            if value is None:
+                return default
+            value = value if isinstance(value, str) else str(value)
+            if min_length and len(value) < min_length:
+                return default
+            if replacements and not _CJK_RE.search(value):
+                # 模型返回英文描述时替换成中文
+                for source, target in replacements:
+                    value = value.replace(source, target)
+            if truncate:
+                value = value[:truncate]
+            return value
+        return f"{self.constant(resolve)}(_g{group}.get({field!r}))"
+
+    @staticmethod
+    def template(text: Any, names: Dict[str, str], field: str) -> Optional[str]:
+        """编译文案模板（str.format 语法），返回字符串拼接表达式源码"""
+        if text is None:
+            return None
+        if not isinstance(text, str):
+            raise RuleError(f"{field} 必须是字符串模板")
+        parts = []
+        try:
+            for literal, placeholder, format_spec, conversion in Formatter().parse(text):
+                if literal:
+                    parts.append(repr(literal))
+                if placeholder is None:
+                    continue
+                if placeholder not in names:
+                    raise RuleError(f"{field} 模板引用了未定义的变量: {placeholder}")
+                value = names[placeholder]
+                if conversion:
+                    value = f"{ {'r': 'repr', 's': 'str', 'a': 'ascii'}[conversion]}({value})"
+                parts.append(f"format({value}, {format_spec!r})" if format_spec else value)
+            "".join(text.format_map({name: "" for name in names}))  # 校验格式说明
+        except RuleError:
+            raise
+        except (ValueError, KeyError) as e:
+            raise RuleError(f"{field} 模板格式错误: {e}")
+        return " + ".join(parts) or "''"
+
+    # ---------- 规则 ----------
+
+    def rule(self, index: int, spec: Dict) -> Tuple[CompiledRule, List[str]]:
+        """编译单条规则，返回 (规则, 判断代码行)"""
+        alert_type = spec.get("alert_type") if isinstance(spec, dict) else None
+        if not alert_type or not isinstance(alert_type, str):
+            raise RuleError(f"规则缺少 alert_type: {spec!r}")
+        try:
+            predicate = self.predicate(spec.get("when"))
+            severity = self.severity(spec.get("severity"))
+            variables = spec.get("vars") or {}
+            names = {"patient_name": "patient_name", "patient_address": "patient_address"}
+            lines = []
+            for name, var in variables.items():
+                lines.append(f"        _v_{name} = {self.variable(name, var)}")
+                names[name] = f"_v_{name}"
+            fields = {"severity": severity}
+            for field in ("title", "description", "message"):
+                fields[field] = self.template(spec.get(field), names, field)
+                if fields[field] is None:
+                    raise RuleError("规则必须包含 title、description、message")
+            fields["auto_notify"] = repr(bool(spec.get("auto_notify", True)))
+            for key, value in (spec.get("extra") or {}).items():
+                # 容器值每次返回副本，避免调用方修改后影响后续告警
+                constant = self.constant(value)
+                fields[key] = f"_deepcopy({constant})" if isinstance(value, (dict, list)) else constant
+            if "patient_message" in spec:
+                fields["patient_message"] = self.template(spec["patient_message"], names, "patient_message") or "None"
+        except RuleError as e:
+            raise RuleError(f"规则 {alert_type}: {e}")
+        alert_info = ", ".join(f"{key!r}: {value}" for key, value in fields.items())
+        lines = [f"    if {predicate}:", *lines, f"        return {index}, {{{alert_info}}}"]
+        return CompiledRule(alert_type, int(spec.get("priority", 1000)), dict(spec.get("extra") or {})), lines
+
+    def compile(self, source: str) -> RuleSet:
+        specs = [spec for spec in self.spec["rules"] if not isinstance(spec, dict) or spec.get("enabled", True)]
+        # 优先级数值越小越先判断，相同优先级保持文件中的顺序
+        specs.sort(key=lambda spec: int(spec.get("priority", 1000)) if isinstance(spec, dict) else 0)
+        rules, body = [], []
+        for index, spec in enumerate(specs):
+            rule, lines = self.rule(index, spec)
+            rules.append(rule)
+            body.extend(lines)
+
+        lines = [
+            "def _evaluate(detections, patient_name, patient_address):",
+            "    if not isinstance(detections, dict):",
+            "        detections = _EMPTY",
+            "    if not isinstance(patient_name, str):",
+            "        patient_name = str(patient_name)",
+            "    if not isinstance(patient_address, str):",
+            "        patient_address = str(patient_address)",
+        ]
+        for group, index in self.groups.items():
+            lines.append(f"    _g{index} = detections.get({group!r})")
+            lines.append(f"    if not isinstance(_g{index}, dict):")
+            lines.append(f"        _g{index} = _EMPTY")
+        if self.mask_fields:
+            lines.append("    " + " = ".join(f"_m{index}" for index in self.mask_fields.values()) + " = -1")
+        lines.extend(body)
+        lines.append("    return None, None")
+        code = "\n".join(lines) + "\n"
+
+        namespace = {"_EMPTY": _EMPTY, "_is_in": _is_in, "_deepcopy": copy.deepcopy}
+        namespace.update((f"_s{mask}", self.matcher.scanner(list(names))) for mask, names in self.mask_sets.items())
+        namespace.update((f"_c{index}", value) for index, value in enumerate(self.constants))
+        exec(compile(code, f"<alert_rules {source}>", "exec"), namespace)
+        return RuleSet(rules, source, namespace["_evaluate"], code)
+
+
+def compile_rules(spec: Dict, source: str = "<dict>") -> RuleSet:
+    """编译规则表"""
+    return RuleCompiler(spec).compile(source)
+
+
+class AlertRuleEngine:
+    """告警规则引擎（规则文件修改后自动重新加载）"""
+
+    def __init__(self, rules_file: Optional[str] = None):
+        self.rules_file = Path(rules_file or settings.alert_rules_file or DEFAULT_RULES_FILE)
+        self._ruleset: Optional[RuleSet] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"evaluations": 0, "reloads": 0, "reload_errors": 0}
+
+    def load(self) -> RuleSet:
+        """读取并编译规则文件（失败时抛出异常，不影响当前规则）"""
+        mtime = os.path.getmtime(self.rules_file)
+        with open(self.rules_file, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+        ruleset = compile_rules(spec, str(self.rules_file))
+        self._ruleset, self._mtime = ruleset, mtime
+        logger.info(f"📜 [告警规则] 已加载 {len(ruleset.rules)} 条规则: {self.rules_file}")
+        return ruleset
+
+    def _maybe_reload(self):
+        now = time.time()
+        if self._ruleset is not None and now - self._checked_at < settings.alert_rules_reload_interval_seconds:
+            return
+        with self._lock:
+            if self._ruleset is not None and now - self._checked_at < settings.alert_rules_reload_interval_seconds:
+                return
+            self._checked_at = now
+            try:
+                if self._ruleset is not None and os.path.getmtime(self.rules_file) == self._mtime:
+                    return
+                first_load = self._ruleset is None
+                self.load()
+                if not first_load:
+                    self.stats["reloads"] += 1
+            except (OSError, ValueError) as e:
+                # JSON格式错误（json.JSONDecodeError）和规则错误（RuleError）都是 ValueError
+                if self._ruleset is None:
+                    raise
+                self.stats["reload_errors"] += 1
+                logger.error(f"❌ [告警规则] 重新加载失败，继续使用旧规则: {e}")
+
+    @property
+    def ruleset(self) -> RuleSet:
+        self._maybe_reload()
+        return self._ruleset
+
+    def evaluate(self, detections: Dict, patient_name: str, patient_address: str = "您") -> Tuple[Optional[str], Dict]:
+        """返回 (告警类型, 告警信息)，无需告警时返回 (None, {})"""
+        self.stats["evaluations"] += 1
+        return self.ruleset.evaluate(detections, patient_name, patient_address)
+
+    def rule_flags(self, alert_type: str) -> Dict:
+        """告警类型对应规则的附加标记（requires_phone_call、requires_family_notification 等），无规则时返回空字典"""
+        for rule in self.ruleset.rules:
+            if rule.alert_type == alert_type:
+                return rule.extra
+        return {}
+
+    def get_stats(self) -> Dict:
+        ruleset = self._ruleset
+        return {
+            "rules_file": str(self.rules_file),
+            "rules": {rule.alert_type: rule.hits for rule in ruleset.rules} if ruleset else {},
+            **self.stats
+        }
+
+
+# 创建全局实例
+alert_rule_engine = AlertRuleEngine()
@@ -3,11 +3,19 @@
 告警规则判断，创建告警记录，触发通知
 """
 import json
-import logging
 import uuid
+import base64
+import asyncio
+import logging
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
-from app.core.database import execute_insert, execute_query, execute_update
+from typing import Dict, Optional, List, Tuple
+from app.core.config import settings
+from app.core.database import execute_insert, execute_many, execute_query, execute_update
+from app.services.alert_suppression import alert_suppressor, SUPPRESS, ESCALATE
+from app.services.alert_confirmation import alert_confirmer
+from app.services.alert_rules import alert_rule_engine
+from app.services.recipient_directory import recipient_directory
+from app.services.alert_escalation import alert_escalation
 # 延迟导入避免循环依赖
 def get_websocket_manager():
     from app.services.websocket_manager import websocket_manager
@@ -15,6 +23,15 @@ def get_websocket_manager():
 
 logger = logging.getLogger(__name__)
 
+# 未执行 severity_rank 迁移时的严重程度排序表达式（与 scripts/add_alert_severity_rank.py 一致）
+SEVERITY_RANK_SQL = """CASE a.severity
+                         WHEN 'critical' THEN 4
+                         WHEN 'high' THEN 3
+                         WHEN 'medium' THEN 2
+                         WHEN 'low' THEN 1
+                         ELSE 0
+                       END"""
+
 
 class AlertService:
     """告警服务"""
@@ -36,6 +53,11 @@ class AlertService:
             "message_template": "患者{patient_name}离床超过{duration}分钟，请关注",
             "auto_notify": True
         },
+        "prolonged_bed": {
+            "severity": "medium",
+            "message_template": "患者{patient_name}已连续卧床{duration}小时，请协助翻身或活动",
+            "auto_notify": True
+        },
         "abnormal_activity": {
             "severity": "high",
             "message_template": "患者{patient_name}检测到异常活动：{description}",
@@ -78,15 +100,26 @@ class AlertService:
         }
     }
     
+    # alerts 表是否已有 severity_rank 字段（首次查询家属端列表时检查）
+    _has_severity_rank: Optional[bool] = None
+    # 是否已有触发器维护的 alert_counters 表（首次读取计数时检查）
+    _has_alert_counters: Optional[bool] = None
+    
     async def check_and_create_alert(
         self,
         patient_id: str,
         camera_id: Optional[str],
         analysis_result_id: str,
         analysis_data: Dict,
-        image_url: Optional[str] = None
+        image_url: Optional[str] = None,
+        detection_modes: Optional[List[str]] = None
     ):
-        """检查分析结果并创建告警"""
+        """
+        检查分析结果并创建告警
+        
+        Args:
+            detection_modes: 本帧检测的模式（用于时间确认窗口，None表示全部）
+        """
         try:
             # 获取患者信息
             patient_info = await self._get_patient_info(patient_id)
@@ -110,45 +143,112 @@ class AlertService:
             
             logger.info(f"🔍 [告警服务] 分析结果: alert_type={alert_type}, alert_info={alert_info.get('title', '无') if alert_info else '无'}")
             
+            # 时间确认窗口：需要多帧确认的告警类型在确认前不创建告警
+            confirmed = alert_confirmer.observe(patient_id, alert_type, detection_modes, alert_info.get("severity"))
             if not alert_type:
                 logger.info(f"ℹ️ [告警服务] 无需告警，返回")
                 return  # 无需告警
+            if not confirmed:
+                return
             
-            # 创建告警记录
-            logger.info(f"📝 [告警服务] 准备创建告警记录: alert_type={alert_type}, title={alert_info.get('title')}, severity={alert_info.get('severity')}")
-            alert_id = await self._create_alert_record(
-                patient_id=patient_id,
-                camera_id=camera_id,
-                analysis_result_id=analysis_result_id,
-                alert_type=alert_type,
-                severity=alert_info["severity"],
-                title=alert_info["title"],
-                description=alert_info["description"],
-                image_url=image_url
-            )
-            logger.info(f"✅ [告警服务] 告警记录已创建: alert_id={alert_id}, alert_type={alert_type}, title={alert_info.get('title')}")
-            
-            # 触发通知
-            if alert_info.get("auto_notify"):
-                logger.info(f"📢 [告警服务] 触发通知推送: alert_id={alert_id}")
-                await self._trigger_notifications(
-                    alert_id=alert_id,
-                    patient_id=patient_id,
-                    severity=alert_info["severity"],
-                    message=alert_info["message"],
-                    patient_message=alert_info.get("patient_message"),  # 患者端友好消息
-                    play_music=alert_info.get("play_music", False),  # 是否播放音乐
-                    alert_type=alert_type  # 告警类型
-                )
-                logger.info(f"✅ [告警服务] 通知推送完成")
-            
-            logger.info(f"✅ [告警服务] 告警创建完成: alert_id={alert_id} ({alert_type}) - {alert_info.get('title')}")
+            await self._raise_alert(patient_id, camera_id, analysis_result_id, alert_type, alert_info, image_url, patient_info)
             
         except Exception as e:
             logger.error(f"❌ 创建告警失败: {e}")
             import traceback
             traceback.print_exc()
     
+    async def _raise_alert(
+        self,
+        patient_id: str,
+        camera_id: Optional[str],
+        analysis_result_id: Optional[str],
+        alert_type: str,
+        alert_info: Dict,
+        image_url: Optional[str] = None,
+        patient_info: Optional[Dict] = None
+    ):
+        """创建（或累加、升级）告警记录并触发通知（patient_info 为调用方已查询的患者信息）"""
+        # 抑制窗口内的同类告警只累加到原告警；严重程度升高时升级原告警
+        async with alert_suppressor.lock(patient_id, alert_type):
+            decision, state = alert_suppressor.check(patient_id, alert_type, alert_info["severity"])
+            if decision == SUPPRESS and await alert_suppressor.record_repeat(state):
+                logger.info(f"🔕 [告警服务] 抑制重复告警: alert_id={state.alert_id}, alert_type={alert_type}, 出现次数={state.count}")
+                return
+            if decision == ESCALATE and await alert_suppressor.record_repeat(
+                state, severity=alert_info["severity"], title=alert_info["title"], description=alert_info["description"]
+            ):
+                alert_id = state.alert_id
+                logger.warning(f"⏫ [告警服务] 告警升级: alert_id={alert_id}, alert_type={alert_type}, severity={alert_info['severity']}")
+                # 按新的严重程度重新开始未确认升级计时
+                alert_escalation.schedule(alert_id, patient_id, alert_type, alert_info["severity"])
+            else:
+                # 创建告警记录
+                logger.info(f"📝 [告警服务] 准备创建告警记录: alert_type={alert_type}, title={alert_info.get('title')}, severity={alert_info.get('severity')}")
+                alert_id = await self._create_alert_record(
+                    patient_id=patient_id,
+                    camera_id=camera_id,
+                    analysis_result_id=analysis_result_id,
+                    alert_type=alert_type,
+                    severity=alert_info["severity"],
+                    title=alert_info["title"],
+                    description=alert_info["description"],
+                    image_url=image_url
+                )
+                alert_suppressor.opened(patient_id, alert_type, alert_id, alert_info["severity"])
+                alert_escalation.schedule(alert_id, patient_id, alert_type, alert_info["severity"])
+                logger.info(f"✅ [告警服务] 告警记录已创建: alert_id={alert_id}, alert_type={alert_type}, title={alert_info.get('title')}")
+        
+        # 触发通知
+        if alert_info.get("auto_notify"):
+            logger.info(f"📢 [告警服务] 触发通知推送: alert_id={alert_id}")
+            await self._trigger_notifications(
+                alert_id=alert_id,
+                patient_id=patient_id,
+                severity=alert_info["severity"],
+                message=alert_info["message"],
+                patient_message=alert_info.get("patient_message"),  # 患者端友好消息
+                play_music=alert_info.get("play_music", False),  # 是否播放音乐
+                alert_type=alert_type,  # 告警类型
+                patient_info=patient_info
+            )
+            logger.info(f"✅ [告警服务] 通知推送完成")
+        
+        logger.info(f"✅ [告警服务] 告警创建完成: alert_id={alert_id} ({alert_type}) - {alert_info.get('title')}")
+    
+    async def create_duration_alert(
+        self,
+        patient_id: str,
+        camera_id: Optional[str],
+        analysis_result_id: Optional[str],
+        alert_type: str,
+        duration_seconds: float
+    ):
+        """离床超时/长时间卧床告警（由在床状态跟踪的定时器触发）"""
+        try:
+            patient_info = await self._get_patient_info(patient_id)
+            if not patient_info:
+                logger.error(f"患者不存在: {patient_id}")
+                return
+            patient_name = patient_info.get("full_name", "患者")
+            rule = self.ALERT_RULES[alert_type]
+            if alert_type == "bed_exit_timeout":
+                duration = int(duration_seconds // 60)
+                title, description = "离床超时", f"患者已离床{duration}分钟"
+            else:
+                duration = round(duration_seconds / 3600, 1)
+                title, description = "长时间卧床", f"患者已连续卧床{duration}小时"
+            logger.warning(f"⏰ [告警服务] {description}: {patient_name} ({alert_type})")
+            await self._raise_alert(patient_id, camera_id, analysis_result_id, alert_type, {
+                "severity": rule["severity"],
+                "title": title,
+                "description": description,
+                "message": rule["message_template"].format(patient_name=patient_name, duration=duration),
+                "auto_notify": rule["auto_notify"]
+            }, patient_info=patient_info)
+        except Exception as e:
+            logger.error(f"❌ 创建{alert_type}告警失败: {e}")
+    
     def _get_patient_address(self, age: Optional[int], gender: Optional[str], analysis_data: Optional[Dict] = None) -> str:
         """
         根据年龄和性别生成称呼（爷爷/奶奶）
@@ -202,262 +302,24 @@ class AlertService:
     
     def _analyze_detections(self, analysis_data: Dict, patient_name: str, patient_address: str = "您") -> tuple:
         """分析检测结果，返回告警类型和信息
-        优先级顺序（从高到低）：
+        判断规则见 alert_rules.json（按优先级从高到低）：
         1. 生命体征异常（心跳变平、心跳变缓等）- 最高优先级
         2. 跌倒检测
         3. 吊瓶监测（完全空、袋子空）
         4. 面色紫绀（缺氧）
         5. 异常活动
         6. 痛苦表情
-        7. 离床检测（最低优先级，避免与其他检测混淆）
+        
+        离床超时、长时间卧床需要跨帧计时，由 bed_occupancy_tracker 根据每帧的 patient_in_bed 计时后触发
         """
         detections = analysis_data.get("detections", {})
-        
-        logger.info(f"🔍 [告警分析] 开始分析检测结果 - 患者: {patient_name}")
-        logger.info(f"🔍 [告警分析] 检测到的项目: {list(detections.keys())}")
-        
-        # ========== 优先级1: 生命体征监测（最高优先级，必须最先检查）==========
-        vital_signs = detections.get("vital_signs", {})
-        logger.info(f"🔍 [告警分析] 检查生命体征监测: detected={vital_signs.get('detected')}, heart_rate_flat={vital_signs.get('heart_rate_flat')}, critical_life_threat={vital_signs.get('critical_life_threat')}")
-        if vital_signs.get("detected"):
-            # 优先级1.1: 心跳变平（濒临死亡）- 最高优先级
-            if vital_signs.get("heart_rate_flat") or vital_signs.get("critical_life_threat"):
-                description = vital_signs.get("description", "心跳监护仪显示直线，病人可能濒临死亡")
-                logger.warning(f"🚨 [告警分析] 检测到心跳变平！优先级1 - 返回 heart_rate_flat 告警")
-                logger.info(f"🚨 [告警分析] 心跳变平详情: description={description}")
-                # 生命体征异常：不打扰患者，播放温柔音乐
-                return "heart_rate_flat", {
-                    "severity": "critical",
-                    "title": "心跳变平 - 濒临死亡",
-                    "description": description,
-                    "message": f"患者{patient_name}心跳变平（直线），可能濒临死亡！需要立即通知家属到现场进行救护和临终陪伴！",
-                    "patient_message": None,  # 生命体征异常不显示消息给患者，只播放音乐
-                    "play_music": True,  # 播放温柔音乐，不打扰
-                    "auto_notify": True,
-                    "requires_phone_call": True,
-                    "requires_family_notification": True
-                }
-            
-            # 优先级1.2: 其他生命体征异常
-            if (vital_signs.get("heart_rate_slow") or 
-                vital_signs.get("oxygen_low") or 
-                vital_signs.get("respiration_abnormal") or
-                vital_signs.get("blood_pressure_abnormal")):
-                description = vital_signs.get("description", "生命体征异常")
-                logger.warning(f"🚨 [告警分析] 检测到生命体征异常！优先级1 - 返回 vital_signs_critical 告警")
-                # 生命体征异常：不打扰患者，播放温柔音乐
-                return "vital_signs_critical", {
-                    "severity": "critical",
-                    "title": "生命体征异常",
-                    "description": description,
-                    "message": f"患者{patient_name}生命体征异常：{description}，需要立即处理！",
-                    "patient_message": None,  # 生命体征异常不显示消息给患者，只播放音乐
-                    "play_music": True,  # 播放温柔音乐，不打扰
-                    "auto_notify": True,
-                    "requires_phone_call": False
-                }
-        
-        logger.info(f"🔍 [告警分析] 生命体征监测检查完成，未发现异常")
-        
-        # ========== 优先级2: 跌倒检测 ==========
-        if detections.get("fall", {}).get("detected"):
-            fall_desc = detections["fall"].get("description", "检测到患者跌倒")
-            # 确保描述是中文
-            if not any('\u4e00' <= char <= '\u9fff' for char in fall_desc):
-                # 如果描述是英文，翻译成中文
-                fall_desc = fall_desc.replace("Patient is on the floor", "患者在地面上")
-                fall_desc = fall_desc.replace("near the nurse station", "靠近护士站")
-                fall_desc = fall_desc.replace("indicating a fall", "表明跌倒")
-                fall_desc = fall_desc.replace("Possible head trauma", "可能头部受伤")
-                fall_desc = fall_desc.replace("lying motionless", "躺着一动不动")
-                fall_desc = fall_desc.replace("on the floor", "在地面上")
-            
-            # 患者友好的消息：使用称呼（爷爷/奶奶）而不是姓名
-            patient_message = f"{patient_address}，您摔倒了，我已经发信息给您亲属。如果您还需要呼叫120，请您回复我。"
-            
-            return "fall_detected", {
-                "severity": "critical",
-                "title": "跌倒检测",
-                "description": fall_desc,
-                "message": f"患者{patient_name}检测到跌倒，请立即查看！",
-                "patient_message": patient_message,  # 患者端友好消息
-                "auto_notify": True
-            }
-        
-        # ========== 优先级3: 吊瓶监测 ==========
-        iv_drip = detections.get("iv_drip", {})
-        fluid_level = iv_drip.get("fluid_level", "")
-        description = iv_drip.get("description", "")
-        logger.info(f"🔍 [告警分析] 检查吊瓶监测: detected={iv_drip.get('detected')}, fluid_level={fluid_level}, completely_empty={iv_drip.get('completely_empty')}, bag_empty={iv_drip.get('bag_empty')}")
-        
-        # 优先级1: 完全空了 - 需要电话呼叫
-        if iv_drip.get("completely_empty") or fluid_level == "已打完":
-            patient_message = f"{patient_address}，您的吊液已完全输完，我已经通知亲属，请您立即联系护士更换。"
-            return "iv_drip_completely_empty", {
-                "severity": "critical",
-                "title": "吊瓶完全空",
-                "description": "吊瓶完全空了，需要立即电话呼叫护士",
-                "message": f"患者{patient_name}吊瓶完全空了，需要立即电话呼叫护士！",
-                "patient_message": patient_message,  # 患者端友好消息
-                "auto_notify": True,
-                "requires_phone_call": True
-            }
-        
-        # 优先级2: 袋子/玻璃瓶空（紧急警告）
-        # 关键判断：如果液体已经流到滴液管，但袋子/玻璃瓶上半部分已空，这是危险情况
-        # 1. 明确标记了袋子空
-        # 2. fluid_level是"袋子空"
-        # 3. 检测到"半满" - 根据我们的提示词，如果袋子/玻璃瓶上半部分还有液体，应该显示"满"或"接近打完"
-        #    如果显示"半满"，很可能意味着上半部分已经空了，液体已经流到滴液管
-        # 4. 描述中提到袋子空、上半部分空、滴液管等关键词
-        bag_empty_indicators = [
-            iv_drip.get("bag_empty"),
-            iv_drip.get("needs_emergency_alert"),
-            fluid_level == "袋子空",
-            # 如果显示"半满"，很可能是袋子空的情况（因为如果袋子还有液体，应该显示"满"）
-            fluid_level == "半满",
-            # 描述中提到的危险关键词
-            "空" in description if description else False,
-            "上半部分" in description if description else False,
-            "滴液管" in description if description else False,
-            "静脉滴注" in description if description else False
-        ]
-        
-        if any(bag_empty_indicators):
-            # 患者友好的消息：高情商提醒，使用称呼
-            patient_message = f"{patient_address}，您的吊液快输完了，我已经通知亲属，您可主动联系护士，避免耽误换液。"
-            return "iv_drip_bag_empty", {
-                "severity": "critical",
-                "title": "吊瓶袋子空",
-                "description": "吊瓶袋子/玻璃瓶已空，液体已流到滴液管，需要立即紧急处理",
-                "message": f"患者{patient_name}吊瓶袋子/玻璃瓶已空，液体已流到滴液管，需要立即紧急处理！请立即联系护士！",
-                "patient_message": patient_message,  # 患者端友好消息
-                "auto_notify": True,
-                "requires_phone_call": False
-            }
-        
-        # 优先级3: 需要更换（一般情况）
-        if iv_drip.get("needs_replacement"):
-            patient_message = f"{patient_address}，您的吊液快输完了，我已经通知亲属，您可主动联系护士，避免耽误换液。"
-            return "iv_drip_empty", {
-                "severity": "medium",
-                "title": "输液监测",
-                "description": "输液即将完成或已打完",
-                "message": f"患者{patient_name}输液即将完成，请准备更换",
-                "patient_message": patient_message,  # 患者端友好消息
-                "auto_notify": True
-            }
-        
-        # ========== 优先级4: 皮肤异常检测（包括面色紫绀和其他皮肤异常）==========
-        facial = detections.get("facial_analysis", {})
-        # 支持中英文肤色值
-        skin_color = facial.get("skin_color", "")
-        description = facial.get("description", "")
-        
-        # 检测皮肤异常的关键词
-        skin_abnormal_keywords = ["紫红色", "紫蓝色", "深红色", "青紫色", "瘀斑", "紫癜", "皮疹", "斑块", "病变", "异常"]
-        
-        # 检查是否为皮肤异常
-        is_skin_abnormal = (
-            skin_color in ["紫绀", "cyanotic", "异常", "abnormal"] or
-            any(keyword in description for keyword in skin_abnormal_keywords if description)
-        )
-        
-        if is_skin_abnormal:
-            # 根据描述判断严重程度
-            critical_keywords = ["紫绀", "紫红色", "紫蓝色", "深红色", "严重", "立即", "紧急"]
-            is_critical = any(keyword in description for keyword in critical_keywords if description) or skin_color in ["紫绀", "cyanotic"]
-            
-            severity = "critical" if is_critical else "high"
-            title = "皮肤异常" if skin_color == "异常" else "面色异常"
-            
-            # 生成详细描述
-            if description and len(description) > 20:
-                detail_desc = description[:200]  # 限制长度
-            else:
-                detail_desc = "患者皮肤出现异常，需要立即关注"
-            
-            return "facial_cyanotic", {
-                "severity": severity,
-                "title": title,
-                "description": detail_desc,
-                "message": f"患者{patient_name}检测到皮肤异常：{detail_desc[:100]}，请立即处理！",
-                "auto_notify": True
-            }
-        
-        # ========== 优先级5: 异常活动 ==========
-        activity = detections.get("activity", {})
-        if activity.get("abnormal"):
-            return "abnormal_activity", {
-                "severity": "high",
-                "title": "活动异常",
-                "description": activity.get("description", "检测到异常活动"),
-                "message": f"患者{patient_name}检测到异常活动：{activity.get('description', '异常活动')}",
-                "auto_notify": True
-            }
-        
-        # ========== 优先级6: 异常情绪/表情 ==========
-        expression = facial.get("expression", "")
-        
-        # 如果expression为null或"无法判断"，说明未检测到人脸，跳过表情分析
-        if expression in [None, "null", "无法判断", "N/A", ""]:
-            logger.info(f"🔍 [告警分析] 跳过表情分析：未检测到人脸 (expression={expression})")
+        logger.info(f"🔍 [告警分析] 开始分析检测结果 - 患者: {patient_name}, 检测到的项目: {list(detections.keys())}")
+        alert_type, alert_info = alert_rule_engine.evaluate(detections, patient_name, patient_address)
+        if alert_type:
+            logger.warning(f"🚨 [告警分析] 命中告警规则: {alert_type} ({alert_info.get('severity')}) - {alert_info.get('title')}")
         else:
-            # 支持中英文情绪值
-            negative_emotions = ["痛苦", "pain", "恐惧", "fear", "焦虑", "anxiety", 
-                                "担忧", "worried", "沮丧", "depressed", "悲伤", "sad"]
-            
-            if expression in negative_emotions:
-                # 根据情绪类型生成不同的告警消息
-                emotion_messages = {
-                    "痛苦": "表现出痛苦表情",
-                    "pain": "表现出痛苦表情",
-                    "恐惧": "表现出恐惧表情",
-                    "fear": "表现出恐惧表情",
-                    "焦虑": "表现出焦虑表情",
-                    "anxiety": "表现出焦虑表情",
-                    "担忧": "表现出担忧表情，情绪异常",
-                    "worried": "表现出担忧表情，情绪异常",
-                    "沮丧": "表现出沮丧表情，情绪低落",
-                    "depressed": "表现出沮丧表情，情绪低落",
-                    "悲伤": "表现出悲伤表情，情绪低落",
-                    "sad": "表现出悲伤表情，情绪低落"
-                }
-                
-                emotion_desc = emotion_messages.get(expression, "情绪异常")
-                # 痛苦、恐惧、焦虑为中等优先级，担忧、沮丧、悲伤为低优先级但需要关注
-                severity = "medium" if expression in ["痛苦", "pain", "恐惧", "fear", "焦虑", "anxiety"] else "low"
-                
-                logger.info(f"🔍 [告警分析] 检测到异常情绪: expression={expression}, severity={severity}")
-                
-                return "facial_pain", {
-                    "severity": severity,
-                    "title": "表情异常",
-                    "description": f"患者{emotion_desc}",
-                    "message": f"患者{patient_name}{emotion_desc}，请关注",
-                    "auto_notify": True
-                }
-        
-        # ========== 优先级7: 离床检测（最低优先级，避免与其他检测混淆）==========
-        bed_exit = detections.get("bed_exit", {})
-        patient_in_bed = bed_exit.get("patient_in_bed")
-        logger.info(f"🔍 [告警分析] 检查离床检测: patient_in_bed={patient_in_bed} (类型: {type(patient_in_bed).__name__})")
-        # 只有当patient_in_bed明确为False时才触发离床告警，None或True都不触发
-        if patient_in_bed is False:
-            # 这里简化处理，实际应该查询历史记录判断离床时长
-            logger.info(f"⚠️ [告警分析] 检测到离床！优先级7 - 返回 bed_exit_timeout 告警（注意：如果同时有其他检测，应优先其他检测）")
-            return "bed_exit_timeout", {
-                "severity": "high",
-                "title": "离床检测",
-                "description": "患者已离床",
-                "message": f"患者{patient_name}已离床，请关注",
-                "auto_notify": True
-            }
-        else:
-            logger.info(f"🔍 [告警分析] 离床检测：patient_in_bed={patient_in_bed}，不触发离床告警")
-        
-        logger.info(f"🔍 [告警分析] 所有检测项目检查完成，未发现需要告警的情况")
-        return None, {}
+            logger.info(f"🔍 [告警分析] 所有检测项目检查完成，未发现需要告警的情况")
+        return alert_type, alert_info
     
     async def _create_alert_record(
         self,
@@ -518,12 +380,18 @@ class AlertService:
         message: str,
         patient_message: Optional[str] = None,
         play_music: bool = False,
-        alert_type: Optional[str] = None
+        alert_type: Optional[str] = None,
+        patient_info: Optional[Dict] = None
     ):
-        """触发通知推送"""
+        """
+        触发通知推送
+        
+        接收人一次查询得到，通知记录一个事务批量写入，各接收人的WebSocket推送并发进行（单个接收人超时不影响其他人）
+        """
         try:
+            if patient_info is None:
+                patient_info = await self._get_patient_info(patient_id)
             # 获取患者信息用于生成家属端萌童消息
-            patient_info = await self._get_patient_info(patient_id)
             patient_name = patient_info.get("full_name", "您的家人") if patient_info else "您的家人"
             
             # 为家属端生成萌童声音消息（简洁明了但包含关键信息）
@@ -533,65 +401,35 @@ class AlertService:
                 severity=severity
             )
             
-            # 获取需要通知的用户（护士和家属）
-            recipients = await self._get_notification_recipients(patient_id)
-            
-            # 创建通知记录
-            notification_tasks = []
-            for recipient in recipients:
-                notification_id = await self._create_notification(
-                    alert_id=alert_id,
-                    recipient_user_id=recipient["user_id"],
-                    channel="websocket",
-                    title="病房监护预警",
-                    message=message
-                )
-                
-                # WebSocket推送（家属端包含萌童声音消息）
-                ws_manager = get_websocket_manager()
-                await ws_manager.send_to_user(
-                    recipient["user_id"],
-                    {
-                        "type": "alert",
-                        "alert_id": alert_id,
-                        "notification_id": notification_id,
-                        "patient_id": patient_id,
-                        "severity": severity,
-                        "title": "病房监护预警",
-                        "message": message,
-                        "alert_type": alert_type,
-                        "family_voice_message": family_voice_message,  # 家属端萌童声音消息
-                        "use_child_voice": True,  # 使用萌童声音
-                        "timestamp": datetime.now().isoformat()
-                    }
-                )
-            
-            logger.info(f"✅ 已推送通知给 {len(recipients)} 个用户")
+            # 获取需要通知的用户（家属、护士）和患者本人的用户
+            recipients, patient_user_id = await self._get_notification_recipients(patient_id)
             
-            # 发送患者端通知（所有告警都应该推送给患者自己）
-            # 查找患者用户（通过patient_id关联，但排除在patient_guardians表中作为guardian_user_id的用户）
-            # 患者用户：有patient_id，但不在patient_guardians表中作为guardian_user_id
-            patient_users = await execute_query(
-                """SELECT u.user_id 
-                   FROM users u
-                   WHERE u.patient_id = ? 
-                     AND u.is_active = 1
-                     AND u.user_id NOT IN (
-                         SELECT guardian_user_id 
-                         FROM patient_guardians 
-                         WHERE patient_id = ?
-                     )""",
-                (patient_id, patient_id)
+            # 批量创建通知记录，WebSocket推送（家属端包含萌童声音消息）
+            timestamp = datetime.now().isoformat()
+            sends = await self._notification_sends(
+                alert_id,
+                [recipient["user_id"] for recipient in recipients],
+                "病房监护预警",
+                message,
+                {
+                    "type": "alert",
+                    "alert_id": alert_id,
+                    "patient_id": patient_id,
+                    "severity": severity,
+                    "title": "病房监护预警",
+                    "message": message,
+                    "alert_type": alert_type,
+                    "family_voice_message": family_voice_message,  # 家属端萌童声音消息
+                    "use_child_voice": True,  # 使用萌童声音
+                    "timestamp": timestamp
+                }
             )
             
-            if patient_users:
-                patient_user_id = patient_users[0]['user_id']
-                ws_manager = get_websocket_manager()
-                
+            # 发送患者端通知（所有告警都应该推送给患者自己）
+            if patient_user_id:
                 # 如果没有提供患者消息，使用默认消息
                 if patient_message is None:
-                    # 获取患者信息以生成合适的称呼
-                    patient_info = await self._get_patient_info(patient_id)
+                    # 根据患者信息生成合适的称呼
                     patient_address = "您"
                     if patient_info:
                         patient_address = self._get_patient_address(
@@ -624,7 +462,7 @@ class AlertService:
                     "severity": severity,
                     "message": patient_message,  # 患者友好的消息（包含"爷爷"等称呼）
                     "play_music": play_music,  # 是否播放音乐
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": timestamp
                 }
                 
                 logger.info(f"📢 [告警服务] ========== 发送患者端告警消息 ==========")
@@ -636,67 +474,99 @@ class AlertService:
                 logger.info(f"📢 [告警服务] 严重程度: {severity}")
                 logger.info(f"📢 [告警服务] 完整消息内容: {json.dumps(patient_alert_message, ensure_ascii=False)}")
                 logger.info(f"📢 [告警服务] ==========================================")
-                
-                # 发送患者端告警消息
-                await ws_manager.send_to_user(
-                    patient_user_id,
-                    patient_alert_message
-                )
-                logger.info(f"✅ [告警服务] 已推送患者端告警消息到WebSocket")
+                sends.append(self._send_with_timeout(patient_user_id, patient_alert_message))
             else:
                 logger.warning(f"⚠️ [告警服务] 未找到患者用户 (patient_id={patient_id})，无法发送患者端通知")
             
+            results = await asyncio.gather(*sends)
+            logger.info(f"✅ 已推送通知给 {len(recipients)} 个用户{'和患者本人' if patient_user_id else ''}，"
+                        f"在线送达 {sum(1 for delivered in results if delivered)}/{len(results)}")
+            
         except Exception as e:
             logger.error(f"❌ 触发通知失败: {e}")
     
-    async def _get_notification_recipients(self, patient_id: str) -> List[Dict]:
-        """获取需要通知的用户列表"""
-        # 获取关联的家属
-        guardians = await execute_query(
-            """SELECT u.user_id, u.role 
-               FROM patient_guardians pg
-               JOIN users u ON pg.guardian_user_id = u.user_id
-               WHERE pg.patient_id = ? AND u.is_active = 1""",
-            (patient_id,)
-        )
+    async def notify_users(self, alert_id: str, user_ids: List[str], title: str, message: str, payload: Dict) -> int:
+        """
+        通知指定用户（告警升级等）：通知记录批量写入，WebSocket并发推送
         
-        # 获取所有护士
-        nurses = await execute_query(
-            "SELECT user_id, role FROM users WHERE role = 'nurse' AND is_active = 1"
-        )
+        Args:
+            payload: 推送的消息内容（每个用户附加各自的 notification_id）
         
-        # 合并列表
-        recipients = guardians + nurses
+        Returns:
+            在线送达的用户数
+        """
+        sends = await self._notification_sends(alert_id, user_ids, title, message, payload)
+        results = await asyncio.gather(*sends)
+        return sum(1 for delivered in results if delivered)
+    
+    async def _notification_sends(self, alert_id: str, user_ids: List[str], title: str, message: str, payload: Dict) -> list:
+        """批量创建通知记录，返回各用户的推送协程（由调用方并发执行）"""
+        notification_ids = await self._create_notifications(
+            alert_id=alert_id,
+            recipient_user_ids=user_ids,
+            channel="websocket",
+            title=title,
+            message=message
+        )
+        return [
+            self._send_with_timeout(user_id, {**payload, "notification_id": notification_id})
+            for user_id, notification_id in zip(user_ids, notification_ids)
+        ]
+    
+    async def _send_with_timeout(self, user_id: str, message: Dict) -> bool:
+        """推送给单个用户（超时或失败返回False，不抛出异常）"""
+        try:
+            return bool(await asyncio.wait_for(
+                get_websocket_manager().send_to_user(user_id, message),
+                timeout=settings.notification_send_timeout_seconds
+            ))
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ [告警服务] 推送超时 - 用户: {user_id}, 超时: {settings.notification_send_timeout_seconds}秒")
+        except Exception as e:
+            logger.error(f"❌ [告警服务] 推送失败 - 用户: {user_id}, 错误: {e}")
+        return False
+    
+    async def _get_notification_recipients(self, patient_id: str) -> tuple:
+        """
+        获取需要通知的用户（接收人目录缓存命中时不查询数据库）
         
-        return recipients
+        Returns:
+            (家属和护士列表（按用户去重）, 患者本人的用户ID或None)
+        """
+        patient = await recipient_directory.get_patient(patient_id)
+        nurses = await recipient_directory.get_nurses()
+        
+        recipients = []
+        seen = set()
+        for user in patient.guardians + nurses:
+            if user["user_id"] not in seen:
+                # 既是家属又是护士的用户只通知一次
+                seen.add(user["user_id"])
+                recipients.append({"user_id": user["user_id"], "role": user["role"]})
+        return recipients, patient.patient_user_id
     
-    async def _create_notification(
+    async def _create_notifications(
         self,
         alert_id: str,
-        recipient_user_id: str,
+        recipient_user_ids: List[str],
         channel: str,
         title: str,
         message: str
-    ) -> str:
-        """创建通知记录"""
-        notification_id = str(uuid.uuid4())
+    ) -> List[str]:
+        """批量创建通知记录（一个事务），返回与接收人顺序对应的通知ID"""
+        notification_ids = [str(uuid.uuid4()) for _ in recipient_user_ids]
         
-        await execute_insert(
+        await execute_many(
             """INSERT INTO notifications 
                (notification_id, alert_id, recipient_user_id, channel, title, message, status)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (
-                notification_id,
-                alert_id,
-                recipient_user_id,
-                channel,
-                title,
-                message,
-                "sent"
-            )
+            [
+                (notification_id, alert_id, recipient_user_id, channel, title, message, "sent")
+                for notification_id, recipient_user_id in zip(notification_ids, recipient_user_ids)
+            ]
         )
         
-        return notification_id
+        return notification_ids
     
     def _generate_family_voice_message(
         self,
@@ -720,6 +590,7 @@ class AlertService:
             "abnormal_activity": f"主人主人，{patient_name}有异常活动，请您关注一下。",
             "facial_pain": f"主人主人，{patient_name}好像有些不舒服，表情看起来有点痛苦。",
             "bed_exit_timeout": f"主人主人，{patient_name}离开病床有一段时间了，请您关注一下。",
+            "prolonged_bed": f"主人主人，{patient_name}已经躺了很久了，护士会帮忙翻身活动的。",
         }
         
         # 获取对应的消息，如果没有匹配的类型，使用默认消息
@@ -751,6 +622,7 @@ class AlertService:
                    WHERE alert_id = ? AND status = 'pending'""",
                 (user_id, datetime.now(), alert_id)
             )
+            alert_escalation.cancel(alert_id)
             logger.info(f"✅ 告警已确认: {alert_id}")
             return True
         except Exception as e:
@@ -771,12 +643,52 @@ class AlertService:
                    WHERE alert_id = ?""",
                 (user_id, datetime.now(), resolution_notes, alert_id)
             )
+            alert_suppressor.closed(alert_id)
+            alert_escalation.cancel(alert_id)
             logger.info(f"✅ 告警已处理: {alert_id}")
             return True
         except Exception as e:
             logger.error(f"❌ 处理告警失败: {e}")
             return False
     
+    async def get_pending_counts(self, patient_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """
+        未处理（pending）告警计数
+        
+        Args:
+            patient_id: 只统计该患者；None 表示所有有未处理告警的患者
+            
+        Returns:
+            {patient_id: {"total": n, "critical": n, "high": n, "medium": n, "low": n}}
+        """
+        if self._has_alert_counters is None:
+            tables = await execute_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'alert_counters'"
+            )
+            self._has_alert_counters = bool(tables)
+            if not self._has_alert_counters:
+                logger.warning("⚠️ 缺少alert_counters表，未处理告警数改为实时统计（请执行 scripts/add_alert_counters.py）")
+        
+        if self._has_alert_counters:
+            # 触发器随告警写入在同一事务内维护，按主键读取
+            query = "SELECT patient_id, severity, pending_count AS count FROM alert_counters WHERE pending_count > 0"
+            group_by = ""
+        else:
+            query = "SELECT patient_id, severity, COUNT(*) AS count FROM alerts WHERE status = 'pending'"
+            group_by = " GROUP BY patient_id, severity"
+        params = []
+        if patient_id:
+            query += " AND patient_id = ?"
+            params.append(patient_id)
+        
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in await execute_query(query + group_by, tuple(params)):
+            patient_counts = counts.setdefault(row["patient_id"], {"total": 0, "critical": 0, "high": 0, "medium": 0, "low": 0})
+            severity = row["severity"] or "medium"
+            patient_counts[severity] = patient_counts.get(severity, 0) + row["count"]
+            patient_counts["total"] += row["count"]
+        return counts
+    
     async def get_alerts(
         self,
         patient_id: Optional[str] = None,
@@ -785,6 +697,29 @@ class AlertService:
         limit: int = 50
     ) -> List[Dict]:
         """获取告警列表"""
+        results, _ = await self.get_alerts_page(patient_id, status, severity, limit)
+        return results
+    
+    async def get_alerts_page(
+        self,
+        patient_id: Optional[str] = None,
+        status: Optional[str] = None,
+        severity: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按创建时间倒序分页获取告警列表（游标分页）
+        
+        Args:
+            cursor: 上一页返回的游标，None 表示第一页
+            
+        Returns:
+            (告警列表, 下一页游标)，没有更多数据时游标为 None
+            
+        Raises:
+            ValueError: 游标无效
+        """
         query = "SELECT * FROM alerts WHERE 1=1"
         params = []
         
@@ -800,12 +735,91 @@ class AlertService:
             query += " AND severity = ?"
             params.append(severity)
         
-        query += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
+        if cursor:
+            created_at, alert_id = decode_cursor(cursor, "time", 2)
+            query += " AND (created_at, alert_id) < (?, ?)"
+            params.extend((created_at, alert_id))
+        
+        # 多取一条判断是否还有下一页
+        query += " ORDER BY created_at DESC, alert_id DESC LIMIT ?"
+        params.append(limit + 1)
         
         results = await execute_query(query, tuple(params))
-        return results
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            next_cursor = encode_cursor("time", [last["created_at"], last["alert_id"]])
+        return results, next_cursor
+    
+    async def get_family_alerts_page(
+        self,
+        patient_id: str,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        家属端告警列表：严重程度高的在前，同级按创建时间倒序（游标分页）
+        
+        Returns:
+            (告警列表（含 analysis_image_url）, 下一页游标)
+            
+        Raises:
+            ValueError: 游标无效
+        """
+        rank = await self._severity_rank_expr()
+        query = f"""SELECT a.*, {rank} AS sort_rank, ar.image_url as analysis_image_url
+                    FROM alerts a
+                    LEFT JOIN ai_analysis_results ar ON a.analysis_result_id = ar.result_id
+                    WHERE a.patient_id = ?"""
+        params = [patient_id]
+        
+        if cursor:
+            severity_rank, created_at, alert_id = decode_cursor(cursor, "severity", 3)
+            query += f" AND ({rank}, a.created_at, a.alert_id) < (?, ?, ?)"
+            params.extend((severity_rank, created_at, alert_id))
+        
+        query += f" ORDER BY {rank} DESC, a.created_at DESC, a.alert_id DESC LIMIT ?"
+        params.append(limit + 1)
+        
+        results = await execute_query(query, tuple(params))
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            next_cursor = encode_cursor("severity", [last["sort_rank"], last["created_at"], last["alert_id"]])
+        for row in results:
+            row.pop("sort_rank", None)
+        return results, next_cursor
+    
+    async def _severity_rank_expr(self) -> str:
+        """严重程度排序字段：已执行迁移时用带索引的 severity_rank，否则现算"""
+        if self._has_severity_rank is None:
+            columns = await execute_query("PRAGMA table_info(alerts)")
+            self._has_severity_rank = any(column["name"] == "severity_rank" for column in columns)
+            if not self._has_severity_rank:
+                logger.warning("⚠️ alerts表缺少severity_rank字段，家属端告警列表无法使用索引分页（请执行 scripts/add_alert_severity_rank.py）")
+        if self._has_severity_rank:
+            return "a.severity_rank"
+        return SEVERITY_RANK_SQL
+
+
+def encode_cursor(kind: str, values: List) -> str:
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps([kind, *values], ensure_ascii=False, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
 
+def decode_cursor(cursor: str, kind: str, size: int) -> List:
+    """解析游标，格式不对或不是该列表的游标时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if not isinstance(values, list) or len(values) != size + 1 or values[0] != kind:
+        raise ValueError("无效的分页游标")
+    return values[1:]
 
 # 创建全局实例
 alert_service = AlertService()
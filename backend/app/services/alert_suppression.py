@@ -0,0 +1,192 @@
+"""
+告警去重与抑制
+按 (患者, 告警类型) 维护未处理告警的状态机：抑制窗口内重复出现的同类告警
+只累加原告警的出现次数（occurrence_count）和最后出现时间（last_seen_at），
+不再插入新记录、不再重复推送；严重程度升高时升级原告警并重新通知。
+进程启动时从未处理的告警恢复状态
+"""
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.database import execute_query, execute_update
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3, "critical": 4}
+
+# check() 的判定结果
+NEW = "new"  # 创建新告警
+SUPPRESS = "suppress"  # 累加到原告警
+ESCALATE = "escalate"  # 升级原告警的严重程度并重新通知
+
+
+class OpenAlert:
+    """单个 (患者, 告警类型) 的未处理告警"""
+
+    __slots__ = ("alert_id", "severity", "first_seen", "last_seen", "count")
+
+    def __init__(self, alert_id: str, severity: str, first_seen: float, last_seen: float, count: int = 1):
+        self.alert_id = alert_id
+        self.severity = severity
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.count = count
+
+
+class AlertSuppressor:
+    """告警抑制状态机"""
+
+    def __init__(self):
+        self._open: Dict[Tuple[str, str], OpenAlert] = {}
+        self._by_alert_id: Dict[str, Tuple[str, str]] = {}
+        # 同一 (患者, 告警类型) 的判定和写入串行执行，避免并发帧各自插入一条告警
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.stats = {"opened": 0, "suppressed": 0, "escalated": 0, "expired": 0, "restored": 0}
+
+    @staticmethod
+    def window(alert_type: str) -> float:
+        """告警类型的抑制窗口（秒），0表示不抑制"""
+        return float(settings.alert_suppression_windows.get(alert_type, settings.alert_suppression_window_seconds))
+
+    def lock(self, patient_id: str, alert_type: str) -> asyncio.Lock:
+        key = (patient_id, alert_type)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def check(self, patient_id: str, alert_type: str, severity: str, now: Optional[float] = None) -> Tuple[str, Optional[OpenAlert]]:
+        """
+        判定本次告警如何处理
+
+        Returns:
+            (NEW/SUPPRESS/ESCALATE, 原告警状态)
+        """
+        now = now or time.time()
+        key = (patient_id, alert_type)
+        state = self._open.get(key)
+        if state is None:
+            return NEW, None
+        window = self.window(alert_type)
+        if window <= 0 or now - state.last_seen > window:
+            # 超过窗口未再出现，视为新的一次事件
+            self._drop(key)
+            self.stats["expired"] += 1
+            return NEW, None
+        if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(state.severity, 0):
+            return ESCALATE, state
+        return SUPPRESS, state
+
+    def opened(self, patient_id: str, alert_type: str, alert_id: str, severity: str, now: Optional[float] = None):
+        """记录新创建的告警"""
+        now = now or time.time()
+        key = (patient_id, alert_type)
+        self._drop(key)
+        self._open[key] = OpenAlert(alert_id, severity, now, now)
+        self._by_alert_id[alert_id] = key
+        self.stats["opened"] += 1
+
+    def closed(self, alert_id: str):
+        """告警已处理，之后同类告警重新创建"""
+        key = self._by_alert_id.get(alert_id)
+        if key is not None:
+            self._drop(key)
+
+    def _drop(self, key: Tuple[str, str]):
+        state = self._open.pop(key, None)
+        if state is not None:
+            self._by_alert_id.pop(state.alert_id, None)
+
+    async def record_repeat(self, state: OpenAlert, severity: Optional[str] = None,
+                            title: Optional[str] = None, description: Optional[str] = None) -> bool:
+        """
+        把重复出现的告警累加到原告警（severity 不为空时同时升级严重程度）
+
+        Returns:
+            False 表示原告警已不存在或已处理（调用方应创建新告警）
+        """
+        now = time.time()
+        try:
+            rowcount = await self._update_alert(state.alert_id, severity, title, description)
+        except Exception as e:
+            # 未执行迁移（缺少 occurrence_count/last_seen_at 字段）时只在内存中计数
+            logger.warning(f"⚠️ 更新告警出现次数失败（请执行 scripts/add_alert_occurrence_columns.py）: {e}")
+            rowcount = 1
+        if not rowcount:
+            self.closed(state.alert_id)
+            return False
+        state.last_seen = now
+        state.count += 1
+        if severity:
+            state.severity = severity
+            self.stats["escalated"] += 1
+        else:
+            self.stats["suppressed"] += 1
+        return True
+
+    @staticmethod
+    async def _update_alert(alert_id: str, severity: Optional[str], title: Optional[str], description: Optional[str]) -> int:
+        if severity:
+            return await execute_update(
+                """UPDATE alerts
+                   SET occurrence_count = COALESCE(occurrence_count, 1) + 1, last_seen_at = ?,
+                       severity = ?, title = ?, description = ?
+                   WHERE alert_id = ? AND status IN ('pending', 'acknowledged')""",
+                (datetime.now(), severity, title, description, alert_id)
+            )
+        return await execute_update(
+            """UPDATE alerts
+               SET occurrence_count = COALESCE(occurrence_count, 1) + 1, last_seen_at = ?
+               WHERE alert_id = ? AND status IN ('pending', 'acknowledged')""",
+            (datetime.now(), alert_id)
+        )
+
+    async def restore(self):
+        """从未处理的告警恢复抑制状态（进程重启后不会对同一事件重复告警）"""
+        try:
+            rows = await execute_query(
+                """SELECT * FROM alerts
+                   WHERE status IN ('pending', 'acknowledged')
+                   ORDER BY created_at"""
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 恢复告警抑制状态失败: {e}")
+            return
+        now = time.time()
+        restored = 0
+        for row in rows:
+            window = self.window(row["alert_type"])
+            last_seen = _to_timestamp(row.get("last_seen_at")) or _to_timestamp(row.get("created_at"))
+            if window <= 0 or last_seen is None or now - last_seen > window:
+                continue
+            key = (row["patient_id"], row["alert_type"])
+            self._drop(key)
+            self._open[key] = OpenAlert(
+                row["alert_id"], row["severity"],
+                _to_timestamp(row.get("created_at")) or last_seen, last_seen,
+                row.get("occurrence_count") or 1
+            )
+            self._by_alert_id[row["alert_id"]] = key
+            restored += 1
+        self.stats["restored"] = restored
+        if restored:
+            logger.info(f"🔁 已从未处理告警恢复 {restored} 个抑制状态")
+
+    def get_stats(self) -> Dict:
+        return {"open": len(self._open), **self.stats}
+
+
+def _to_timestamp(value) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+# 创建全局实例
+alert_suppressor = AlertSuppressor()
@@ -0,0 +1,139 @@
+"""
+患者在床状态跟踪
+根据每帧离床检测的 patient_in_bed 维护患者的在床/离床状态及持续时间：
+离床超过 bed_exit_threshold_minutes 触发 bed_exit_timeout，
+连续卧床超过 prolonged_bed_threshold_hours 触发 prolonged_bed。
+超时由时间轮定时器驱动，状态不变的帧只更新内存，不查询数据库
+"""
+import time
+import logging
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.timer_wheel import timer_wheel, TimerHandle
+
+logger = logging.getLogger(__name__)
+
+
+class BedState:
+    """单个患者的在床状态"""
+
+    __slots__ = ("in_bed", "since", "last_seen", "pending", "pending_since", "pending_count",
+                 "timer", "camera_id", "analysis_result_id")
+
+    def __init__(self):
+        self.in_bed: Optional[bool] = None
+        self.since = 0.0  # 进入当前状态的时间
+        self.last_seen = 0.0  # 最后一次观测时间
+        self.pending: Optional[bool] = None  # 尚未确认的新状态
+        self.pending_since = 0.0
+        self.pending_count = 0
+        self.timer: Optional[TimerHandle] = None
+        self.camera_id: Optional[str] = None
+        self.analysis_result_id: Optional[str] = None  # 最近一帧的分析结果（告警关联图片）
+
+
+class BedOccupancyTracker:
+    """按患者跟踪在床状态，离床/卧床超时后触发告警"""
+
+    def __init__(self):
+        self._states: Dict[str, BedState] = {}
+        self.stats = {"observations": 0, "transitions": 0, "bed_exit_timeouts": 0, "prolonged_bed": 0, "stale_skipped": 0}
+
+    def observe(
+        self,
+        patient_id: str,
+        patient_in_bed: Optional[bool],
+        monitoring_config: Optional[Dict] = None,
+        camera_id: Optional[str] = None,
+        analysis_result_id: Optional[str] = None,
+        observed_at: Optional[float] = None
+    ):
+        """
+        记录一帧的离床检测结果（patient_in_bed 为None表示无法判断，忽略）
+
+        新状态需要连续 bed_occupancy_confirm_frames 帧确认，单帧误判不会重置计时
+        """
+        if patient_in_bed is None:
+            return
+        now = observed_at or time.time()
+        state = self._states.get(patient_id)
+        if state is None:
+            state = self._states[patient_id] = BedState()
+        if now < state.last_seen:
+            return  # 回放的旧帧
+        self.stats["observations"] += 1
+        state.last_seen = now
+        state.camera_id = camera_id or state.camera_id
+        state.analysis_result_id = analysis_result_id or state.analysis_result_id
+
+        if patient_in_bed == state.in_bed:
+            state.pending = None
+            state.pending_count = 0
+            return
+        if patient_in_bed != state.pending:
+            state.pending = patient_in_bed
+            state.pending_since = now
+            state.pending_count = 0
+        state.pending_count += 1
+        if state.in_bed is not None and state.pending_count < settings.bed_occupancy_confirm_frames:
+            return
+
+        # 状态变化：重新计时（从新状态第一次出现的时间算起）
+        state.in_bed = patient_in_bed
+        state.since = state.pending_since
+        state.pending = None
+        state.pending_count = 0
+        self.stats["transitions"] += 1
+        self._arm(patient_id, state, monitoring_config or {})
+
+    def _arm(self, patient_id: str, state: BedState, config: Dict):
+        timer_wheel.cancel(state.timer)
+        state.timer = None
+        if state.in_bed:
+            hours = config.get("prolonged_bed_threshold_hours") or 12
+            if config.get("prolonged_bed_detection_enabled", 1) and hours > 0:
+                state.timer = timer_wheel.schedule(
+                    state.since + hours * 3600 - time.time(),
+                    self._on_timeout, patient_id, "prolonged_bed", state.since
+                )
+        else:
+            minutes = config.get("bed_exit_threshold_minutes") or 10
+            if minutes > 0:
+                state.timer = timer_wheel.schedule(
+                    state.since + minutes * 60 - time.time(),
+                    self._on_timeout, patient_id, "bed_exit_timeout", state.since
+                )
+
+    async def _on_timeout(self, patient_id: str, alert_type: str, since: float):
+        state = self._states.get(patient_id)
+        if state is None or state.since != since:
+            return
+        state.timer = None
+        now = time.time()
+        if now - state.last_seen > settings.bed_occupancy_stale_seconds:
+            # 长时间没有离床检测结果（摄像头离线或不在监测时段），不据此告警
+            self.stats["stale_skipped"] += 1
+            logger.info(f"⏭️ [在床状态] 患者 {patient_id} 已 {int(now - state.last_seen)} 秒无检测结果，跳过 {alert_type}")
+            return
+        self.stats["bed_exit_timeouts" if alert_type == "bed_exit_timeout" else "prolonged_bed"] += 1
+        from app.services.alert_service import alert_service
+        await alert_service.create_duration_alert(
+            patient_id=patient_id,
+            camera_id=state.camera_id,
+            analysis_result_id=state.analysis_result_id,
+            alert_type=alert_type,
+            duration_seconds=now - since
+        )
+
+    def get_state(self, patient_id: str) -> Optional[Dict]:
+        state = self._states.get(patient_id)
+        if state is None or state.in_bed is None:
+            return None
+        return {"in_bed": state.in_bed, "duration_seconds": time.time() - state.since}
+
+    def get_stats(self) -> Dict:
+        return {"patients": len(self._states), **self.stats}
+
+
+# 创建全局实例
+bed_occupancy_tracker = BedOccupancyTracker()
@@ -0,0 +1,84 @@
+"""
+检测调度服务
+按检测模式设置不同的检测频率（跌倒每帧检测，吊瓶、面部等变化缓慢的项目按间隔检测），
+每帧只把到期的检测模式写入提示词，减少token消耗和模型延迟
+"""
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionScheduler:
+    """多频率检测调度器（按 患者+检测模式 记录上次检测时间）"""
+
+    def __init__(self):
+        # (patient_id, mode) -> 上次完成检测的时间
+        self._last_run: Dict[Tuple[str, str], float] = {}
+        # (patient_id, mode) -> 指定的下次检测时间（覆盖固定间隔，如吊瓶余量预测）
+        self._next_due: Dict[Tuple[str, str], float] = {}
+        self.stats = {
+            "frames": 0,
+            "modes_evaluated": 0,  # 写入提示词的检测模式累计数
+            "modes_deferred": 0,  # 未到期被跳过的检测模式累计数
+            "frames_without_due_modes": 0,  # 没有任何到期模式、整帧跳过的次数
+        }
+
+    def interval(self, mode: str) -> float:
+        """检测模式的检测间隔（秒），未配置的模式每帧检测"""
+        return float(settings.detection_mode_intervals.get(mode, 0) or 0)
+
+    def next_due_at(self, patient_id: str, mode: str) -> float:
+        """检测模式的下次到期时间（从未检测过时立即到期）"""
+        key = (patient_id, mode)
+        if key in self._next_due:
+            return self._next_due[key]
+        last = self._last_run.get(key)
+        if last is None:
+            return 0.0
+        return last + self.interval(mode)
+
+    def due_modes(self, patient_id: str, enabled_modes: List[str], now: Optional[float] = None) -> List[str]:
+        """从已启用的检测模式中选出本帧需要检测的模式"""
+        now = now or time.time()
+        due = [mode for mode in enabled_modes if now >= self.next_due_at(patient_id, mode)]
+        self.stats["frames"] += 1
+        self.stats["modes_evaluated"] += len(due)
+        self.stats["modes_deferred"] += len(enabled_modes) - len(due)
+        if not due:
+            self.stats["frames_without_due_modes"] += 1
+        if len(due) < len(enabled_modes):
+            logger.info(f"🗓️ [检测调度] 患者 {patient_id} 本帧检测: {due}，未到期: {[m for m in enabled_modes if m not in due]}")
+        return due
+
+    def seconds_until_due(self, patient_id: str, modes: List[str], now: Optional[float] = None) -> Optional[float]:
+        """距离最早到期模式的秒数"""
+        if not modes:
+            return None
+        now = now or time.time()
+        return max(0.0, min(self.next_due_at(patient_id, mode) for mode in modes) - now)
+
+    def mark_evaluated(self, patient_id: str, modes: List[str], now: Optional[float] = None):
+        """分析成功后记录检测时间（分析失败时不调用，下一帧会重新检测）"""
+        now = now or time.time()
+        for mode in modes:
+            key = (patient_id, mode)
+            self._last_run[key] = now
+            self._next_due.pop(key, None)
+
+    def schedule_next(self, patient_id: str, mode: str, at: float):
+        """指定某个检测模式的下次检测时间（覆盖固定间隔，直到该模式下次被检测）"""
+        self._next_due[(patient_id, mode)] = at
+
+    def get_stats(self) -> Dict:
+        """获取调度统计"""
+        return {
+            "intervals": settings.detection_mode_intervals,
+            **self.stats
+        }
+
+
+# 创建全局实例
+detection_scheduler = DetectionScheduler()
@@ -0,0 +1,286 @@
+"""
+帧缓存队列服务
+视觉模型后端全部故障时，把分析失败的帧及其元数据写入本地SQLite队列（data/frame_spool.db），
+后台回放任务先用最早的一帧探测模型是否恢复，恢复后以有限并发回放，
+超过时效的帧直接丢弃；队列总大小有上限，超出时丢弃最早的帧，删除后增量回收磁盘空间
+"""
+import time
+import asyncio
+import logging
+import aiosqlite
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.core.config import settings, project_root
+
+logger = logging.getLogger(__name__)
+
+# 缓存队列文件（与业务数据库分离，避免大量图片数据影响主库）
+spool_path = project_root / "data" / "frame_spool.db"
+
+CREATE_SPOOL_SQL = """
+CREATE TABLE IF NOT EXISTS spooled_frames (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    camera_id TEXT,
+    timestamp_ms INTEGER,
+    captured_at REAL NOT NULL,
+    image BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+
+class FrameSpool:
+    """模型故障期间的持久化帧队列"""
+
+    def __init__(self):
+        self._initialized = False
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.circuit_open = False
+        self.next_probe_at: Optional[float] = None
+        self.stats = {
+            "enqueued": 0,
+            "replayed": 0,  # 回放成功（或不再需要重试）的帧
+            "replay_failed": 0,  # 回放时模型仍然失败的次数
+            "dropped_stale": 0,  # 超过时效被丢弃
+            "dropped_overflow": 0,  # 超过磁盘上限被丢弃
+        }
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(str(spool_path))
+        conn.row_factory = aiosqlite.Row
+        if not self._initialized:
+            spool_path.parent.mkdir(parents=True, exist_ok=True)
+            # auto_vacuum 必须在建表前设置，之后才能使用 incremental_vacuum 回收空间
+            await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await conn.executescript(CREATE_SPOOL_SQL)
+            await conn.commit()
+            self._initialized = True
+        return conn
+
+    async def enqueue(
+        self,
+        image_bytes: bytes,
+        patient_id: str,
+        camera_id: Optional[str] = None,
+        timestamp_ms: Optional[int] = None,
+        error: Optional[str] = None,
+        captured_at: Optional[float] = None
+    ) -> bool:
+        """写入失败的帧，返回是否写入成功"""
+        if len(image_bytes) > settings.frame_spool_max_bytes:
+            return False
+        conn = await self._connect()
+        try:
+            await conn.execute(
+                """INSERT INTO spooled_frames
+                   (patient_id, camera_id, timestamp_ms, captured_at, image, size, last_error)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (patient_id, camera_id, timestamp_ms, captured_at or time.time(),
+                 image_bytes, len(image_bytes), error)
+            )
+            await conn.commit()
+            await self._enforce_size_limit(conn)
+        finally:
+            await conn.close()
+
+        self.stats["enqueued"] += 1
+        self.circuit_open = True
+        self._wakeup.set()
+        logger.warning(f"💾 [帧缓存] 模型不可用，帧已写入缓存队列: patient_id={patient_id}, camera_id={camera_id}")
+        return True
+
+    async def _enforce_size_limit(self, conn: aiosqlite.Connection):
+        """总大小超过上限时丢弃最早的帧"""
+        cursor = await conn.execute("SELECT COALESCE(SUM(size), 0) FROM spooled_frames")
+        total = (await cursor.fetchone())[0]
+        overflow = total - settings.frame_spool_max_bytes
+        if overflow <= 0:
+            return
+
+        cursor = await conn.execute("SELECT id, size FROM spooled_frames ORDER BY id")
+        drop_ids = []
+        async for row in cursor:
+            if overflow <= 0:
+                break
+            drop_ids.append(row["id"])
+            overflow -= row["size"]
+        await self._delete(conn, drop_ids)
+        self.stats["dropped_overflow"] += len(drop_ids)
+        logger.warning(f"🗑️ [帧缓存] 缓存超过 {settings.frame_spool_max_bytes} 字节上限，丢弃最早的 {len(drop_ids)} 帧")
+
+    async def _delete(self, conn: aiosqlite.Connection, ids: List[int]):
+        if not ids:
+            return
+        placeholders = ",".join("?" * len(ids))
+        await conn.execute(f"DELETE FROM spooled_frames WHERE id IN ({placeholders})", tuple(ids))
+        await conn.commit()
+
+    async def _drop_stale(self, conn: aiosqlite.Connection):
+        """丢弃超过时效的帧（积压太久的画面已无参考价值）"""
+        cutoff = time.time() - settings.frame_spool_max_age_seconds
+        cursor = await conn.execute("DELETE FROM spooled_frames WHERE captured_at < ?", (cutoff,))
+        await conn.commit()
+        if cursor.rowcount:
+            self.stats["dropped_stale"] += cursor.rowcount
+            logger.info(f"🗑️ [帧缓存] 丢弃 {cursor.rowcount} 个过期帧（超过 {settings.frame_spool_max_age_seconds:.0f}秒）")
+
+    async def _take_batch(self, conn: aiosqlite.Connection, limit: int) -> List[Dict]:
+        cursor = await conn.execute(
+            "SELECT * FROM spooled_frames ORDER BY id LIMIT ?",
+            (limit,)
+        )
+        return [dict(row) for row in await cursor.fetchall()]
+
+    async def _replay_one(self, frame: Dict) -> bool:
+        """
+        回放一帧，返回模型是否可用
+
+        回放成功或失败原因与模型无关（如患者已删除）时删除该帧；
+        模型仍然失败时保留该帧并记录错误
+        """
+        from app.services.ai_analysis_service import ai_analysis_service
+
+        result = await ai_analysis_service.analyze_patient_image(
+            image_bytes=frame["image"],
+            patient_id=frame["patient_id"],
+            camera_id=frame["camera_id"],
+            timestamp_ms=frame["timestamp_ms"],
+            captured_at=datetime.fromtimestamp(frame["captured_at"]),
+            spool_on_failure=False
+        )
+
+        conn = await self._connect()
+        try:
+            if result.get("status") == "failed" and result.get("retryable"):
+                self.stats["replay_failed"] += 1
+                await conn.execute(
+                    "UPDATE spooled_frames SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (result.get("error"), frame["id"])
+                )
+                await conn.commit()
+                return False
+            await self._delete(conn, [frame["id"]])
+        finally:
+            await conn.close()
+
+        self.stats["replayed"] += 1
+        return True
+
+    async def _drain(self) -> bool:
+        """以有限并发回放队列，返回队列是否已清空"""
+        concurrency = max(1, settings.frame_spool_replay_concurrency)
+        while not self._stopping:
+            conn = await self._connect()
+            try:
+                await self._drop_stale(conn)
+                batch = await self._take_batch(conn, concurrency)
+            finally:
+                await conn.close()
+            if not batch:
+                return True
+            results = await asyncio.gather(*(self._replay_one(frame) for frame in batch))
+            if not all(results):
+                return False
+        return False
+
+    async def _compact(self):
+        """回收已删除帧占用的磁盘空间"""
+        conn = await self._connect()
+        try:
+            await conn.execute("PRAGMA incremental_vacuum")
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def _replay_loop(self):
+        """后台回放：熔断打开时按指数退避用最早的一帧探测，探测成功后批量回放"""
+        backoff = settings.frame_spool_probe_min_seconds
+        while not self._stopping:
+            try:
+                conn = await self._connect()
+                try:
+                    await self._drop_stale(conn)
+                    probe = await self._take_batch(conn, 1)
+                finally:
+                    await conn.close()
+
+                if not probe:
+                    self.circuit_open = False
+                    self.next_probe_at = None
+                    self._wakeup.clear()
+                    await self._compact()
+                    await self._wakeup.wait()
+                    # 刚写入的帧说明模型正在故障，等待一个退避周期再探测
+                    await asyncio.sleep(backoff)
+                    continue
+
+                # 半开探测：只回放最早的一帧
+                if await self._replay_one(probe[0]):
+                    logger.info(f"✅ [帧缓存] 模型已恢复，开始回放缓存帧")
+                    self.circuit_open = False
+                    backoff = settings.frame_spool_probe_min_seconds
+                    if await self._drain():
+                        logger.info(f"✅ [帧缓存] 缓存帧回放完成: {self.stats}")
+                        await self._compact()
+                    continue
+
+                self.circuit_open = True
+                self.next_probe_at = time.time() + backoff
+                logger.warning(f"⚠️ [帧缓存] 模型仍不可用，{backoff:.0f}秒后再次探测")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, settings.frame_spool_probe_max_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ [帧缓存] 回放任务异常: {type(e).__name__}: {e}")
+                await asyncio.sleep(settings.frame_spool_probe_max_seconds)
+
+    async def start(self):
+        """启动后台回放任务（应用启动时调用，队列中遗留的帧会被回放）"""
+        if not settings.frame_spool_enabled or self._task:
+            return
+        self._stopping = False
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._replay_loop())
+        logger.info(f"✅ [帧缓存] 回放任务已启动: {spool_path}")
+
+    async def stop(self):
+        """停止后台回放任务（未回放的帧保留在磁盘上）"""
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get_stats(self) -> Dict:
+        """获取队列统计"""
+        conn = await self._connect()
+        try:
+            cursor = await conn.execute(
+                "SELECT COUNT(*) AS frames, COALESCE(SUM(size), 0) AS bytes, MIN(captured_at) AS oldest FROM spooled_frames"
+            )
+            row = dict(await cursor.fetchone())
+        finally:
+            await conn.close()
+        return {
+            "enabled": settings.frame_spool_enabled,
+            "circuit_open": self.circuit_open,
+            "next_probe_at": self.next_probe_at,
+            "frames": row["frames"],
+            "bytes": row["bytes"],
+            "max_bytes": settings.frame_spool_max_bytes,
+            "oldest_age_seconds": time.time() - row["oldest"] if row["oldest"] else None,
+            **self.stats
+        }
+
+
+# 创建全局实例
+frame_spool = FrameSpool()
@@ -6,11 +6,15 @@ import json
 import logging
 import base64
 import re
+import time
+import asyncio
+from collections import deque
 from typing import Dict, List, Optional
 from io import BytesIO
 from PIL import Image
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from app.core.config import settings
+from app.services.model_stats import model_stats
 
 # 可选导入google.generativeai（仅在直接API模式需要）
 try:
@@ -23,15 +27,66 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+class HedgeBudget:
+    """对冲请求成本上限（滑动窗口内的次数上限和比例上限）"""
+    
+    def __init__(self, window_seconds: float = 60.0):
+        self.window_seconds = window_seconds
+        self._eligible = deque()  # 符合对冲条件的调用时间戳
+        self._launched = deque()  # 实际发出对冲请求的时间戳
+    
+    def _trim(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._eligible and self._eligible[0] < cutoff:
+            self._eligible.popleft()
+        while self._launched and self._launched[0] < cutoff:
+            self._launched.popleft()
+    
+    def note_eligible(self):
+        """记录一次符合对冲条件的调用"""
+        now = time.time()
+        self._trim(now)
+        self._eligible.append(now)
+    
+    def try_acquire(self) -> bool:
+        """尝试获取一次对冲额度"""
+        now = time.time()
+        self._trim(now)
+        if len(self._launched) >= settings.vision_hedge_max_per_minute:
+            return False
+        # 窗口内还没有对冲过时总是允许一次（少量高危患者调用稀疏，否则按比例永远轮不到），
+        # 持续负载下再按比例限制
+        eligible = max(len(self._eligible), 1)
+        if self._launched and (len(self._launched) + 1) / eligible > settings.vision_hedge_max_ratio:
+            return False
+        self._launched.append(now)
+        return True
+
+
 class GeminiVisionAnalyzer:
     """Gemini 视觉分析器"""
     
     def __init__(self):
         self.use_one_api = settings.use_one_api
         self.one_api_client = None
+        self.one_api_async_client = None
         self.gemini_client = None
         # 延迟初始化客户端，避免模块导入时的兼容性问题
         # 客户端将在第一次使用时初始化
+        
+        # 对冲请求
+        self.hedge_budget = HedgeBudget()
+        self.hedge_stats = {
+            "eligible": 0,  # 符合对冲条件的调用
+            "answered_before_hedge": 0,  # 主请求在对冲等待时间内返回
+            "launched": 0,  # 发出的对冲请求
+            "skipped_budget": 0,  # 因成本上限跳过对冲
+            "primary_won": 0,
+            "hedge_won": 0,
+            "both_failed": 0,
+        }
+        # 路由名称 -> 命中次数
+        self.route_stats: Dict[str, int] = {}
     
     def _mask_api_key(self, api_key: str) -> str:
         """隐藏API密钥的中间部分"""
@@ -128,6 +183,7 @@ class GeminiVisionAnalyzer:
             api_start = datetime.now()
             max_retries = 2  # 最多重试2次，总共3次尝试
             timeout_seconds = 120  # 2分钟超时
+            call_usage = {}  # 本次调用实际使用的模型和token用量
             
             if self.use_one_api:
                 # 延迟初始化客户端
@@ -146,8 +202,12 @@ class GeminiVisionAnalyzer:
                         }
                 
                 if self.one_api_client:
-                    logger.info(f"🔍 [Gemini] 使用One-API模式调用（超时: {timeout_seconds}秒，最多重试{max_retries}次）...")
-                    result = await self._analyze_with_one_api_with_retry(image_bytes, prompt, max_retries, timeout_seconds)
+                    model = self.route_model(detection_modes, patient_context)
+                    logger.info(f"🔍 [Gemini] 使用One-API模式调用（模型: {model}，超时: {timeout_seconds}秒，最多重试{max_retries}次）...")
+                    if self._should_hedge(patient_context):
+                        result = await self._analyze_with_hedge(image_bytes, prompt, max_retries, timeout_seconds, model=model, usage=call_usage)
+                    else:
+                        result = await self._analyze_with_one_api_with_retry(image_bytes, prompt, max_retries, timeout_seconds, model=model, usage=call_usage)
                 else:
                     logger.error(f"❌ [Gemini] One-API客户端未初始化")
                     return {
@@ -156,7 +216,7 @@ class GeminiVisionAnalyzer:
                     }
             elif self.gemini_client:
                 logger.warning(f"⚠️ [Gemini] One-API未配置，使用直接Gemini API模式调用（超时: {timeout_seconds}秒，最多重试{max_retries}次）...")
-                result = await self._analyze_with_gemini_with_retry(image_bytes, prompt, max_retries, timeout_seconds)
+                result = await self._analyze_with_gemini_with_retry(image_bytes, prompt, max_retries, timeout_seconds, usage=call_usage)
             else:
                 logger.error(f"❌ [Gemini] AI服务未配置")
                 return {
@@ -171,6 +231,9 @@ class GeminiVisionAnalyzer:
             # 解析结果
             logger.info(f"🔍 [Gemini] 解析AI响应...")
             parsed_result = self._parse_response(result)
+            # 附带token用量（解析失败的调用同样消耗了token，也需要计入）
+            if call_usage:
+                parsed_result["usage"] = call_usage
             
             if "error" in parsed_result:
                 logger.error(f"❌ [Gemini] 解析失败: {parsed_result.get('error')}")
@@ -194,12 +257,199 @@ class GeminiVisionAnalyzer:
                 "status": "failed"
             }
     
+    def _model_routes(self) -> List[Dict]:
+        """
+        模型路由表（按顺序匹配，第一条命中的路由生效）
+        
+        路由条件（均为可选，省略表示不限制）:
+            modes_subset: 本帧检测模式全部属于该集合时命中（如仅吊瓶检测）
+            modes_any: 本帧检测模式包含其中任一模式时命中
+            scene_types: 患者上一次识别的场景类型属于该集合时命中
+            risk_levels: 患者风险等级属于该集合时命中
+        路由结果:
+            model: 使用的模型
+            fast_model: 主模型p95超过 p95_budget_seconds 时降级使用的模型
+        """
+        if settings.vision_model_routes:
+            return settings.vision_model_routes
+        light_model = settings.vision_light_model or settings.one_api_gemini_model
+        return [
+            # 仅吊瓶液位检查：画面简单，使用轻量模型
+            {"name": "iv_drip_only", "modes_subset": ["iv_drip"], "model": light_model},
+            {"name": "iv_drip_scene", "scene_types": ["iv_drip_only"], "modes_subset": ["iv_drip", "facial"], "model": light_model},
+            # 跌倒、生命体征等其他检测：使用主视觉模型，延迟超预算时降级
+            {
+                "name": "default",
+                "model": settings.one_api_gemini_vision_model,
+                "fast_model": settings.one_api_gemini_model,
+                "p95_budget_seconds": settings.vision_route_p95_budget_seconds
+            },
+        ]
+    
+    def _route_matches(self, route: Dict, detection_modes: List[str], patient_context: Dict) -> bool:
+        modes = set(detection_modes)
+        if "modes_subset" in route and not (modes and modes <= set(route["modes_subset"])):
+            return False
+        if "modes_any" in route and not (modes & set(route["modes_any"])):
+            return False
+        if "scene_types" in route and patient_context.get("last_scene_type") not in route["scene_types"]:
+            return False
+        if "risk_levels" in route and patient_context.get("risk_level") not in route["risk_levels"]:
+            return False
+        return True
+    
+    def route_model(self, detection_modes: List[str], patient_context: Dict) -> str:
+        """根据检测模式、场景类型和风险等级选择模型，主模型p95超预算时自动降级"""
+        for route in self._model_routes():
+            if not self._route_matches(route, detection_modes, patient_context):
+                continue
+            route_name = route.get("name", "unnamed")
+            model = route.get("model") or settings.one_api_gemini_vision_model
+            fast_model = route.get("fast_model")
+            budget = route.get("p95_budget_seconds")
+            if fast_model and budget:
+                p95 = model_stats.percentile(
+                    f"one_api:{model}", 0.95, min_samples=settings.vision_route_min_samples
+                )
+                if p95 is not None and p95 > budget:
+                    logger.warning(f"⬇️ [模型路由] {model} p95={p95:.2f}秒 超过预算 {budget}秒，降级到 {fast_model}")
+                    route_name = f"{route_name}:demoted"
+                    model = fast_model
+            self.route_stats[route_name] = self.route_stats.get(route_name, 0) + 1
+            logger.info(f"🧭 [模型路由] 命中路由 {route_name} -> {model}")
+            return model
+        return settings.one_api_gemini_vision_model
+    
+    def get_route_stats(self) -> Dict:
+        """获取路由表和各路由命中次数"""
+        return {
+            "routes": self._model_routes(),
+            "hits": dict(self.route_stats)
+        }
+    
+    def _should_hedge(self, patient_context: Dict) -> bool:
+        """判断是否对该患者启用对冲请求（高危风险等级或上一次分析结果为紧急）"""
+        if not settings.vision_hedge_enabled:
+            return False
+        risk_level = patient_context.get("risk_level")
+        last_status = patient_context.get("last_overall_status")
+        return risk_level in settings.vision_hedge_risk_levels or last_status in ["critical", "紧急"]
+    
+    def _hedge_delay(self, model: Optional[str] = None) -> float:
+        """对冲等待时间：主后端延迟的p90（样本不足时使用默认值）"""
+        key = f"one_api:{model or settings.one_api_gemini_vision_model}"
+        delay = model_stats.percentile(
+            key,
+            settings.vision_hedge_percentile,
+            min_samples=settings.vision_hedge_min_samples
+        )
+        if delay is None:
+            delay = settings.vision_hedge_default_delay_seconds
+        return max(delay, settings.vision_hedge_min_delay_seconds)
+    
+    def _hedge_request(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        timeout_seconds: int,
+        primary_model: str,
+        usage: Optional[Dict] = None
+    ):
+        """构建对冲请求：使用One-API的备用模型（异步客户端，取消时会中止HTTP请求）"""
+        hedge_model = settings.vision_hedge_model
+        if not hedge_model:
+            hedge_model = (settings.one_api_gemini_model
+                           if primary_model != settings.one_api_gemini_model
+                           else settings.one_api_gemini_vision_model)
+        return f"one_api:{hedge_model}", self._analyze_with_one_api(
+            image_bytes, prompt, timeout_seconds, model=hedge_model, cancellable=True, usage=usage
+        )
+    
+    async def _analyze_with_hedge(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        max_retries: int = 2,
+        timeout_seconds: int = 120,
+        model: Optional[str] = None,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """
+        对冲请求：主请求超过p90延迟仍未返回时，向备用模型发出第二个请求，
+        先返回的结果胜出，另一个请求被取消
+        """
+        self.hedge_stats["eligible"] += 1
+        self.hedge_budget.note_eligible()
+        model = model or settings.one_api_gemini_vision_model
+        delay = self._hedge_delay(model)
+        
+        # 两路请求各自记录用量，结束后把胜出一方写入 usage
+        primary_usage, hedge_usage = {}, {}
+        primary = asyncio.create_task(
+            self._analyze_with_one_api_with_retry(
+                image_bytes, prompt, max_retries, timeout_seconds, cancellable=True, model=model, usage=primary_usage
+            )
+        )
+        hedge = winner_task = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                self.hedge_stats["answered_before_hedge"] += 1
+                return primary.result()
+            
+            if not self.hedge_budget.try_acquire():
+                self.hedge_stats["skipped_budget"] += 1
+                logger.info(f"⏭️ [对冲] 主请求超过 {delay:.2f}秒 未返回，但已达到对冲成本上限，继续等待主请求")
+                return await primary
+            
+            hedge_name, hedge_coro = self._hedge_request(image_bytes, prompt, timeout_seconds, model, usage=hedge_usage)
+            self.hedge_stats["launched"] += 1
+            logger.warning(f"🔀 [对冲] 主请求超过 {delay:.2f}秒 未返回，发出对冲请求: {hedge_name}")
+            hedge = asyncio.create_task(hedge_coro)
+            
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = "primary_won" if task is primary else "hedge_won"
+                        self.hedge_stats[winner] += 1
+                        logger.info(f"🏁 [对冲] {'主请求' if task is primary else '对冲请求'}先返回")
+                        winner_task = task
+                        return task.result()
+            
+            self.hedge_stats["both_failed"] += 1
+            raise primary.exception()
+        finally:
+            # 调用方被取消时同样取消仍在进行的请求，避免HTTP请求继续占用
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+            if usage is not None:
+                hedge_won = hedge is not None and winner_task is hedge
+                won, lost = (hedge_usage, primary_usage) if hedge_won else (primary_usage, hedge_usage)
+                usage.update(won)
+                if hedge is not None and lost:
+                    # 落败一方已收到响应时同样产生了费用，计入用量汇总
+                    usage["hedge_loser"] = dict(lost)
+    
+    def get_hedge_stats(self) -> Dict:
+        """获取对冲请求统计"""
+        return {
+            "enabled": settings.vision_hedge_enabled,
+            "current_delay_seconds": self._hedge_delay(),
+            **self.hedge_stats
+        }
+    
     async def _analyze_with_one_api_with_retry(
         self, 
         image_bytes: bytes, 
         prompt: str, 
         max_retries: int = 2,
-        timeout_seconds: int = 120
+        timeout_seconds: int = 120,
+        cancellable: bool = False,
+        model: Optional[str] = None,
+        usage: Optional[Dict] = None
     ) -> str:
         """使用 One-API 调用 Gemini（带重试机制）"""
         last_exception = None
@@ -214,7 +464,9 @@ class GeminiVisionAnalyzer:
                 else:
                     logger.info(f"🔍 [One-API] 第 {attempt + 1} 次尝试...")
                 
-                result = await self._analyze_with_one_api(image_bytes, prompt, timeout_seconds)
+                result = await self._analyze_with_one_api(
+                    image_bytes, prompt, timeout_seconds, model=model, cancellable=cancellable, usage=usage
+                )
                 if attempt > 0:
                     logger.info(f"✅ [One-API] 重试成功！")
                 return result
@@ -231,15 +483,32 @@ class GeminiVisionAnalyzer:
         # 所有重试都失败，抛出最后一个异常
         raise last_exception
     
-    async def _analyze_with_one_api(self, image_bytes: bytes, prompt: str, timeout_seconds: int = 120) -> str:
-        """使用 One-API 调用 Gemini"""
-        import asyncio
+    async def _analyze_with_one_api(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        timeout_seconds: int = 120,
+        model: Optional[str] = None,
+        cancellable: bool = False,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """
+        使用 One-API 调用 Gemini
+        
+        Args:
+            model: 使用的模型（默认 one_api_gemini_vision_model）
+            cancellable: 使用异步客户端发送请求，任务取消时会中断HTTP请求（对冲请求使用）
+            usage: 传入字典时写入本次调用的模型和token用量
+        """
         import traceback
         from datetime import datetime
         
         import urllib.parse
         from urllib.parse import urlparse
         
+        model = model or settings.one_api_gemini_vision_model
+        stats_key = f"one_api:{model}"
+        
         try:
             # 解析URL获取详细信息
             parsed_url = urlparse(settings.one_api_base_url)
@@ -251,7 +520,7 @@ class GeminiVisionAnalyzer:
             logger.info(f"🔍 [One-API] Base URL: {settings.one_api_base_url}")
             logger.info(f"🌐 [One-API] 目标地址: {host}:{port}")
             logger.info(f"🔑 [One-API] API Key: {api_key_display}")
-            logger.info(f"🤖 [One-API] 模型: {settings.one_api_gemini_vision_model}")
+            logger.info(f"🤖 [One-API] 模型: {model}")
             logger.info(f"⏱️ [One-API] 超时设置: {timeout_seconds}秒")
             
             # 将图片转换为 base64
@@ -319,17 +588,32 @@ class GeminiVisionAnalyzer:
             api_start = datetime.now()
             
             try:
-                # 将同步调用包装为异步，并添加超时
-                def sync_create():
-                    return self.one_api_client.chat.completions.create(
-                        model=settings.one_api_gemini_vision_model,
+                if cancellable:
+                    # 异步客户端：任务被取消时HTTP请求随之中断
+                    if not self.one_api_async_client:
+                        self.one_api_async_client = AsyncOpenAI(
+                            base_url=settings.one_api_base_url,
+                            api_key=settings.one_api_key
+                        )
+                    request = self.one_api_async_client.chat.completions.create(
+                        model=model,
                         messages=messages,
                         temperature=0.1,
                         max_tokens=2048
                     )
+                else:
+                    # 将同步调用包装为异步，并添加超时
+                    def sync_create():
+                        return self.one_api_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            temperature=0.1,
+                            max_tokens=2048
+                        )
+                    request = asyncio.to_thread(sync_create)
                 
                 response = await asyncio.wait_for(
-                    asyncio.to_thread(sync_create),
+                    request,
                     timeout=float(timeout_seconds)  # 可配置的超时时间
                 )
                 
@@ -338,11 +622,22 @@ class GeminiVisionAnalyzer:
                 
                 # 检查响应
                 if not response or not hasattr(response, 'choices') or not response.choices:
+                    model_stats.record_error(stats_key, api_duration)
                     raise ValueError("API返回空响应或无效响应")
                 
                 if not response.choices[0].message.content:
+                    model_stats.record_error(stats_key, api_duration)
                     raise ValueError("响应中没有内容")
                 
+                response_usage = getattr(response, "usage", None)
+                usage_tokens = {
+                    "prompt_tokens": getattr(response_usage, "prompt_tokens", 0) or 0,
+                    "completion_tokens": getattr(response_usage, "completion_tokens", 0) or 0
+                }
+                model_stats.record_success(stats_key, api_duration, **usage_tokens)
+                if usage is not None:
+                    usage.update({"backend": "one_api", "model": model, **usage_tokens})
+                logger.info(f"📈 [One-API] token用量: prompt={usage_tokens['prompt_tokens']}, completion={usage_tokens['completion_tokens']}")
                 result = response.choices[0].message.content
                 logger.info(f"✅ [One-API] 响应文本长度: {len(result)} 字符")
                 logger.debug(f"🔍 [One-API] 响应预览: {result[:200]}...")
@@ -351,8 +646,17 @@ class GeminiVisionAnalyzer:
                 
             except asyncio.TimeoutError:
                 api_duration = (datetime.now() - api_start).total_seconds()
+                model_stats.record_error(stats_key, api_duration)
                 logger.error(f"❌ [One-API] API调用超时 (耗时: {api_duration:.2f}秒，超时限制: {timeout_seconds}秒)")
                 raise TimeoutError(f"One-API调用超时，超过{timeout_seconds}秒未响应")
+            except asyncio.CancelledError:
+                logger.info(f"🛑 [One-API] 请求已取消（对冲请求中落败）: {model}")
+                raise
+            except (ValueError, TimeoutError):
+                raise
+            except Exception:
+                model_stats.record_error(stats_key, (datetime.now() - api_start).total_seconds())
+                raise
             
         except Exception as e:
             error_trace = traceback.format_exc()
@@ -367,7 +671,8 @@ class GeminiVisionAnalyzer:
         image_bytes: bytes, 
         prompt: str, 
         max_retries: int = 2,
-        timeout_seconds: int = 120
+        timeout_seconds: int = 120,
+        usage: Optional[Dict] = None
     ) -> str:
         """直接使用 Gemini API（带重试机制）"""
         last_exception = None
@@ -382,7 +687,7 @@ class GeminiVisionAnalyzer:
                 else:
                     logger.info(f"🔍 [Gemini-Direct] 第 {attempt + 1} 次尝试...")
                 
-                result = await self._analyze_with_gemini(image_bytes, prompt, timeout_seconds)
+                result = await self._analyze_with_gemini(image_bytes, prompt, timeout_seconds, usage=usage)
                 if attempt > 0:
                     logger.info(f"✅ [Gemini-Direct] 重试成功！")
                 return result
@@ -399,8 +704,14 @@ class GeminiVisionAnalyzer:
         # 所有重试都失败，抛出最后一个异常
         raise last_exception
     
-    async def _analyze_with_gemini(self, image_bytes: bytes, prompt: str, timeout_seconds: int = 120) -> str:
-        """直接使用 Gemini API"""
+    async def _analyze_with_gemini(
+        self,
+        image_bytes: bytes,
+        prompt: str,
+        timeout_seconds: int = 120,
+        usage: Optional[Dict] = None
+    ) -> str:
+        """直接使用 Gemini API（usage: 传入字典时写入本次调用的token用量）"""
         import asyncio
         import traceback
         from datetime import datetime
@@ -455,6 +766,17 @@ class GeminiVisionAnalyzer:
                 
                 api_duration = (datetime.now() - api_start).total_seconds()
                 logger.info(f"✅ [Gemini-Direct] API调用成功，耗时: {api_duration:.2f}秒")
+                usage_metadata = getattr(response, "usage_metadata", None)
+                usage_tokens = {
+                    "prompt_tokens": getattr(usage_metadata, "prompt_token_count", 0) or 0,
+                    "completion_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0
+                }
+                if usage is not None:
+                    usage.update({
+                        "backend": "gemini-direct",
+                        "model": settings.one_api_gemini_vision_model,
+                        **usage_tokens
+                    })
                 
                 # 检查响应
                 if not response:
@@ -473,11 +795,15 @@ class GeminiVisionAnalyzer:
                             if text_parts:
                                 result_text = ''.join(text_parts)
                                 logger.info(f"✅ [Gemini-Direct] 从candidates中提取文本，长度: {len(result_text)} 字符")
+                                model_stats.record_success("gemini-direct", api_duration, **usage_tokens)
                                 return result_text
                     
+                    model_stats.record_error("gemini-direct", api_duration)
+                    
                     raise ValueError("无法从响应中提取文本内容")
                 
                 result_text = response.text
+                model_stats.record_success("gemini-direct", api_duration, **usage_tokens)
                 logger.info(f"✅ [Gemini-Direct] 响应文本长度: {len(result_text)} 字符")
                 logger.debug(f"🔍 [Gemini-Direct] 响应预览: {result_text[:200]}...")
                 
@@ -485,6 +811,7 @@ class GeminiVisionAnalyzer:
                 
             except asyncio.TimeoutError:
                 api_duration = (datetime.now() - api_start).total_seconds()
+                model_stats.record_error("gemini-direct", api_duration)
                 logger.error(f"❌ [Gemini-Direct] API调用超时 (耗时: {api_duration:.2f}秒，超时限制: {timeout_seconds}秒)")
                 raise TimeoutError(f"Gemini API调用超时，超过{timeout_seconds}秒未响应")
             
@@ -819,6 +1146,7 @@ class GeminiVisionAnalyzer:
         "iv_drip": {
             "detected": true/false,
             "fluid_level": "满/半满/袋子空/已打完",
+            "fill_percent": 60,  // 估计袋子/玻璃瓶剩余液体占容量的百分比（0-100整数，无法估计则为null）
             "bag_empty": true/false,
             "completely_empty": true/false,
             "needs_replacement": true/false,
@@ -876,7 +1204,24 @@ class GeminiVisionAnalyzer:
   * "袋子/玻璃瓶基本充满，上半部分有液体，判定为满，状态正常"
 - **其他检测项**：同样需要在description中详细描述观察到的现象和判断依据
 """
-        
+
+        roi_crop = patient_context.get("roi_crop")
+        if roi_crop:
+            region_name = "吊瓶（输液袋/玻璃瓶及滴液管）" if roi_crop == "iv_drip" else "生命监控设备屏幕"
+            prompt += f"""
+## 裁剪图片说明:
+本次图片是从病房完整画面中裁剪出的{region_name}区域，画面中看不到病床和病人属于正常情况，
+请只针对该区域完成上述检测任务，无法从该区域判断的检测项设置为null，不要因画面不完整而告警。
+"""
+        elif patient_context.get("request_regions"):
+            prompt += """
+## 区域定位（额外输出字段）:
+请在JSON顶层额外输出 `regions` 字段，给出吊瓶和生命监控设备屏幕在画面中的位置框，
+坐标为相对整幅图片宽高的比例 [左, 上, 右, 下]（0-1之间的小数），画面中没有则为null：
+"regions": {"iv_drip": [0.62, 0.05, 0.78, 0.45], "vital_monitor": null}
+吊瓶的位置框需包含输液袋/玻璃瓶和可见的滴液管。
+"""
+
         return prompt
     
     def _parse_response(self, response_text: str) -> Dict:
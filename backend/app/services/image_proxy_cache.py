@@ -0,0 +1,456 @@
+"""
+图片代理缓存服务
+图片代理共用一个带连接池的HTTP客户端，回源时分块流式转发；
+回源结果写入有界的内存+磁盘两级LRU缓存（按URL），过期后用 ETag/Last-Modified 向源站条件请求重新验证，
+同一张告警图片被多位护士、家属打开时不再重复从COS下载。
+请求带缩放参数（宽度/质量/格式）时在进程池中缩放重新编码，结果按 (URL, 参数) 缓存
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import AsyncIterator, Dict, Optional, Tuple
+import httpx
+from PIL import Image
+from app.core.config import settings, project_root
+from app.services.image_store import is_content_addressed, local_store_key
+
+logger = logging.getLogger(__name__)
+
+# 与源站通信时透传/缓存的响应头
+CACHED_HEADERS = ("content-type", "etag", "last-modified")
+
+TRANSFORM_CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def transform_image(body: bytes, width: Optional[int], quality: int, fmt: str) -> bytes:
+    """缩放并重新编码图片（在进程池中执行；宽度超过原图时不放大）"""
+    image = Image.open(BytesIO(body))
+    image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if width and width < image.width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    buffer = BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class CacheEntry:
+    """缓存的图片（内存中保存内容，磁盘上保存内容和元数据）"""
+
+    def __init__(self, body: bytes, headers: Dict[str, str], fetched_at: float):
+        self.body = body
+        self.headers = headers  # 小写头名 -> 值（content-type/etag/last-modified）
+        self.fetched_at = fetched_at
+
+    @property
+    def etag(self) -> str:
+        # 源站未返回ETag时用内容哈希生成（客户端条件请求同样可用）
+        return self.headers.get("etag") or f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+class ImageProxyCache:
+    """图片代理：共享HTTP客户端 + 内存/磁盘两级LRU缓存"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_bytes = 0
+        self.cache_dir = project_root / "data" / "image_proxy_cache"
+        # URL哈希 -> 磁盘占用字节数（按最近使用排序）
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_loaded = False
+        self._background = set()  # 进行中的磁盘写入任务
+        self._transform_pool: Optional[ProcessPoolExecutor] = None
+        # 同时进行的缩放数上限（超出的请求异步等待，不占用事件循环和进程池队列）
+        self._transform_slots = asyncio.Semaphore(settings.image_transform_concurrency)
+        # 缓存键 -> 进行中的缩放（相同参数的并发请求合并为一次）
+        self._transforms: Dict[str, asyncio.Future] = {}
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidated": 0,  # 条件请求返回304，缓存继续使用
+            "refetched": 0,  # 条件请求返回新内容
+            "not_modified": 0,  # 向客户端返回304
+            "upstream_errors": 0,
+            "transform_hits": 0,
+            "transforms": 0,
+            "transform_seconds": 0.0,
+        }
+
+    def get_client(self) -> httpx.AsyncClient:
+        """共享的带连接池HTTP客户端"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                follow_redirects=True
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._transform_pool is not None:
+            self._transform_pool.shutdown(wait=False, cancel_futures=True)
+            self._transform_pool = None
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, url: str, entry: CacheEntry) -> bool:
+        # 内容寻址的图片内容不会变化，无需重新验证
+        if is_content_addressed(url):
+            return True
+        return time.time() - entry.fetched_at < settings.image_proxy_cache_ttl_seconds
+
+    # ---------- 内存缓存 ----------
+
+    def _memory_get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key: str, entry: CacheEntry):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.body)
+        if len(entry.body) > settings.image_proxy_memory_cache_bytes:
+            return
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory_bytes > settings.image_proxy_memory_cache_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+
+    # ---------- 磁盘缓存 ----------
+
+    def _load_disk_index(self):
+        """首次使用时扫描缓存目录（按修改时间排序近似LRU顺序）"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.glob("*.bin"):
+            try:
+                stat = path.stat()
+                meta_size = (path.with_suffix(".json")).stat().st_size
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size + meta_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._disk_loaded = True
+
+    def _disk_read(self, key: str) -> Optional[CacheEntry]:
+        try:
+            body = (self.cache_dir / f"{key}.bin").read_bytes()
+            meta = json.loads((self.cache_dir / f"{key}.json").read_text())
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(body, meta.get("headers", {}), meta.get("fetched_at", 0))
+
+    def _disk_write(self, key: str, entry: CacheEntry) -> int:
+        """原子写入内容和元数据，返回占用字节数"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path = self.cache_dir / f"{key}.bin"
+        meta_path = self.cache_dir / f"{key}.json"
+        meta = json.dumps({"headers": entry.headers, "fetched_at": entry.fetched_at}).encode("utf-8")
+        for path, data in ((body_path, entry.body), (meta_path, meta)):
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        return len(entry.body) + len(meta)
+
+    def _disk_remove(self, key: str):
+        for suffix in (".bin", ".json"):
+            try:
+                (self.cache_dir / f"{key}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+
+    async def _disk_get(self, key: str) -> Optional[CacheEntry]:
+        if not self._disk_loaded:
+            await asyncio.to_thread(self._load_disk_index)
+        if key not in self._disk:
+            return None
+        entry = await asyncio.to_thread(self._disk_read, key)
+        if entry is None:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+        self._disk.move_to_end(key)
+        return entry
+
+    async def _disk_put(self, key: str, entry: CacheEntry):
+        if settings.image_proxy_disk_cache_bytes <= 0:
+            return
+        if not self._disk_loaded:
+            await asyncio.to_thread(self._load_disk_index)
+        try:
+            size = await asyncio.to_thread(self._disk_write, key, entry)
+        except OSError as e:
+            logger.warning(f"⚠️ 图片代理磁盘缓存写入失败: {e}")
+            return
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._disk_bytes += size
+        evicted = []
+        while self._disk_bytes > settings.image_proxy_disk_cache_bytes and len(self._disk) > 1:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            evicted.append(old_key)
+        if evicted:
+            await asyncio.to_thread(lambda: [self._disk_remove(k) for k in evicted])
+
+    async def _store(self, key: str, entry: CacheEntry):
+        self._memory_put(key, entry)
+        await self._disk_put(key, entry)
+
+    # ---------- 对外接口 ----------
+
+    async def _lookup(self, key: str) -> Optional[CacheEntry]:
+        """依次查询内存和磁盘缓存（磁盘命中时提升到内存）"""
+        entry = self._memory_get(key)
+        if entry is not None:
+            self.stats["memory_hits"] += 1
+            return entry
+        entry = await self._disk_get(key)
+        if entry is not None:
+            self.stats["disk_hits"] += 1
+            self._memory_put(key, entry)
+        return entry
+
+    async def get_cached(self, url: str) -> Tuple[Optional[CacheEntry], str]:
+        """
+        查询缓存，过期的缓存向源站条件请求重新验证
+
+        Returns:
+            (缓存项, 缓存状态 HIT/REVALIDATED/REFRESHED/STALE)；未命中时返回 (None, "MISS")
+        """
+        key = self._url_key(url)
+        entry = await self._lookup(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None, "MISS"
+        if self._is_fresh(url, entry):
+            return entry, "HIT"
+
+        # 过期：条件请求重新验证
+        headers = {}
+        if entry.headers.get("etag"):
+            headers["If-None-Match"] = entry.headers["etag"]
+        if entry.headers.get("last-modified"):
+            headers["If-Modified-Since"] = entry.headers["last-modified"]
+        if not headers:
+            self.stats["refetched"] += 1
+            return None, "MISS"
+        try:
+            response = await self.get_client().get(self._upstream_url(url), headers=headers)
+        except httpx.HTTPError as e:
+            # 源站不可用时继续使用旧缓存
+            logger.warning(f"⚠️ 图片代理重新验证失败，使用缓存: {url}: {e}")
+            return entry, "STALE"
+        if response.status_code == 304:
+            self.stats["revalidated"] += 1
+            entry.fetched_at = time.time()
+            await self._store(key, entry)
+            return entry, "REVALIDATED"
+        self.stats["refetched"] += 1
+        if response.status_code == 200:
+            entry = CacheEntry(response.content, self._pick_headers(response), time.time())
+            await self._store(key, entry)
+            return entry, "REFRESHED"
+        return None, "MISS"
+
+    @staticmethod
+    def _upstream_url(url: str) -> str:
+        """回源URL（私有Bucket时使用缓存的预签名URL）"""
+        from app.services.presigned_url_cache import presigned_url_cache
+        return presigned_url_cache.resolve(url)
+
+    @staticmethod
+    def _pick_headers(response: httpx.Response) -> Dict[str, str]:
+        return {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+
+    async def open_upstream(self, url: str) -> httpx.Response:
+        """
+        向源站发起流式请求（调用方读取完毕后需关闭响应）
+
+        Raises:
+            httpx.HTTPStatusError / httpx.HTTPError: 源站错误
+        """
+        client = self.get_client()
+        response = await client.send(client.build_request("GET", self._upstream_url(url)), stream=True)
+        if response.status_code >= 400:
+            await response.aclose()
+            self.stats["upstream_errors"] += 1
+            response.raise_for_status()
+        return response
+
+    async def stream_and_cache(self, url: str, response: httpx.Response) -> AsyncIterator[bytes]:
+        """把源站响应分块转发给客户端，完整读取且不超过大小上限时写入缓存"""
+        buffer = bytearray()
+        cacheable = True
+        try:
+            async for chunk in response.aiter_bytes():
+                if cacheable:
+                    buffer.extend(chunk)
+                    if len(buffer) > settings.image_proxy_max_object_bytes:
+                        cacheable = False
+                        buffer = bytearray()
+                yield chunk
+        finally:
+            await response.aclose()
+        if cacheable:
+            entry = CacheEntry(bytes(buffer), self._pick_headers(response), time.time())
+            key = self._url_key(url)
+            self._memory_put(key, entry)
+            # 客户端收完数据断开后响应任务会被取消，磁盘写入放到独立任务中完成
+            task = asyncio.create_task(self._disk_put(key, entry))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def fetch_source(self, url: str) -> CacheEntry:
+        """
+        获取完整的原图（优先使用缓存，未命中时完整下载并写入缓存）
+
+        Raises:
+            httpx.HTTPStatusError / httpx.HTTPError: 源站错误
+        """
+        if local_store_key(url):
+            return await self._read_local_store(url)
+        entry, _ = await self.get_cached(url)
+        if entry is not None:
+            return entry
+        response = await self.get_client().get(self._upstream_url(url))
+        if response.status_code >= 400:
+            self.stats["upstream_errors"] += 1
+            response.raise_for_status()
+        entry = CacheEntry(response.content, self._pick_headers(response), time.time())
+        if len(entry.body) <= settings.image_proxy_max_object_bytes:
+            await self._store(self._url_key(url), entry)
+        return entry
+
+    @staticmethod
+    async def _read_local_store(url: str) -> CacheEntry:
+        """
+        从本地图片存储读取原图（已在本地磁盘上，不经HTTP回源、不写入代理缓存）
+
+        Raises:
+            FileNotFoundError: 未启用本地存储或图片不存在
+        """
+        from app.services.image_store import get_image_store, LocalImageStore
+        image_store = get_image_store()
+        path = image_store.resolve(local_store_key(url)) if isinstance(image_store, LocalImageStore) else None
+        if path is None:
+            raise FileNotFoundError(url)
+        body = await asyncio.to_thread(path.read_bytes)
+        return CacheEntry(body, {
+            "content-type": "image/webp" if path.suffix == ".webp" else "image/jpeg",
+            "etag": f'"{path.stem}"',
+        }, time.time())
+
+    def _get_transform_pool(self) -> ProcessPoolExecutor:
+        if self._transform_pool is None:
+            self._transform_pool = ProcessPoolExecutor(max_workers=settings.image_transform_workers)
+        return self._transform_pool
+
+    async def _run_transform(self, body: bytes, width: Optional[int], quality: int, fmt: str) -> bytes:
+        """在进程池中缩放（信号量限制并发，CPU密集的缩放不会阻塞事件循环）"""
+        async with self._transform_slots:
+            start = time.time()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._get_transform_pool(), transform_image, body, width, quality, fmt
+                )
+            except BrokenProcessPool:
+                # 工作进程异常退出，重建进程池后由调用方决定是否重试
+                self._transform_pool = None
+                raise
+            self.stats["transforms"] += 1
+            self.stats["transform_seconds"] += time.time() - start
+            return result
+
+    async def get_transformed(self, url: str, width: Optional[int], quality: int, fmt: str) -> Tuple[CacheEntry, str]:
+        """
+        获取缩放后的图片，按 (URL, 宽度, 质量, 格式) 缓存；原图变化（ETag不同）时重新缩放
+
+        Returns:
+            (缓存项, 缓存状态 HIT/REVALIDATED/MISS)
+
+        Raises:
+            httpx.HTTPStatusError / httpx.HTTPError: 源站错误
+        """
+        key = self._url_key(f"{url}\n{width}|{quality}|{fmt}")
+        entry = await self._lookup(key)
+        if entry is not None and self._is_fresh(url, entry):
+            self.stats["transform_hits"] += 1
+            return entry, "HIT"
+
+        # 同一参数的缩放正在进行时等待其结果（在下载原图之前合并，N个并发请求只下载一次原图）
+        inflight = self._transforms.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight), "HIT"
+
+        future = asyncio.get_running_loop().create_future()
+        self._transforms[key] = future
+        try:
+            source = await self.fetch_source(url)
+            if entry is not None and source.etag and entry.headers.get("source-etag") == source.etag:
+                # 原图未变化，缩放结果继续使用
+                entry.fetched_at = time.time()
+                await self._store(key, entry)
+                future.set_result(entry)
+                return entry, "REVALIDATED"
+
+            body = await self._run_transform(source.body, width, quality, fmt)
+            digest = hashlib.sha256(f"{source.etag or ''}|{width}|{quality}|{fmt}".encode("utf-8")
+                                    + (b"" if source.etag else body)).hexdigest()[:32]
+            entry = CacheEntry(body, {
+                "content-type": TRANSFORM_CONTENT_TYPES[fmt],
+                "etag": f'"{digest}"',
+                "source-etag": source.etag,
+            }, time.time())
+            await self._store(key, entry)
+            future.set_result(entry)
+            return entry, "MISS"
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "Future exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._transforms.pop(key, None)
+            if not future.done():
+                # 发起缩放的请求被取消（客户端断开）时，等待同一结果的其他请求不能一直挂起
+                future.set_exception(RuntimeError("图片缩放请求已取消"))
+                future.exception()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            **self.stats
+        }
+
+
+# 创建全局实例
+image_proxy_cache = ImageProxyCache()
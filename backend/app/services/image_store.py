@@ -0,0 +1,447 @@
+"""
+图片存储服务
+统一的内容寻址图片存储接口，腾讯云COS和本地目录两种实现，
+按 Settings.image_store_backend 选择（未配置COS时可使用本地存储，便于院内部署和离线压测）
+"""
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+from PIL import Image
+from app.core.config import settings, project_root
+
+logger = logging.getLogger(__name__)
+
+# 图片上传专用线程池（与 asyncio.to_thread 的默认线程池隔离，避免上传阻塞其他任务）
+_upload_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    if _upload_executor is None:
+        _upload_executor = ThreadPoolExecutor(
+            max_workers=settings.cos_upload_workers,
+            thread_name_prefix="image-upload"
+        )
+    return _upload_executor
+
+
+# 内容寻址的原图URL（.../<sha256>.jpg），缩略图与原图同目录: <sha256>_<规格>.<扩展名>
+_CONTENT_URL_RE = re.compile(r"/[0-9a-f]{64}\.jpg$")
+_CONTENT_ANY_RE = re.compile(r"/[0-9a-f]{64}(_[a-z0-9]+)?\.(jpg|webp)$")
+
+# 本地图片存储的读取接口路径（local_image_store_base_url 为空时图片URL是该路径开头的相对路径）
+LOCAL_STORE_PATH = "/api/images/store/"
+
+
+def _variant_ext() -> str:
+    return "webp" if settings.image_variant_format.lower() == "webp" else "jpg"
+
+
+def is_content_addressed(url: Optional[str]) -> bool:
+    """是否为内容寻址存储的原图或缩略图URL（内容不会变化，可永久缓存）"""
+    return bool(url) and bool(_CONTENT_ANY_RE.search(url.split("?", 1)[0]))
+
+
+def local_store_key(url: Optional[str]) -> Optional[str]:
+    """本地图片存储URL（相对路径，或任意主机的绝对URL）中的对象键，不是本地存储URL时返回None"""
+    if not url:
+        return None
+    path = urlparse(url).path
+    if not path.startswith(LOCAL_STORE_PATH):
+        return None
+    return path[len(LOCAL_STORE_PATH):] or None
+
+
+def variant_urls(image_url: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    由原图URL推导各规格缩略图URL（仅内容寻址存储的图片有缩略图，其他URL返回None）
+
+    Returns:
+        {"small": ".../<sha256>_small.webp", "medium": ".../<sha256>_medium.webp"}
+    """
+    if not image_url or not settings.image_variants or not _CONTENT_URL_RE.search(image_url):
+        return None
+    base = image_url[:-len(".jpg")]
+    ext = _variant_ext()
+    return {name: f"{base}_{name}.{ext}" for name in settings.image_variants}
+
+
+def make_variants(image_bytes: bytes) -> Dict[str, bytes]:
+    """按 settings.image_variants 生成各规格缩略图（长边不超过指定像素，不放大）"""
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    webp = _variant_ext() == "webp"
+    variants = {}
+    for name, max_side in settings.image_variants.items():
+        resized = image.copy()
+        resized.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = BytesIO()
+        if webp:
+            resized.save(buffer, format="WEBP", quality=settings.image_variant_quality, method=4)
+        else:
+            resized.save(buffer, format="JPEG", quality=settings.image_variant_quality, optimize=True)
+        variants[name] = buffer.getvalue()
+    return variants
+
+
+class ImageStore:
+    """
+    图片存储接口（内容寻址：相同图片只存一份）
+
+    子类实现 _find_existing / _store / _store_variant，上传流程、缩略图生成、
+    已知对象缓存、并发去重和统计由基类统一处理
+    """
+
+    backend = "base"
+
+    def __init__(self):
+        # 已确认存在的对象（内容哈希 -> 上传结果），上传线程与事件循环共享
+        self._known: "OrderedDict[str, dict]" = OrderedDict()
+        self._known_lock = threading.Lock()
+        # 内容哈希 -> 进行中的上传（同一图片并发上传时合并）
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending = 0
+        self.stats = {"uploaded": 0, "failed": 0, "dropped": 0, "deduplicated": 0,
+                      "bytes_uploaded": 0, "bytes_saved": 0, "variant_bytes": 0, "variant_failures": 0}
+
+    @staticmethod
+    def digest(image_bytes: bytes) -> str:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def _find_existing(self, digest: str, size: int) -> Optional[dict]:
+        """查询存储中是否已有该内容的对象（未知对象缓存未命中时调用）"""
+        raise NotImplementedError
+
+    def _store(self, digest: str, image_bytes: bytes) -> dict:
+        """写入对象，返回 {"url", "key", "etag"}"""
+        raise NotImplementedError
+
+    def _store_variant(self, digest: str, key: str, data: bytes) -> None:
+        """写入缩略图对象（key 为缩略图对象键，与原图同目录）"""
+        raise NotImplementedError
+
+    def _store_variants(self, digest: str, original_key: str, image_bytes: bytes):
+        """生成并写入缩略图（失败不影响原图）"""
+        if not settings.image_variants:
+            return
+        try:
+            variants = make_variants(image_bytes)
+            base = original_key[:-len(".jpg")]
+            ext = _variant_ext()
+            for name, data in variants.items():
+                self._store_variant(digest, f"{base}_{name}.{ext}", data)
+                self.stats["variant_bytes"] += len(data)
+        except Exception as e:
+            self.stats["variant_failures"] += 1
+            logger.warning(f"⚠️ 生成缩略图失败（原图已保存）: {original_key}: {e}")
+
+    def get_presigned_url(self, key: str, expires: int = 3600) -> str:
+        """生成临时访问URL"""
+        raise NotImplementedError
+
+    def object_url(self, key: str) -> str:
+        """对象的（未签名）访问URL"""
+        raise NotImplementedError
+
+    def object_key_for_url(self, url: str) -> Optional[str]:
+        """由本存储的URL（可带签名参数）反解对象键，非本存储的URL返回None"""
+        return None
+
+    def _remember(self, digest: str, result: dict):
+        """记录已存在的对象（LRU，超出容量时淘汰最久未使用的）"""
+        with self._known_lock:
+            self._known[digest] = result
+            self._known.move_to_end(digest)
+            while len(self._known) > settings.cos_known_objects_cache_size:
+                self._known.popitem(last=False)
+
+    def _forget(self, digest: str):
+        with self._known_lock:
+            self._known.pop(digest, None)
+
+    def _lookup(self, digest: str) -> Optional[dict]:
+        with self._known_lock:
+            result = self._known.get(digest)
+            if result is not None:
+                self._known.move_to_end(digest)
+            return result
+
+    def _count_dedup(self, size: int):
+        self.stats["deduplicated"] += 1
+        self.stats["bytes_saved"] += size
+
+    def upload_image(self, image_bytes: bytes, patient_id: Optional[str] = None) -> dict:
+        """
+        存储图片（同步，对象已存在时不重复写入）
+
+        Args:
+            image_bytes: 图片字节流
+            patient_id: 患者ID（仅用于日志）
+
+        Returns:
+            {"url", "key", "sha256", "etag", "size", "deduplicated": 对象此前已存在、本次未写入}
+        """
+        if not image_bytes:
+            logger.error("❌ 上传失败: 图片数据为空")
+            raise ValueError("Image bytes is empty")
+
+        file_size = len(image_bytes)
+        digest = self.digest(image_bytes)
+
+        known = self._lookup(digest)
+        if known:
+            self._count_dedup(file_size)
+            logger.info(f"♻️ 图片已存在，跳过上传: {known['key']}")
+            return {**known, "deduplicated": True}
+
+        logger.info(f"📦 准备上传图片: size={file_size/1024:.2f}KB, patient_id={patient_id}, backend={self.backend}")
+        start_time = time.time()
+        try:
+            existing = self._find_existing(digest, file_size)
+            if existing:
+                result = {**existing, "sha256": digest, "size": file_size, "variants": variant_urls(existing["url"])}
+                self._remember(digest, result)
+                self._count_dedup(file_size)
+                logger.info(f"♻️ 图片已存在，跳过上传: {result['key']}")
+                return {**result, "deduplicated": True}
+
+            stored = self._store(digest, image_bytes)
+            self._store_variants(digest, stored["key"], image_bytes)
+        except Exception as e:
+            logger.error(f"❌ 图片上传异常: {str(e)}")
+            raise Exception(f"Failed to upload image to {self.backend}: {e}")
+
+        duration = time.time() - start_time
+        logger.info(f"✅ 图片上传成功! 耗时: {duration:.2f}s")
+        logger.info(f"🔗 URL: {stored['url']}")
+
+        result = {**stored, "sha256": digest, "size": file_size, "variants": variant_urls(stored["url"])}
+        self._remember(digest, result)
+        self.stats["bytes_uploaded"] += file_size
+        return {**result, "deduplicated": False}
+
+    async def upload_image_async(self, image_bytes: bytes, patient_id: Optional[str] = None) -> Optional[dict]:
+        """
+        异步存储图片（在专用的有界线程池中执行，不阻塞事件循环）
+
+        已知对象直接返回；同一内容的并发上传合并为一次
+
+        Returns:
+            同 upload_image；等待上传的图片过多时放弃上传并返回None
+        """
+        digest = self.digest(image_bytes)
+        known = self._lookup(digest)
+        if known:
+            self._count_dedup(len(image_bytes))
+            return {**known, "deduplicated": True}
+
+        inflight = self._inflight.get(digest)
+        if inflight is not None:
+            self._count_dedup(len(image_bytes))
+            result = await asyncio.shield(inflight)
+            return {**result, "deduplicated": True} if result else None
+
+        if self._pending >= settings.cos_upload_max_pending:
+            self.stats["dropped"] += 1
+            logger.warning(f"⚠️ 等待上传的图片过多（{self._pending}），放弃本次上传: patient_id={patient_id}")
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            _get_upload_executor(),
+            functools.partial(self.upload_image, image_bytes, patient_id)
+        )
+        self._inflight[digest] = future
+        self._pending += 1
+        try:
+            result = await future
+            self.stats["uploaded"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+            self._inflight.pop(digest, None)
+
+    def get_stats(self) -> Dict:
+        """获取上传统计（进行中/成功/失败/放弃/去重）"""
+        return {
+            "backend": self.backend,
+            "pending": self._pending,
+            "known_objects": len(self._known),
+            **self.stats
+        }
+
+
+class LocalImageStore(ImageStore):
+    """
+    本地目录图片存储
+
+    目录按日期分片: <root>/YYYYMMDD/ab/<sha256>.jpg（缩略图 <sha256>_<规格>.<扩展名> 在同目录）；
+    先写临时文件再 os.replace 原子替换，
+    读取方不会看到写了一半的图片；总大小超过上限时按修改时间淘汰最旧的图片
+    """
+
+    backend = "local"
+
+    def __init__(self, root: Optional[str] = None):
+        super().__init__()
+        self.root = Path(root or settings.local_image_store_dir or project_root / "data" / "images").resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        # 内容哈希 -> (原图相对路径, 原图和缩略图总大小, 修改时间)
+        self._index: Dict[str, Tuple[str, int, float]] = {}
+        self._total_bytes = 0
+        self._index_lock = threading.Lock()
+        self.stats["evicted"] = 0
+        self._scan()
+
+    def _scan(self):
+        """启动时扫描目录重建索引（跨日期去重和容量统计依赖该索引）"""
+        variant_sizes: Dict[str, int] = {}
+        for path in self.root.glob("*/*/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            digest = path.name[:64]
+            self._total_bytes += stat.st_size
+            if path.name == f"{digest}.jpg":
+                self._index[digest] = (path.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime)
+            else:
+                variant_sizes[digest] = variant_sizes.get(digest, 0) + stat.st_size
+        for digest, size in variant_sizes.items():
+            if digest in self._index:
+                key, original_size, mtime = self._index[digest]
+                self._index[digest] = (key, original_size + size, mtime)
+        logger.info(f"✅ 本地图片存储初始化: {self.root}，{len(self._index)} 张图片，{self._total_bytes / 1024 / 1024:.1f}MB")
+
+    def _url(self, key: str) -> str:
+        return f"{settings.local_image_store_base_url.rstrip('/')}{LOCAL_STORE_PATH}{key}"
+
+    def resolve(self, key: str) -> Optional[Path]:
+        """对象键 -> 文件路径（拒绝越出存储目录的键）"""
+        path = (self.root / key).resolve()
+        if self.root not in path.parents or not path.is_file():
+            return None
+        return path
+
+    def _find_existing(self, digest: str, size: int) -> Optional[dict]:
+        entry = self._index.get(digest)
+        if entry and (self.root / entry[0]).is_file():
+            return {"url": self._url(entry[0]), "key": entry[0], "etag": digest}
+        return None
+
+    def _write_atomic(self, key: str, data: bytes):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _store(self, digest: str, image_bytes: bytes) -> dict:
+        key = f"{datetime.now().strftime('%Y%m%d')}/{digest[:2]}/{digest}.jpg"
+        self._write_atomic(key, image_bytes)
+
+        with self._index_lock:
+            self._index[digest] = (key, len(image_bytes), time.time())
+            self._total_bytes += len(image_bytes)
+            if self._total_bytes > settings.local_image_store_max_bytes:
+                self._evict()
+        return {"url": self._url(key), "key": key, "etag": digest}
+
+    def _store_variant(self, digest: str, key: str, data: bytes) -> None:
+        self._write_atomic(key, data)
+        with self._index_lock:
+            entry = self._index.get(digest)
+            if entry:
+                self._index[digest] = (entry[0], entry[1] + len(data), entry[2])
+            self._total_bytes += len(data)
+
+    def _evict(self):
+        """淘汰最旧的图片，直到总大小降到上限的90%（调用方持有 _index_lock）"""
+        target = settings.local_image_store_max_bytes * 0.9
+        evicted = 0
+        for digest, (key, size, _) in sorted(self._index.items(), key=lambda item: item[1][2]):
+            if self._total_bytes <= target:
+                break
+            path = self.root / key
+            try:
+                for variant in path.parent.glob(f"{digest}_*"):
+                    variant.unlink()
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ 删除本地图片失败: {key}: {e}")
+                continue
+            del self._index[digest]
+            self._forget(digest)
+            self._total_bytes -= size
+            evicted += 1
+        self.stats["evicted"] += evicted
+        logger.info(f"🧹 本地图片存储超出容量，已淘汰 {evicted} 张最旧的图片")
+
+    def get_presigned_url(self, key: str, expires: int = 3600) -> str:
+        return self._url(key)
+
+    def get_stats(self) -> Dict:
+        return {
+            **super().get_stats(),
+            "root": str(self.root),
+            "objects": len(self._index),
+            "total_bytes": self._total_bytes,
+            "max_bytes": settings.local_image_store_max_bytes,
+        }
+
+
+_image_store: Optional[ImageStore] = None
+_image_store_resolved = False
+
+
+def get_image_store() -> Optional[ImageStore]:
+    """
+    获取配置的图片存储（image_store_backend: auto/cos/local/none）
+
+    auto: 配置了COS凭证时使用COS，否则使用本地存储
+    """
+    global _image_store, _image_store_resolved
+    if _image_store_resolved:
+        return _image_store
+
+    backend = (settings.image_store_backend or "auto").lower()
+    if backend in ("cos", "auto"):
+        from app.services.tencent_cos_service import get_cos_client
+        _image_store = get_cos_client()
+    if _image_store is None and backend in ("local", "auto"):
+        try:
+            _image_store = LocalImageStore()
+        except OSError as e:
+            logger.error(f"❌ 本地图片存储初始化失败: {e}")
+    if _image_store is None:
+        logger.warning(f"⚠️ 未启用图片存储（image_store_backend={backend}），将跳过图片上传")
+    _image_store_resolved = True
+    return _image_store
+
+
+def get_upload_stats() -> Dict:
+    """获取当前图片存储的上传统计"""
+    store = get_image_store()
+    return store.get_stats() if store else {"backend": None}
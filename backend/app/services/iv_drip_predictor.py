@@ -0,0 +1,201 @@
+"""
+吊瓶余量预测服务
+按患者记录每次吊瓶检测的液体余量，用线性拟合估算滴速和预计输完时间，
+据此安排下一次吊瓶检测（刚换袋时稀疏、快输完时密集），
+并在预计即将输完时提前通知护士站准备换液
+"""
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 模型未给出 fill_percent 时，按液位描述估算的剩余百分比
+FLUID_LEVEL_PERCENT = {
+    "满": 90,
+    "半满": 50,
+    "袋子空": 10,
+    "已打完": 0,
+}
+
+# 余量比上一次观测增加超过该值，视为更换了新的吊瓶
+NEW_BAG_JUMP_PERCENT = 25
+
+
+def get_websocket_manager():
+    from app.services.websocket_manager import websocket_manager
+    return websocket_manager
+
+
+class IVDripState:
+    """单个患者当前吊瓶的观测序列"""
+
+    def __init__(self):
+        self.observations = deque(maxlen=20)  # (时间戳, 剩余百分比)
+        self.bag_started_at: Optional[float] = None
+        self.notified = False  # 本袋是否已提前通知护士
+        self.rate_per_second: Optional[float] = None  # 每秒消耗的百分比
+        self.eta_alert_at: Optional[float] = None  # 预计达到告警液位的时间
+        self.eta_empty_at: Optional[float] = None  # 预计输完的时间
+        self.next_check_at: Optional[float] = None
+
+    def fit(self):
+        """最小二乘拟合 余量-时间 直线，斜率为负时得到滴速"""
+        self.rate_per_second = None
+        self.eta_alert_at = None
+        self.eta_empty_at = None
+        if len(self.observations) < 2:
+            return
+        first_t = self.observations[0][0]
+        if self.observations[-1][0] - first_t < settings.iv_drip_min_fit_span_seconds:
+            return
+
+        xs = [t - first_t for t, _ in self.observations]
+        ys = [p for _, p in self.observations]
+        n = len(xs)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        if var_x == 0:
+            return
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+        if slope >= 0:
+            return
+
+        self.rate_per_second = -slope
+        # 用拟合直线在最新时刻的值作为当前余量（比单帧判断更平滑）
+        now_t = self.observations[-1][0]
+        current = max(0.0, mean_y + slope * (now_t - first_t - mean_x))
+        self.eta_alert_at = now_t + max(0.0, current - settings.iv_drip_alert_percent) / self.rate_per_second
+        self.eta_empty_at = now_t + current / self.rate_per_second
+
+    def to_dict(self) -> Dict:
+        now = time.time()
+        return {
+            "observations": [{"timestamp": t, "fill_percent": p} for t, p in self.observations],
+            "bag_started_at": self.bag_started_at,
+            "rate_percent_per_minute": self.rate_per_second * 60 if self.rate_per_second else None,
+            "minutes_to_alert": (self.eta_alert_at - now) / 60 if self.eta_alert_at else None,
+            "minutes_to_empty": (self.eta_empty_at - now) / 60 if self.eta_empty_at else None,
+            "next_check_at": self.next_check_at,
+            "notified": self.notified,
+        }
+
+
+class IVDripPredictor:
+    """吊瓶余量预测与检测调度"""
+
+    def __init__(self):
+        self._states: Dict[str, IVDripState] = {}
+
+    @staticmethod
+    def _fill_percent(iv_drip: Dict) -> Optional[float]:
+        """从检测结果中取剩余百分比（优先使用模型估计的数值）"""
+        value = iv_drip.get("fill_percent")
+        if isinstance(value, (int, float)):
+            return max(0.0, min(100.0, float(value)))
+        if iv_drip.get("completely_empty"):
+            return 0.0
+        if iv_drip.get("bag_empty"):
+            return float(FLUID_LEVEL_PERCENT["袋子空"])
+        return FLUID_LEVEL_PERCENT.get(iv_drip.get("fluid_level"))
+
+    def _next_check_delay(self, state: IVDripState, now: float) -> Optional[float]:
+        """下一次吊瓶检测的间隔：剩余时间的一定比例，限制在最小/最大间隔之间"""
+        if state.eta_alert_at is None:
+            return None
+        remaining = state.eta_alert_at - now
+        delay = remaining * settings.iv_drip_check_fraction
+        # 尚未提前通知时，保证在通知时间点之前再检测一次，避免错过提前量
+        until_notice = remaining - settings.iv_drip_preemptive_notice_seconds
+        if not state.notified and until_notice > 0:
+            delay = min(delay, until_notice)
+        return max(settings.iv_drip_min_check_seconds, min(settings.iv_drip_max_check_seconds, delay))
+
+    async def observe(
+        self,
+        patient_id: str,
+        iv_drip: Optional[Dict],
+        patient_name: str = "",
+        observed_at: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        记录一次吊瓶检测结果，返回建议的下次检测时间（时间戳），无法预测时返回None
+
+        Args:
+            iv_drip: 分析结果中的 detections.iv_drip
+            observed_at: 画面采集时间（回放缓存帧时传入，默认当前时间）
+        """
+        now = time.time()
+        sampled_at = observed_at or now
+        state = self._states.get(patient_id)
+        if state is not None and state.observations and sampled_at < state.observations[-1][0]:
+            return state.next_check_at  # 回放的旧帧，不参与拟合
+
+        if not isinstance(iv_drip, dict):
+            # 本帧没有判断吊瓶（如裁剪图无法判断的检测项为 null），不视为没有吊瓶
+            return state.next_check_at if state is not None else None
+        if not iv_drip.get("detected"):
+            # 画面中没有吊瓶，清除状态
+            self._states.pop(patient_id, None)
+            return None
+
+        fill = self._fill_percent(iv_drip)
+        if fill is None:
+            return None
+
+        if state is None or (state.observations and fill - state.observations[-1][1] > NEW_BAG_JUMP_PERCENT):
+            if state is not None:
+                logger.info(f"💧 [吊瓶预测] 患者 {patient_id} 检测到更换新吊瓶（余量 {state.observations[-1][1]:.0f}% → {fill:.0f}%）")
+            state = IVDripState()
+            state.bag_started_at = sampled_at
+            self._states[patient_id] = state
+
+        state.observations.append((sampled_at, fill))
+        state.fit()
+
+        if state.rate_per_second:
+            logger.info(
+                f"💧 [吊瓶预测] 患者 {patient_id} 余量 {fill:.0f}%，滴速 {state.rate_per_second * 60:.2f}%/分钟，"
+                f"预计 {(state.eta_empty_at - now) / 60:.1f} 分钟后输完"
+            )
+
+        # 预计即将达到告警液位：提前通知护士站准备换液（每袋只通知一次）
+        if (state.eta_alert_at is not None and not state.notified
+                and state.eta_alert_at - now <= settings.iv_drip_preemptive_notice_seconds
+                and fill > settings.iv_drip_alert_percent):
+            state.notified = True
+            await self._notify_nurses(patient_id, patient_name, state, now)
+
+        delay = self._next_check_delay(state, now)
+        state.next_check_at = now + delay if delay is not None else None
+        return state.next_check_at
+
+    async def _notify_nurses(self, patient_id: str, patient_name: str, state: IVDripState, now: float):
+        minutes = max(0, round((state.eta_alert_at - now) / 60))
+        message = f"患者{patient_name or patient_id}的吊瓶预计约 {minutes} 分钟后需要换液，请提前准备"
+        logger.warning(f"💧 [吊瓶预测] {message}")
+        try:
+            await get_websocket_manager().broadcast_to_nurses({
+                "type": "iv_drip_forecast",
+                "patient_id": patient_id,
+                "title": "吊瓶即将输完",
+                "message": message,
+                "minutes_to_alert": minutes,
+                "minutes_to_empty": (state.eta_empty_at - now) / 60 if state.eta_empty_at else None,
+                "timestamp": datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"❌ [吊瓶预测] 推送护士站预警失败: {e}")
+
+    def get_state(self, patient_id: str) -> Optional[Dict]:
+        """获取患者当前吊瓶的预测状态"""
+        state = self._states.get(patient_id)
+        return state.to_dict() if state else None
+
+
+# 创建全局实例
+iv_drip_predictor = IVDripPredictor()
@@ -0,0 +1,125 @@
+"""
+模型调用统计服务
+按后端/模型记录滚动窗口内的延迟、错误和token用量，用于计算延迟分位数、
+对冲请求等待时间和路由降级判断
+"""
+import math
+import time
+import threading
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """单个后端/模型的滚动统计"""
+
+    def __init__(self, window_size: int = 200):
+        # (完成时间戳, 耗时秒数或None, 是否成功, prompt_tokens, completion_tokens)
+        self.samples = deque(maxlen=window_size)
+        self.success_count = 0
+        self.error_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.last_success_at: Optional[float] = None
+        self.last_error_at: Optional[float] = None
+
+    def _recent(self, max_age: Optional[float]):
+        if max_age is None:
+            return list(self.samples)
+        cutoff = time.time() - max_age
+        return [s for s in self.samples if s[0] >= cutoff]
+
+    def percentile(self, q: float, max_age: Optional[float] = None, min_samples: int = 1) -> Optional[float]:
+        """计算延迟分位数（q: 0-1），样本不足时返回None"""
+        values = sorted(s[1] for s in self._recent(max_age) if s[1] is not None)
+        if not values or len(values) < min_samples:
+            return None
+        index = min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))
+        return values[index]
+
+    def snapshot(self, max_age: Optional[float] = None) -> Dict:
+        """导出统计快照（窗口内指标 + 累计计数）"""
+        recent = self._recent(max_age)
+        errors = sum(1 for s in recent if not s[2])
+        return {
+            "window_samples": len(recent),
+            "window_error_rate": errors / len(recent) if recent else None,
+            "window_prompt_tokens": sum(s[3] for s in recent),
+            "window_completion_tokens": sum(s[4] for s in recent),
+            "p50": self.percentile(0.5, max_age),
+            "p90": self.percentile(0.9, max_age),
+            "p95": self.percentile(0.95, max_age),
+            "success_count": self.success_count,
+            "error_count": self.error_count,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "last_success_at": self.last_success_at,
+            "last_error_at": self.last_error_at,
+        }
+
+
+class ModelStatsRegistry:
+    """模型统计注册表（键为 "后端:模型"）"""
+
+    def __init__(self, window_size: int = 200, window_seconds: float = 600.0):
+        self.window_size = window_size
+        # 分位数只统计最近 window_seconds 内的样本，模型停止接收流量后统计会自然过期
+        self.window_seconds = window_seconds
+        self._stats: Dict[str, ModelStats] = {}
+        # 同步调用运行在线程池中，统计写入需要加锁
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> ModelStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = ModelStats(self.window_size)
+            self._stats[key] = stats
+        return stats
+
+    def record_success(
+        self,
+        key: str,
+        latency_seconds: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0
+    ):
+        """记录一次成功调用"""
+        now = time.time()
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        with self._lock:
+            stats = self._get(key)
+            stats.samples.append((now, latency_seconds, True, prompt_tokens, completion_tokens))
+            stats.success_count += 1
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.last_success_at = now
+
+    def record_error(self, key: str, latency_seconds: Optional[float] = None):
+        """记录一次失败调用（超时按耗时计入延迟窗口，避免分位数被低估）"""
+        now = time.time()
+        with self._lock:
+            stats = self._get(key)
+            stats.samples.append((now, latency_seconds, False, 0, 0))
+            stats.error_count += 1
+            stats.last_error_at = now
+
+    def percentile(self, key: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """获取指定模型窗口内的延迟分位数，样本数不足 min_samples 时返回None"""
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                return None
+            return stats.percentile(q, self.window_seconds, min_samples)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """导出所有模型的统计快照"""
+        with self._lock:
+            return {key: stats.snapshot(self.window_seconds) for key, stats in self._stats.items()}
+
+
+# 创建全局实例
+model_stats = ModelStatsRegistry()
@@ -0,0 +1,164 @@
+"""
+监测时间表服务
+把 monitoring_configs.monitoring_schedule（JSON）编译为按周分钟划分的区间索引，
+每帧按当前时间查出生效的检测模式（如夜间只做离床检测），监测时段之外不做分析
+
+时间表格式:
+    {
+        "windows": [
+            {"start": "22:00", "end": "06:00", "modes": ["bed_exit", "fall"]},
+            {"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "20:00"}
+        ],
+        "outside_windows": "off"
+    }
+
+    - windows 也可以直接写成列表
+    - days: 星期几（0=周一 ... 6=周日），省略表示每天；跨午夜的时段从起始日开始算
+    - start/end: "HH:MM"，end 可为 "24:00"；start 等于 end 表示全天
+    - modes: 该时段启用的检测模式，省略表示全部已启用的模式
+    - outside_windows: 不在任何时段内时 "off"（不分析，默认）或 "all"（全部模式）
+"""
+import json
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+ALL_MODES = frozenset(['fall', 'bed_exit', 'facial', 'activity', 'iv_drip'])
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _parse_time(value: str) -> int:
+    """"HH:MM" -> 当日分钟数"""
+    try:
+        hours, minutes = str(value).split(":")
+        total = int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        raise ValueError(f"时间格式错误，应为 HH:MM: {value}")
+    if not 0 <= total <= MINUTES_PER_DAY or not 0 <= int(minutes) < 60:
+        raise ValueError(f"时间超出范围: {value}")
+    return total
+
+
+class CompiledSchedule:
+    """编译后的时间表：周内分钟边界 + 每段生效的检测模式集合"""
+
+    def __init__(self, boundaries: List[int], segments: List[FrozenSet[str]]):
+        self._boundaries = boundaries
+        self._segments = segments
+
+    def active_modes(self, when: Optional[datetime] = None) -> FrozenSet[str]:
+        """查询某一时刻生效的检测模式（空集表示不在监测时段内）"""
+        when = when or datetime.now()
+        minute = when.weekday() * MINUTES_PER_DAY + when.hour * 60 + when.minute
+        return self._segments[bisect_right(self._boundaries, minute) - 1]
+
+
+def compile_schedule(raw: Union[str, Dict, List, None]) -> Optional[CompiledSchedule]:
+    """
+    编译时间表，未配置时返回None（全天监测）
+
+    Raises:
+        ValueError: 时间表格式错误
+    """
+    if raw is None or raw == "":
+        return None
+    data = json.loads(raw) if isinstance(raw, str) else raw
+
+    if isinstance(data, list):
+        data = {"windows": data}
+    if not isinstance(data, dict):
+        raise ValueError("monitoring_schedule 必须是对象或时段列表")
+    windows = data.get("windows") or []
+    if not windows:
+        return None
+
+    outside = data.get("outside_windows", "off")
+    if outside not in ("off", "all"):
+        raise ValueError(f"outside_windows 只能为 off 或 all: {outside}")
+    default_modes = ALL_MODES if outside == "all" else frozenset()
+
+    # 展开为周内区间 [start, end)
+    intervals: List[Tuple[int, int, FrozenSet[str]]] = []
+    for window in windows:
+        if not isinstance(window, dict):
+            raise ValueError(f"时段格式错误: {window}")
+        start = _parse_time(window.get("start", "00:00"))
+        end = _parse_time(window.get("end", "24:00"))
+        modes = window.get("modes")
+        if modes is None:
+            modes = ALL_MODES
+        else:
+            unknown = set(modes) - ALL_MODES
+            if unknown:
+                raise ValueError(f"未知的检测模式: {sorted(unknown)}")
+            modes = frozenset(modes)
+        days = window.get("days", list(range(7)))
+        for day in days:
+            if not isinstance(day, int) or not 0 <= day <= 6:
+                raise ValueError(f"days 取值应为 0-6（0=周一）: {day}")
+            length = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+            begin = day * MINUTES_PER_DAY + start
+            finish = begin + length
+            # 周日跨午夜的时段回绕到周一
+            if finish > MINUTES_PER_WEEK:
+                intervals.append((begin, MINUTES_PER_WEEK, modes))
+                intervals.append((0, finish - MINUTES_PER_WEEK, modes))
+            else:
+                intervals.append((begin, finish, modes))
+
+    # 所有区间端点切分出的每一段，生效模式为覆盖该段的所有时段模式的并集
+    boundaries = sorted({0, *(s for s, _, _ in intervals), *(e for _, e, _ in intervals if e < MINUTES_PER_WEEK)})
+    segments = []
+    for seg_start in boundaries:
+        active = set()
+        covered = False
+        for start, end, modes in intervals:
+            if start <= seg_start < end:
+                active |= modes
+                covered = True
+        segments.append(frozenset(active) if covered else default_modes)
+
+    return CompiledSchedule(boundaries, segments)
+
+
+class MonitoringScheduleService:
+    """患者时间表缓存（监测配置更新时失效）"""
+
+    def __init__(self):
+        # patient_id -> (原始JSON, 编译结果)，编译结果为None表示未配置时间表
+        self._cache: Dict[str, Tuple[Optional[str], Optional[CompiledSchedule]]] = {}
+
+    def get(self, patient_id: str, raw: Optional[str]) -> Optional[CompiledSchedule]:
+        """获取患者编译后的时间表，格式错误时按未配置处理并记录警告"""
+        cached = self._cache.get(patient_id)
+        # 原始JSON未变化时直接使用缓存（防止绕过接口直接修改数据库后使用旧时间表）
+        if cached and cached[0] == raw:
+            return cached[1]
+        try:
+            compiled = compile_schedule(raw)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"⚠️ [监测时间表] 患者 {patient_id} 的时间表格式错误，按全天监测处理: {e}")
+            compiled = None
+        self._cache[patient_id] = (raw, compiled)
+        return compiled
+
+    def filter_modes(self, patient_id: str, raw: Optional[str], enabled_modes: List[str],
+                     when: Optional[datetime] = None) -> List[str]:
+        """按时间表过滤已启用的检测模式，返回当前时刻生效的模式（空列表表示不在监测时段内）"""
+        schedule = self.get(patient_id, raw)
+        if schedule is None:
+            return enabled_modes
+        active = schedule.active_modes(when)
+        return [mode for mode in enabled_modes if mode in active]
+
+    def invalidate(self, patient_id: str):
+        """监测配置更新后清除缓存"""
+        self._cache.pop(patient_id, None)
+
+
+# 创建全局实例
+monitoring_schedule_service = MonitoringScheduleService()
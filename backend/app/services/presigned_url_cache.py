@@ -0,0 +1,164 @@
+"""
+预签名URL缓存
+私有读Bucket（cos_private_bucket）时，接口返回的图片URL需要预签名；
+签名结果按对象键缓存到临近过期，临近过期前在后台重新签名，
+列表接口一次性批量解析所有图片URL，不再每次渲染逐个签名
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.services.image_store import ImageStore, get_image_store, variant_urls
+
+logger = logging.getLogger(__name__)
+
+
+class PresignedURLCache:
+    """预签名URL缓存（对象键 -> (签名URL, 过期时间)，LRU）"""
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()  # 正在后台刷新的对象键
+        self.stats = {"hits": 0, "signed": 0, "refreshed": 0, "errors": 0}
+
+    def _signing_store(self) -> Optional[ImageStore]:
+        """需要签名时返回图片存储，否则返回None"""
+        if not settings.cos_private_bucket:
+            return None
+        store = get_image_store()
+        return store if store is not None and store.backend == "cos" else None
+
+    def _sign(self, store: ImageStore, key: str) -> str:
+        expires = settings.cos_presign_expires_seconds
+        signed_url = store.get_presigned_url(key, expires=expires)
+        with self._lock:
+            self._entries[key] = (signed_url, time.time() + expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.cos_presign_cache_size:
+                self._entries.popitem(last=False)
+        return signed_url
+
+    def _refresh(self, store: ImageStore, keys: List[str]):
+        """后台重新签名临近过期的URL"""
+        try:
+            for key in keys:
+                try:
+                    self._sign(store, key)
+                    self.stats["refreshed"] += 1
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    logger.warning(f"⚠️ 刷新预签名URL失败: {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
+
+    def _schedule_refresh(self, store: ImageStore, keys: List[str]):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._refresh(store, keys)
+            return
+        loop.run_in_executor(None, self._refresh, store, keys)
+
+    def resolve_many(self, urls: Iterable[Optional[str]]) -> Dict[str, str]:
+        """
+        批量解析图片URL（未启用私有Bucket或非本Bucket的URL原样返回）
+
+        签名剩余有效期不足 cos_presign_min_remaining_seconds 时同步重新签名；
+        不足两倍该时长时先返回现有签名，同时在后台刷新
+
+        Returns:
+            {原URL: 可访问的URL}
+        """
+        urls = {url for url in urls if url}
+        store = self._signing_store()
+        if store is None:
+            return {url: url for url in urls}
+
+        now = time.time()
+        min_remaining = settings.cos_presign_min_remaining_seconds
+        resolved = {}
+        to_refresh = []
+        for url in urls:
+            key = store.object_key_for_url(url)
+            if key is None:
+                resolved[url] = url
+                continue
+            with self._lock:
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+            if cached is not None and cached[1] - now > min_remaining:
+                self.stats["hits"] += 1
+                resolved[url] = cached[0]
+                if cached[1] - now <= 2 * min_remaining:
+                    with self._lock:
+                        if key not in self._refreshing:
+                            self._refreshing.add(key)
+                            to_refresh.append(key)
+                continue
+            try:
+                resolved[url] = self._sign(store, key)
+                self.stats["signed"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"❌ 生成预签名URL失败，返回原URL: {key}: {e}")
+                resolved[url] = url
+        if to_refresh:
+            self._schedule_refresh(store, to_refresh)
+        return resolved
+
+    def resolve(self, url: Optional[str]) -> Optional[str]:
+        """解析单个图片URL"""
+        if not url:
+            return url
+        return self.resolve_many([url])[url]
+
+    def canonical(self, url: str) -> str:
+        """去掉本Bucket签名URL中的签名参数（同一对象的不同签名共用代理缓存）"""
+        store = get_image_store()
+        if store is None or store.backend != "cos":
+            return url
+        key = store.object_key_for_url(url)
+        return store.object_url(key) if key else url
+
+    def get_stats(self) -> Dict:
+        return {"enabled": self._signing_store() is not None, "entries": len(self._entries), **self.stats}
+
+
+# 创建全局实例
+presigned_url_cache = PresignedURLCache()
+
+
+def with_image_urls(items: List[dict], base_url: Optional[str] = None) -> List[dict]:
+    """
+    为列表中每项补充缩略图URL（image_variants），并一次性批量解析 image_url 和缩略图URL
+
+    需在 image_url 确定后调用（缩略图URL由未签名的原图URL推导）
+
+    Args:
+        base_url: 请求的根地址；本地图片存储未配置 local_image_store_base_url 时
+            图片URL是相对路径，按该地址补全为绝对URL（移动端无法加载相对路径）
+    """
+    for item in items:
+        item["image_variants"] = variant_urls(item.get("image_url"))
+    urls = []
+    for item in items:
+        urls.append(item.get("image_url"))
+        urls.extend((item["image_variants"] or {}).values())
+    resolved = presigned_url_cache.resolve_many(urls)
+    if base_url:
+        prefix = base_url.rstrip("/")
+        for url, value in resolved.items():
+            if value and value.startswith("/"):
+                resolved[url] = prefix + value
+    for item in items:
+        if item.get("image_url"):
+            item["image_url"] = resolved[item["image_url"]]
+        if item["image_variants"]:
+            item["image_variants"] = {name: resolved[url] for name, url in item["image_variants"].items()}
+    return items
@@ -0,0 +1,146 @@
+"""
+告警接收人目录
+按患者缓存家属、患者本人的用户，以及在岗护士（和告警升级用到的医生、管理员）列表：
+告警推送、告警升级、SOS、语音提醒都从这里取接收人，缓存命中时不查询数据库。
+写 users / patient_guardians 的接口（注册、扫码关联）调用 invalidate 使缓存失效；
+脚本等进程外的修改由 recipient_directory_ttl_seconds 兜底
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.database import execute_query
+
+logger = logging.getLogger(__name__)
+
+
+class PatientRecipients:
+    """单个患者的接收人"""
+
+    __slots__ = ("guardians", "patient_user_id", "loaded_at")
+
+    def __init__(self, guardians: List[Dict], patient_user_id: Optional[str]):
+        self.guardians = guardians  # 按 priority 排序：user_id, role, full_name, phone, relationship, priority
+        self.patient_user_id = patient_user_id  # 患者本人的用户（不是该患者家属的、关联该患者的用户）
+        self.loaded_at = time.time()
+
+
+class RecipientDirectory:
+    """告警接收人目录（进程内缓存）"""
+
+    def __init__(self):
+        self._patients: Dict[str, PatientRecipients] = {}
+        self._staff: Dict[str, Tuple[List[Dict], float]] = {}  # 角色 -> (用户列表, 加载时间)
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._generation = 0  # 每次失效加一，加载期间发生失效的结果不写入缓存
+        self.stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.time() - loaded_at < settings.recipient_directory_ttl_seconds
+
+    async def _single_flight(self, key: str, loader):
+        future = self._loading.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            result = await loader()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待者时避免 "exception was never retrieved"
+            raise
+        finally:
+            self._loading.pop(key, None)
+
+    async def get_staff(self, role: str) -> List[Dict]:
+        """某一角色（nurse/doctor/admin）的启用用户列表：user_id, role, full_name, phone"""
+        cached = self._staff.get(role)
+        if cached is not None and self._fresh(cached[1]):
+            self.stats["hits"] += 1
+            return cached[0]
+
+        async def load():
+            generation = self._generation
+            users = await execute_query(
+                "SELECT user_id, role, full_name, phone FROM users WHERE role = ? AND is_active = 1",
+                (role,)
+            )
+            self.stats["loads"] += 1
+            if generation == self._generation:
+                self._staff[role] = (users, time.time())
+            return users
+        return await self._single_flight(f"role:{role}", load)
+
+    async def get_nurses(self) -> List[Dict]:
+        """在岗（启用）护士列表"""
+        return await self.get_staff("nurse")
+
+    async def get_patient(self, patient_id: str) -> PatientRecipients:
+        """患者的家属和患者本人的用户"""
+        entry = self._patients.get(patient_id)
+        if entry is not None and self._fresh(entry.loaded_at):
+            self.stats["hits"] += 1
+            return entry
+
+        async def load():
+            generation = self._generation
+            rows = await execute_query(
+                """SELECT u.user_id, u.role, u.full_name, u.phone, pg.relationship, pg.priority, 'guardian' AS kind
+                   FROM patient_guardians pg
+                   JOIN users u ON pg.guardian_user_id = u.user_id
+                   WHERE pg.patient_id = ? AND u.is_active = 1
+                   UNION ALL
+                   SELECT u.user_id, u.role, u.full_name, u.phone, NULL, NULL, 'patient' AS kind
+                   FROM users u
+                   WHERE u.patient_id = ?
+                     AND u.is_active = 1
+                     AND u.user_id NOT IN (
+                         SELECT guardian_user_id
+                         FROM patient_guardians
+                         WHERE patient_id = ?
+                     )""",
+                (patient_id, patient_id, patient_id)
+            )
+            self.stats["loads"] += 1
+            guardians, patient_user_id = [], None
+            for row in rows:
+                if row.pop("kind") == "guardian":
+                    guardians.append(row)
+                elif patient_user_id is None:
+                    patient_user_id = row["user_id"]
+            guardians.sort(key=lambda row: row["priority"] if row["priority"] is not None else 0)
+            entry = PatientRecipients(guardians, patient_user_id)
+            if generation == self._generation:
+                self._patients[patient_id] = entry
+            return entry
+        return await self._single_flight(f"patient:{patient_id}", load)
+
+    def invalidate(self, patient_id: Optional[str] = None):
+        """
+        使缓存失效
+
+        Args:
+            patient_id: 只失效该患者的家属/患者用户；None 表示全部失效（含护士等角色列表）
+        """
+        self._generation += 1
+        self.stats["invalidations"] += 1
+        if patient_id is None:
+            self._patients.clear()
+            self._staff.clear()
+        else:
+            self._patients.pop(patient_id, None)
+
+    def get_stats(self) -> Dict:
+        return {
+            "patients": len(self._patients),
+            "staff": {role: len(users) for role, (users, _) in self._staff.items()},
+            **self.stats
+        }
+
+
+# 创建全局实例
+recipient_directory = RecipientDirectory()
@@ -0,0 +1,177 @@
+"""
+感兴趣区域（ROI）裁剪服务
+完整画面分析时让模型返回吊瓶、生命监护仪的位置框，按摄像头记住；
+之后只需检查吊瓶/监护仪的帧只发送裁剪后的小图，减少上传数据量和模型延迟。
+画面发生明显变化（平均哈希差异超过阈值）或区域过期时重新做完整画面分析
+"""
+import time
+import asyncio
+import logging
+from io import BytesIO
+from typing import Dict, List, Optional
+from PIL import Image
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 可裁剪的区域
+ROI_REGIONS = ("iv_drip", "vital_monitor")
+# 吊瓶区域能判断的检测模式
+IV_DRIP_MODES = {"iv_drip"}
+# 需要看到病床和病人的检测模式，到期时必须发送完整画面
+PATIENT_MODES = {"fall", "bed_exit", "activity", "facial"}
+
+
+class CameraROI:
+    """单个摄像头记住的区域"""
+
+    def __init__(self, regions: Dict[str, List[float]], frame_hash: int, scene_type: Optional[str]):
+        self.regions = regions  # 区域名 -> [x1, y1, x2, y2]（0-1相对坐标）
+        self.frame_hash = frame_hash  # 获取区域时完整画面的平均哈希
+        self.scene_type = scene_type
+        self.updated_at = time.time()
+
+
+class ROIService:
+    """按摄像头管理感兴趣区域并裁剪图片"""
+
+    def __init__(self):
+        self._cameras: Dict[str, CameraROI] = {}
+        self.stats = {
+            "full_frames": 0,
+            "cropped_frames": 0,
+            "scene_changes": 0,
+            "full_bytes": 0,
+            "cropped_bytes": 0,
+        }
+
+    @staticmethod
+    def _average_hash(image: Image.Image) -> int:
+        """8x8 平均哈希，用于判断画面是否明显变化"""
+        small = image.convert("L").resize((8, 8), Image.BILINEAR)
+        pixels = list(small.getdata())
+        mean = sum(pixels) / len(pixels)
+        value = 0
+        for pixel in pixels:
+            value = (value << 1) | (1 if pixel >= mean else 0)
+        return value
+
+    @staticmethod
+    def _valid_box(box) -> Optional[List[float]]:
+        """校验模型返回的区域框（相对坐标），面积过小或接近整幅画面时不使用"""
+        if not isinstance(box, (list, tuple)) or len(box) != 4:
+            return None
+        try:
+            x1, y1, x2, y2 = (float(v) for v in box)
+        except (TypeError, ValueError):
+            return None
+        if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+            return None
+        area = (x2 - x1) * (y2 - y1)
+        if area < 0.002 or area > settings.roi_max_area_ratio:
+            return None
+        return [x1, y1, x2, y2]
+
+    def _crop_region(self, roi: Optional[CameraROI], detection_modes: List[str]) -> Optional[str]:
+        """
+        本帧可以使用的裁剪区域：只有到期的检测模式都能从该区域判断时才裁剪，否则发送完整画面
+        （跌倒、离床等每帧都要检查，监护仪场景的画面里也可能有病床和病人）
+        """
+        if not roi or not detection_modes:
+            return None
+        modes = set(detection_modes)
+        if "iv_drip" in roi.regions and modes <= IV_DRIP_MODES:
+            return "iv_drip"
+        # 生命体征不属于检测模式，监护仪场景每帧都会检查；吊瓶到期时监护仪区域无法判断吊瓶，发送完整画面
+        if (roi.scene_type == "monitoring_device" and "vital_monitor" in roi.regions
+                and not modes & (PATIENT_MODES | IV_DRIP_MODES)):
+            return "vital_monitor"
+        return None
+
+    def _prepare_sync(self, image_bytes: bytes, roi: Optional[CameraROI], detection_modes: List[str]) -> Dict:
+        image = Image.open(BytesIO(image_bytes))
+        frame_hash = self._average_hash(image)
+        plan = {"image_bytes": image_bytes, "region": None, "box": None,
+                "frame_hash": frame_hash, "scene_changed": False}
+
+        region = self._crop_region(roi, detection_modes)
+        if not region:
+            return plan
+        if bin(frame_hash ^ roi.frame_hash).count("1") > settings.roi_scene_change_bits:
+            plan["scene_changed"] = True
+            return plan
+
+        x1, y1, x2, y2 = roi.regions[region]
+        pad = settings.roi_padding
+        width, height = image.size
+        left = max(0, int((x1 - pad * (x2 - x1)) * width))
+        top = max(0, int((y1 - pad * (y2 - y1)) * height))
+        right = min(width, int((x2 + pad * (x2 - x1)) * width))
+        bottom = min(height, int((y2 + pad * (y2 - y1)) * height))
+        cropped = image.crop((left, top, right, bottom))
+        if cropped.mode != "RGB":
+            cropped = cropped.convert("RGB")
+        buffer = BytesIO()
+        cropped.save(buffer, format="JPEG", quality=settings.roi_jpeg_quality)
+        plan.update({"image_bytes": buffer.getvalue(), "region": region, "box": [left, top, right, bottom]})
+        return plan
+
+    async def prepare(self, camera_key: str, image_bytes: bytes, detection_modes: List[str]) -> Dict:
+        """
+        决定本帧发送完整画面还是裁剪区域
+
+        Returns:
+            {"image_bytes": 发送给模型的图片, "region": 裁剪区域名（完整画面为None）,
+             "box": 像素裁剪框, "frame_hash": 完整画面平均哈希, "scene_changed": 是否因画面变化放弃裁剪}
+        """
+        roi = self._cameras.get(camera_key)
+        if roi and time.time() - roi.updated_at > settings.roi_max_age_seconds:
+            self._cameras.pop(camera_key, None)
+            roi = None
+        try:
+            plan = await asyncio.to_thread(self._prepare_sync, image_bytes, roi, detection_modes)
+        except Exception as e:
+            logger.warning(f"⚠️ [ROI] 图片裁剪失败，使用完整画面: {e}")
+            return {"image_bytes": image_bytes, "region": None, "box": None, "frame_hash": None, "scene_changed": False}
+
+        if plan["scene_changed"]:
+            self.stats["scene_changes"] += 1
+            self._cameras.pop(camera_key, None)
+            logger.info(f"🔄 [ROI] 摄像头 {camera_key} 画面明显变化，重新进行完整画面分析")
+        if plan["region"]:
+            self.stats["cropped_frames"] += 1
+            self.stats["full_bytes"] += len(image_bytes)
+            self.stats["cropped_bytes"] += len(plan["image_bytes"])
+            logger.info(f"✂️ [ROI] 摄像头 {camera_key} 裁剪 {plan['region']} 区域: {len(image_bytes)} → {len(plan['image_bytes'])} bytes")
+        else:
+            self.stats["full_frames"] += 1
+        return plan
+
+    def update(self, camera_key: str, plan: Dict, analysis_result: Dict):
+        """完整画面分析完成后，记录模型返回的区域框和场景类型"""
+        if plan.get("region") or plan.get("frame_hash") is None:
+            return
+        raw_regions = analysis_result.get("regions") or {}
+        regions = {}
+        if isinstance(raw_regions, dict):
+            for name in ROI_REGIONS:
+                box = self._valid_box(raw_regions.get(name))
+                if box:
+                    regions[name] = box
+        if not regions:
+            self._cameras.pop(camera_key, None)
+            return
+        self._cameras[camera_key] = CameraROI(regions, plan["frame_hash"], analysis_result.get("scene_type"))
+        logger.info(f"📐 [ROI] 摄像头 {camera_key} 区域已更新: {regions}")
+
+    def get_stats(self) -> Dict:
+        """获取裁剪统计"""
+        return {
+            "enabled": settings.roi_crop_enabled,
+            "cameras": len(self._cameras),
+            **self.stats
+        }
+
+
+# 创建全局实例
+roi_service = ROIService()
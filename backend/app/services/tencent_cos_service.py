@@ -8,18 +8,21 @@ from datetime import datetime
 from pathlib import Path
 import logging
 from typing import Optional
-import tempfile
-import os
+from urllib.parse import unquote
+from app.services.image_store import ImageStore
 
 logger = logging.getLogger(__name__)
 
 
-class TencentCOSClient:
+class TencentCOSClient(ImageStore):
     """腾讯云COS客户端"""
     
+    backend = "cos"
+    
     def __init__(self):
         from app.core.config import settings
         
+        super().__init__()
         self.settings = settings
         
         # 检查配置
@@ -56,95 +59,48 @@ class TencentCOSClient:
             logger.error(f"❌ 腾讯云COS客户端初始化失败: {e}")
             raise
     
-    def upload_image(
-        self,
-        image_bytes: bytes,
-        patient_id: str,
-        alert_id: Optional[str] = None,
-        filename: Optional[str] = None
-    ) -> dict:
-        """
-        上传图片到腾讯云COS
-        
-        Args:
-            image_bytes: 图片字节流
-            patient_id: 患者ID
-            alert_id: 告警ID（可选）
-            filename: 自定义文件名（可选）
-        
-        Returns:
-            {
-                "url": "https://bucket.cos.region.myqcloud.com/path/to/image.jpg",
-                "key": "smartguard/alerts/20251227/patient_id/alert_id/image.jpg",
-                "size": 1024000
-            }
-        """
-        import time
-        
-        if not image_bytes:
-            logger.error("❌ 上传失败: 图片数据为空")
-            raise ValueError("Image bytes is empty")
-        
-        file_size = len(image_bytes)
-        logger.info(f"📦 准备上传图片: size={file_size/1024:.2f}KB, patient_id={patient_id}")
-        
-        # 生成COS对象键
-        date_str = datetime.now().strftime("%Y%m%d")
-        if not filename:
-            timestamp = datetime.now().strftime('%H%M%S')
-            filename = f"{timestamp}.jpg"
-        
-        # 构建路径: smartguard/alerts/YYYYMMDD/patient_id/alert_id/filename
-        if alert_id:
-            key = f"{self.prefix}{date_str}/{patient_id}/{alert_id}/{filename}"
-        else:
-            key = f"{self.prefix}{date_str}/{patient_id}/{filename}"
-        
+    def _object_key(self, digest: str) -> str:
+        """按内容哈希生成对象键，如 smartguard/alerts/ab/cd/abcd....jpg"""
+        return f"{self.prefix}{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+    
+    def object_url(self, key: str) -> str:
+        return f"https://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
+    
+    def object_key_for_url(self, url: str) -> Optional[str]:
+        base = f"https://{self.bucket}.cos.{self.region}.myqcloud.com/"
+        if not url.startswith(base):
+            return None
+        key = url[len(base):].split("?", 1)[0]
+        return unquote(key) or None
+    
+    def _find_existing(self, digest: str, size: int) -> Optional[dict]:
+        # 进程重启后内存缓存为空，先确认对象是否已存在（HEAD请求远小于重新上传）
+        key = self._object_key(digest)
+        if self.client.object_exists(Bucket=self.bucket, Key=key):
+            return {"url": self.object_url(key), "key": key, "etag": "N/A"}
+        return None
+    
+    def _store(self, digest: str, image_bytes: bytes) -> dict:
+        key = self._object_key(digest)
         logger.info(f"🔑 目标COS Key: {key}")
-        
-        start_time = time.time()
-        
-        # 使用临时文件上传
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                tmp_file.write(image_bytes)
-                tmp_file_path = tmp_file.name
-            
-            try:
-                # 上传文件
-                response = self.client.upload_file(
-                    Bucket=self.bucket,
-                    LocalFilePath=tmp_file_path,
-                    Key=key,
-                    PartSize=1,  # 分块大小(MB)，图片通常较小
-                    MAXThread=1,  # 并发线程数
-                    EnableMD5=False
-                )
-                
-                duration = time.time() - start_time
-                
-                # 生成访问URL
-                url = f"https://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
-                etag = response.get("ETag", "N/A")
-                
-                logger.info(f"✅ 图片上传成功! 耗时: {duration:.2f}s")
-                logger.info(f"🔗 URL: {url}")
-                logger.info(f"📋 ETag: {etag}")
-                
-                return {
-                    "url": url,
-                    "key": key,
-                    "etag": etag,
-                    "size": file_size
-                }
-            finally:
-                # 清理临时文件
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
-                    
-        except Exception as e:
-            logger.error(f"❌ COS上传异常: {str(e)}")
-            raise Exception(f"Failed to upload image to COS: {e}")
+        # 直接从内存字节流上传（图片较小，无需临时文件和分块上传）
+        response = self.client.put_object(
+            Bucket=self.bucket,
+            Body=image_bytes,
+            Key=key,
+            ContentType='image/jpeg'
+        )
+        etag = response.get("ETag", "N/A")
+        logger.info(f"📋 ETag: {etag}")
+        return {"url": self.object_url(key), "key": key, "etag": etag}
+    
+    def _store_variant(self, digest: str, key: str, data: bytes) -> None:
+        self.client.put_object(
+            Bucket=self.bucket,
+            Body=data,
+            Key=key,
+            ContentType='image/webp' if key.endswith('.webp') else 'image/jpeg'
+        )
     
     def get_presigned_url(self, key: str, expires: int = 3600) -> str:
         """
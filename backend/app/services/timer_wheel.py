@@ -0,0 +1,146 @@
+"""
+时间轮定时器
+离床计时、卧床计时等按患者的大量长时定时器统一放在一个哈希时间轮中：
+添加、取消都是 O(1)，一个后台任务每个刻度推进一格，只处理当前格中的定时器，
+不需要为每个定时器创建任务，也不需要每帧查询数据库判断是否超时
+"""
+import time
+import asyncio
+import logging
+import itertools
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """定时器句柄（用于取消）"""
+
+    __slots__ = ("timer_id", "deadline", "slot", "rounds", "callback", "args", "cancelled")
+
+    def __init__(self, timer_id: int, deadline: float, slot: int, rounds: int, callback: Callable, args: tuple):
+        self.timer_id = timer_id
+        self.deadline = deadline
+        self.slot = slot
+        self.rounds = rounds  # 还需转过的整圈数
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    """哈希时间轮（单线程，在事件循环中使用）"""
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 3600):
+        self.tick_seconds = tick_seconds
+        self._slots: List[Dict[int, TimerHandle]] = [dict() for _ in range(slots)]
+        self._cursor = 0  # 下一个要处理的格
+        self._cursor_time: Optional[float] = None  # 下一个要处理的格对应的时间
+        self._ids = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self._pending_tasks = set()
+        self._count = 0
+        self.stats = {"scheduled": 0, "cancelled": 0, "fired": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """
+        delay 秒后调用 callback(*args)（可以是协程函数），精度为一个刻度
+
+        Returns:
+            定时器句柄
+        """
+        now = time.time()
+        if self._cursor_time is None:
+            self._cursor_time = now
+        # 从下一个要处理的格起算需要经过的格数（至少1格，保证不早于 delay 触发）
+        ticks = max(1, int((now + max(delay, 0) - self._cursor_time) / self.tick_seconds) + 1)
+        slot = (self._cursor + ticks - 1) % len(self._slots)
+        rounds = (ticks - 1) // len(self._slots)
+        handle = TimerHandle(next(self._ids), now + max(delay, 0), slot, rounds, callback, args)
+        self._slots[slot][handle.timer_id] = handle
+        self._count += 1
+        self.stats["scheduled"] += 1
+        return handle
+
+    def cancel(self, handle: Optional[TimerHandle]) -> bool:
+        """取消定时器（已触发或已取消时返回False）"""
+        if handle is None or handle.cancelled:
+            return False
+        handle.cancelled = True
+        if self._slots[handle.slot].pop(handle.timer_id, None) is None:
+            return False
+        self._count -= 1
+        self.stats["cancelled"] += 1
+        return True
+
+    def _fire(self, handle: TimerHandle):
+        try:
+            result = handle.callback(*handle.args)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self._pending_tasks.add(task)
+                task.add_done_callback(self._task_done)
+            self.stats["fired"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"❌ [时间轮] 定时器回调失败: {e}")
+
+    def _task_done(self, task: asyncio.Task):
+        self._pending_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.error(f"❌ [时间轮] 定时器回调失败: {task.exception()}")
+
+    def advance(self, now: Optional[float] = None):
+        """处理截至 now 已到期的格"""
+        now = now or time.time()
+        if self._cursor_time is None:
+            self._cursor_time = now
+        while self._cursor_time + self.tick_seconds <= now:
+            bucket = self._slots[self._cursor]
+            due = [handle for handle in bucket.values() if handle.rounds == 0]
+            for handle in bucket.values():
+                if handle.rounds > 0:
+                    handle.rounds -= 1
+            for handle in due:
+                del bucket[handle.timer_id]
+                self._count -= 1
+                handle.cancelled = True  # 已触发，之后的 cancel 返回False
+                self._fire(handle)
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            self._cursor_time += self.tick_seconds
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            self.advance()
+
+    async def start(self):
+        if self._task is None:
+            self._cursor_time = self._cursor_time or time.time()
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"⏱️ [时间轮] 已启动: 刻度{self.tick_seconds}秒, {len(self._slots)}格")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict:
+        return {"timers": self._count, **self.stats}
+
+
+def _create_timer_wheel() -> TimerWheel:
+    from app.core.config import settings
+    return TimerWheel(settings.timer_wheel_tick_seconds, settings.timer_wheel_slots)
+
+
+# 创建全局实例
+timer_wheel = _create_timer_wheel()
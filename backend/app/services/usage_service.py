@@ -0,0 +1,208 @@
+"""
+模型用量与预算服务
+记录每次视觉模型调用的token用量，按患者/病区/模型/小时汇总到 model_usage_rollups 表，
+并在患者或病区超出每日token预算时降低该患者的采样频率（存在未处理的紧急告警时不限制）
+"""
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.database import execute_query, execute_update
+
+logger = logging.getLogger(__name__)
+
+
+class UsageService:
+    """模型用量统计与预算控制"""
+
+    def __init__(self):
+        # 当日累计token（内存缓存，首次使用时从汇总表加载，跨天自动重置）
+        self._day: Optional[str] = None
+        self._patient_tokens: Dict[str, int] = {}
+        self._ward_tokens: Dict[str, int] = {}
+        # patient_id -> 超出预算后最近一次放行分析的时间
+        self._last_sampled_at: Dict[str, float] = {}
+        self.throttle_stats = {
+            "sampled_over_budget": 0,  # 超出预算但到达采样间隔，放行
+            "skipped": 0,  # 超出预算被跳过的帧
+            "critical_bypass": 0,  # 超出预算但存在紧急告警，放行
+        }
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """按配置的每千token价格估算费用（未配置价格的模型按0计）"""
+        prices = settings.vision_token_prices.get(model) or {}
+        return (
+            prompt_tokens * float(prices.get("prompt", 0)) +
+            completion_tokens * float(prices.get("completion", 0))
+        ) / 1000
+
+    async def _ensure_today(self):
+        """跨天时重置内存计数，并从汇总表加载当日已用token（服务重启后预算不丢失）"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        if self._day == today:
+            return
+        self._day = today
+        self._patient_tokens = {}
+        self._ward_tokens = {}
+        self._last_sampled_at = {}
+        try:
+            rows = await execute_query(
+                """SELECT patient_id, ward_id, SUM(prompt_tokens + completion_tokens) AS tokens
+                   FROM model_usage_rollups
+                   WHERE bucket_hour >= ?
+                   GROUP BY patient_id, ward_id""",
+                (f"{today} 00:00",)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [用量] 加载当日用量失败（可能未执行 add_usage_tables.py 迁移）: {e}")
+            return
+        for row in rows:
+            tokens = row.get("tokens") or 0
+            self._patient_tokens[row["patient_id"]] = self._patient_tokens.get(row["patient_id"], 0) + tokens
+            if row.get("ward_id"):
+                self._ward_tokens[row["ward_id"]] = self._ward_tokens.get(row["ward_id"], 0) + tokens
+
+    async def record_usage(self, patient_id: str, ward_id: Optional[str], usage: Optional[Dict]):
+        """记录一次模型调用的用量（usage 为 gemini_analyzer 返回结果中的 usage 字段）"""
+        if not usage:
+            return
+        if usage.get("hedge_loser"):
+            # 对冲请求中落败的一方已收到响应，按一次独立调用计费
+            await self.record_usage(patient_id, ward_id, usage["hedge_loser"])
+        await self._ensure_today()
+
+        model = usage.get("model") or "unknown"
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        total_tokens = prompt_tokens + completion_tokens
+        ward_id = ward_id or ""
+
+        self._patient_tokens[patient_id] = self._patient_tokens.get(patient_id, 0) + total_tokens
+        if ward_id:
+            self._ward_tokens[ward_id] = self._ward_tokens.get(ward_id, 0) + total_tokens
+
+        bucket_hour = datetime.now().strftime("%Y-%m-%d %H:00")
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        try:
+            await execute_update(
+                """INSERT INTO model_usage_rollups
+                   (bucket_hour, patient_id, ward_id, model, call_count,
+                    prompt_tokens, completion_tokens, estimated_cost, updated_at)
+                   VALUES (?, ?, ?, ?, 1, ?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(bucket_hour, patient_id, ward_id, model) DO UPDATE SET
+                       call_count = call_count + 1,
+                       prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                       completion_tokens = completion_tokens + excluded.completion_tokens,
+                       estimated_cost = estimated_cost + excluded.estimated_cost,
+                       updated_at = CURRENT_TIMESTAMP""",
+                (bucket_hour, patient_id, ward_id, model, prompt_tokens, completion_tokens, cost)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ [用量] 保存用量汇总失败（可能未执行 add_usage_tables.py 迁移）: {e}")
+
+    def _over_budget(self, patient_id: str, ward_id: Optional[str]) -> Optional[str]:
+        """返回超出的预算类型（patient/ward），未超出返回None"""
+        patient_budget = settings.patient_daily_token_budget
+        if patient_budget and self._patient_tokens.get(patient_id, 0) >= patient_budget:
+            return "patient"
+        ward_budget = settings.ward_daily_token_budget
+        if ward_budget and ward_id and self._ward_tokens.get(ward_id, 0) >= ward_budget:
+            return "ward"
+        return None
+
+    async def _has_active_critical_alert(self, patient_id: str) -> bool:
+        """患者是否存在未解决的紧急告警"""
+        rows = await execute_query(
+            """SELECT 1 FROM alerts
+               WHERE patient_id = ? AND severity = 'critical'
+                 AND status IN ('pending', 'acknowledged')
+               LIMIT 1""",
+            (patient_id,)
+        )
+        return bool(rows)
+
+    async def should_sample(self, patient_id: str, ward_id: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        判断本帧是否需要分析
+
+        Returns:
+            (是否分析, 超出的预算类型)；未超出预算时始终分析
+        """
+        if not settings.patient_daily_token_budget and not settings.ward_daily_token_budget:
+            return True, None
+        await self._ensure_today()
+
+        exceeded = self._over_budget(patient_id, ward_id)
+        if not exceeded:
+            return True, None
+
+        if await self._has_active_critical_alert(patient_id):
+            self.throttle_stats["critical_bypass"] += 1
+            return True, exceeded
+
+        now = time.time()
+        last = self._last_sampled_at.get(patient_id)
+        if last is None or now - last >= settings.over_budget_min_interval_seconds:
+            self._last_sampled_at[patient_id] = now
+            self.throttle_stats["sampled_over_budget"] += 1
+            return True, exceeded
+
+        self.throttle_stats["skipped"] += 1
+        return False, exceeded
+
+    async def get_usage_summary(self, group_by: str = "patient", days: int = 1) -> list:
+        """
+        按维度汇总用量（用于容量规划）
+
+        Args:
+            group_by: patient / ward / model / hour
+            days: 统计最近几天
+        """
+        columns = {
+            "patient": "patient_id",
+            "ward": "ward_id",
+            "model": "model",
+            "hour": "bucket_hour",
+        }
+        column = columns.get(group_by)
+        if not column:
+            raise ValueError(f"不支持的汇总维度: {group_by}")
+
+        since = datetime.fromtimestamp(time.time() - days * 86400).strftime("%Y-%m-%d %H:00")
+        return await execute_query(
+            f"""SELECT {column} AS key,
+                       SUM(call_count) AS call_count,
+                       SUM(prompt_tokens) AS prompt_tokens,
+                       SUM(completion_tokens) AS completion_tokens,
+                       SUM(prompt_tokens + completion_tokens) AS total_tokens,
+                       SUM(estimated_cost) AS estimated_cost
+                FROM model_usage_rollups
+                WHERE bucket_hour >= ?
+                GROUP BY {column}
+                ORDER BY {'key' if group_by == 'hour' else 'total_tokens DESC'}""",
+            (since,)
+        )
+
+    async def get_budget_status(self) -> Dict:
+        """当日预算使用情况"""
+        await self._ensure_today()
+        return {
+            "day": self._day,
+            "patient_daily_token_budget": settings.patient_daily_token_budget,
+            "ward_daily_token_budget": settings.ward_daily_token_budget,
+            "over_budget_min_interval_seconds": settings.over_budget_min_interval_seconds,
+            "patients_over_budget": [
+                pid for pid, tokens in self._patient_tokens.items()
+                if settings.patient_daily_token_budget and tokens >= settings.patient_daily_token_budget
+            ],
+            "wards_over_budget": [
+                wid for wid, tokens in self._ward_tokens.items()
+                if settings.ward_daily_token_budget and tokens >= settings.ward_daily_token_budget
+            ],
+            "throttle": self.throttle_stats,
+        }
+
+
+# 创建全局实例
+usage_service = UsageService()
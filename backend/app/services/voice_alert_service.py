@@ -4,8 +4,9 @@
 """
 import logging
 from typing import Optional, Dict
-from app.core.database import execute_query, execute_insert
+from app.core.database import execute_insert
 from app.services.websocket_manager import websocket_manager
+from app.services.recipient_directory import recipient_directory
 import uuid
 from datetime import datetime
 
@@ -33,14 +34,10 @@ class VoiceAlertService:
             )
             
             # 通过WebSocket推送到病患端
-            # 查找病患用户（通过patient_id关联）
-            users = await execute_query(
-                "SELECT user_id FROM users WHERE patient_id = ? AND is_active = 1",
-                (patient_id,)
-            )
+            # 查找病患用户（接收人目录，排除同样关联该患者的家属用户）
+            user_id = (await recipient_directory.get_patient(patient_id)).patient_user_id
             
-            if users:
-                user_id = users[0]['user_id']
+            if user_id:
                 await websocket_manager.send_to_user(
                     user_id,
                     {
@@ -68,13 +65,9 @@ class VoiceAlertService:
             )
             
             # 通过WebSocket推送
-            users = await execute_query(
-                "SELECT user_id FROM users WHERE patient_id = ? AND is_active = 1",
-                (patient_id,)
-            )
+            user_id = (await recipient_directory.get_patient(patient_id)).patient_user_id
             
-            if users:
-                user_id = users[0]['user_id']
+            if user_id:
                 await websocket_manager.send_to_user(
                     user_id,
                     {
@@ -101,13 +94,9 @@ class VoiceAlertService:
             )
             
             # 通过WebSocket推送
-            users = await execute_query(
-                "SELECT user_id FROM users WHERE patient_id = ? AND is_active = 1",
-                (patient_id,)
-            )
+            user_id = (await recipient_directory.get_patient(patient_id)).patient_user_id
             
-            if users:
-                user_id = users[0]['user_id']
+            if user_id:
                 await websocket_manager.send_to_user(
                     user_id,
                     {
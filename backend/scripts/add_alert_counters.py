@@ -0,0 +1,88 @@
+"""
+数据库迁移脚本：创建 alert_counters 表（按患者、严重程度统计的未处理告警数）
+由 alerts 表上的触发器维护：插入、删除告警，以及修改告警的 status/severity/patient_id 时
+在同一个事务内增减计数，所有写入告警的代码都不需要改动；
+实时状态、护士站看板按主键读取计数，不再对 alerts 做 COUNT(*)。
+重复执行会按 alerts 表重新统计（可用于校正计数）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import execute_query, execute_script
+
+
+# 在计数上加 delta（计数行不存在时先创建）
+def _bump(patient_id: str, severity: str, delta: str) -> str:
+    return f"""
+    INSERT OR IGNORE INTO alert_counters (patient_id, severity, pending_count)
+    VALUES ({patient_id}, COALESCE({severity}, 'medium'), 0);
+    UPDATE alert_counters
+    SET pending_count = pending_count {delta} 1, updated_at = CURRENT_TIMESTAMP
+    WHERE patient_id = {patient_id} AND severity = COALESCE({severity}, 'medium');"""
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS alert_counters (
+    patient_id TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    pending_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (patient_id, severity)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_alert_counters_insert
+AFTER INSERT ON alerts
+WHEN NEW.status = 'pending'
+BEGIN{_bump("NEW.patient_id", "NEW.severity", "+")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alert_counters_delete
+AFTER DELETE ON alerts
+WHEN OLD.status = 'pending'
+BEGIN{_bump("OLD.patient_id", "OLD.severity", "-")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alert_counters_update_old
+AFTER UPDATE OF status, severity, patient_id ON alerts
+WHEN OLD.status = 'pending'
+     AND (NEW.status IS NOT 'pending' OR NEW.severity IS NOT OLD.severity OR NEW.patient_id IS NOT OLD.patient_id)
+BEGIN{_bump("OLD.patient_id", "OLD.severity", "-")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alert_counters_update_new
+AFTER UPDATE OF status, severity, patient_id ON alerts
+WHEN NEW.status = 'pending'
+     AND (OLD.status IS NOT 'pending' OR NEW.severity IS NOT OLD.severity OR NEW.patient_id IS NOT OLD.patient_id)
+BEGIN{_bump("NEW.patient_id", "NEW.severity", "+")}
+END;
+"""
+
+# 按 alerts 表重新统计（与建触发器在同一事务内，期间写入的告警不会漏计或重复计）
+REBUILD = """
+DELETE FROM alert_counters;
+INSERT INTO alert_counters (patient_id, severity, pending_count)
+SELECT patient_id, COALESCE(severity, 'medium'), COUNT(*)
+FROM alerts
+WHERE status = 'pending'
+GROUP BY patient_id, COALESCE(severity, 'medium');
+"""
+
+
+async def add_alert_counters():
+    """创建 alert_counters 表和维护触发器，并按现有告警统计计数"""
+    try:
+        await execute_script(f"BEGIN IMMEDIATE;\n{SCHEMA}\n{REBUILD}\nCOMMIT;")
+        rows = await execute_query(
+            "SELECT COUNT(DISTINCT patient_id) AS patients, COALESCE(SUM(pending_count), 0) AS pending FROM alert_counters"
+        )
+        print(f"✅ alert_counters 已就绪: {rows[0]['patients']} 个患者, {rows[0]['pending']} 条未处理告警")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+
+
+if __name__ == '__main__':
+    asyncio.run(add_alert_counters())
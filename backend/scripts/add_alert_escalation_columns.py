@@ -0,0 +1,37 @@
+"""
+数据库迁移脚本：为alerts表添加告警升级字段
+escalation_level: 未确认告警已执行的升级级数
+escalated_at: 最后一次升级的时间
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import execute_query, execute_update
+
+
+COLUMNS = (
+    ("escalation_level", "INTEGER DEFAULT 0"),
+    ("escalated_at", "TIMESTAMP"),
+)
+
+
+async def add_alert_escalation_columns():
+    """添加 escalation_level、escalated_at 字段到alerts表"""
+    existing = {row["name"] for row in await execute_query("PRAGMA table_info(alerts)")}
+    for name, definition in COLUMNS:
+        if name in existing:
+            print(f"✅ {name}字段已存在，跳过")
+            continue
+        try:
+            await execute_update(f"ALTER TABLE alerts ADD COLUMN {name} {definition}")
+            print(f"✅ 成功添加{name}字段到alerts表")
+        except Exception as e:
+            print(f"❌ 迁移失败: {e}")
+            raise
+
+
+if __name__ == '__main__':
+    asyncio.run(add_alert_escalation_columns())
@@ -0,0 +1,37 @@
+"""
+数据库迁移脚本：为alerts表添加告警去重字段
+occurrence_count: 抑制窗口内同类告警的出现次数
+last_seen_at: 最后一次出现的时间
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import execute_query, execute_update
+
+
+COLUMNS = (
+    ("occurrence_count", "INTEGER DEFAULT 1"),
+    ("last_seen_at", "TIMESTAMP"),
+)
+
+
+async def add_alert_occurrence_columns():
+    """添加 occurrence_count、last_seen_at 字段到alerts表"""
+    existing = {row["name"] for row in await execute_query("PRAGMA table_info(alerts)")}
+    for name, definition in COLUMNS:
+        if name in existing:
+            print(f"✅ {name}字段已存在，跳过")
+            continue
+        try:
+            await execute_update(f"ALTER TABLE alerts ADD COLUMN {name} {definition}")
+            print(f"✅ 成功添加{name}字段到alerts表")
+        except Exception as e:
+            print(f"❌ 迁移失败: {e}")
+            raise
+
+
+if __name__ == '__main__':
+    asyncio.run(add_alert_occurrence_columns())
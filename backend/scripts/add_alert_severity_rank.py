@@ -0,0 +1,73 @@
+"""
+数据库迁移脚本：为alerts表添加 severity_rank 字段和分页索引
+severity_rank: 严重程度的数值（critical=4, high=3, medium=2, low=1），与 alert_suppression.SEVERITY_RANK 一致
+由触发器在插入和修改 severity 时维护，所有写入告警的代码都不需要改动；
+告警列表按 (severity_rank, created_at, alert_id) 或 (created_at, alert_id) 做游标分页，
+复合索引让翻到很深的历史时也只扫描一页的数据
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import execute_query, execute_script, execute_update
+
+
+RANK_CASE = """CASE {column}
+                 WHEN 'critical' THEN 4
+                 WHEN 'high' THEN 3
+                 WHEN 'medium' THEN 2
+                 WHEN 'low' THEN 1
+                 ELSE 0
+               END"""
+
+SCHEMA = f"""
+CREATE TRIGGER IF NOT EXISTS trg_alerts_severity_rank_insert
+AFTER INSERT ON alerts
+BEGIN
+    UPDATE alerts SET severity_rank = {RANK_CASE.format(column="NEW.severity")}
+    WHERE alert_id = NEW.alert_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_alerts_severity_rank_update
+AFTER UPDATE OF severity ON alerts
+BEGIN
+    UPDATE alerts SET severity_rank = {RANK_CASE.format(column="NEW.severity")}
+    WHERE alert_id = NEW.alert_id;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_alerts_patient_rank
+    ON alerts(patient_id, severity_rank DESC, created_at DESC, alert_id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_patient_created
+    ON alerts(patient_id, created_at DESC, alert_id DESC);
+CREATE INDEX IF NOT EXISTS idx_alerts_created_id
+    ON alerts(created_at DESC, alert_id DESC);
+"""
+
+
+async def add_alert_severity_rank():
+    """添加 severity_rank 字段、维护触发器和分页索引"""
+    existing = {row["name"] for row in await execute_query("PRAGMA table_info(alerts)")}
+    try:
+        if "severity_rank" in existing:
+            print("✅ severity_rank字段已存在，跳过")
+        else:
+            await execute_update("ALTER TABLE alerts ADD COLUMN severity_rank INTEGER")
+            print("✅ 成功添加severity_rank字段到alerts表")
+
+        # 回填已有告警（重复执行时也会修正不一致的数据）
+        updated = await execute_update(
+            f"UPDATE alerts SET severity_rank = {RANK_CASE.format(column='severity')}"
+        )
+        print(f"✅ 已回填 {updated} 条告警的severity_rank")
+
+        await execute_script(SCHEMA)
+        print("✅ 已创建severity_rank触发器和分页索引")
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        raise
+
+
+if __name__ == '__main__':
+    asyncio.run(add_alert_severity_rank())
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+模型用量数据库扩展脚本
+添加视觉模型token用量汇总表（按小时/患者/病区/模型汇总）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.database import execute_script
+
+# SQL表结构定义
+CREATE_USAGE_TABLES_SQL = """
+-- 模型用量汇总表（每小时每患者每模型一行，分析时累加）
+CREATE TABLE IF NOT EXISTS model_usage_rollups (
+    bucket_hour TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    ward_id TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL,
+    call_count INTEGER DEFAULT 0,
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    estimated_cost REAL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (bucket_hour, patient_id, ward_id, model)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_patient_hour ON model_usage_rollups(patient_id, bucket_hour);
+CREATE INDEX IF NOT EXISTS idx_usage_ward_hour ON model_usage_rollups(ward_id, bucket_hour);
+"""
+
+
+async def add_usage_tables():
+    """创建模型用量相关表"""
+    try:
+        print("📋 开始创建模型用量表...")
+        await execute_script(CREATE_USAGE_TABLES_SQL)
+        print("✅ 模型用量表创建完成！")
+    except Exception as e:
+        print(f"❌ 创建表失败: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+
+if __name__ == "__main__":
+    asyncio.run(add_usage_tables())
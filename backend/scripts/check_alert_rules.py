@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+告警规则校验与基准测试
+1. 语法校验：编译规则文件（上线或热更新前先运行，避免规则错误）
+2. 对照测试：随机生成大量检测结果（含各字段边界值和固定样例），
+   比较规则引擎与原 if/elif 判断的输出（告警类型和全部告警信息）是否完全一致
+3. 基准测试：两种实现各自判断全部样例的耗时
+
+用法:
+    python scripts/check_alert_rules.py [--rules app/services/alert_rules.json] [--cases 20000] [--seed 1]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.alert_rules import DEFAULT_RULES_FILE, compile_rules
+
+
+def legacy_analyze_detections(analysis_data: Dict, patient_name: str, patient_address: str = "您") -> tuple:
+    """规则引擎上线前 AlertService._analyze_detections 的 if/elif 判断（仅删除日志），作为对照基准"""
+    detections = analysis_data.get("detections", {})
+
+    # ========== 优先级1: 生命体征监测（最高优先级，必须最先检查）==========
+    vital_signs = detections.get("vital_signs", {})
+    if vital_signs.get("detected"):
+        # 优先级1.1: 心跳变平（濒临死亡）- 最高优先级
+        if vital_signs.get("heart_rate_flat") or vital_signs.get("critical_life_threat"):
+            description = vital_signs.get("description", "心跳监护仪显示直线，病人可能濒临死亡")
+            # 生命体征异常：不打扰患者，播放温柔音乐
+            return "heart_rate_flat", {
+                "severity": "critical",
+                "title": "心跳变平 - 濒临死亡",
+                "description": description,
+                "message": f"患者{patient_name}心跳变平（直线），可能濒临死亡！需要立即通知家属到现场进行救护和临终陪伴！",
+                "patient_message": None,  # 生命体征异常不显示消息给患者，只播放音乐
+                "play_music": True,  # 播放温柔音乐，不打扰
+                "auto_notify": True,
+                "requires_phone_call": True,
+                "requires_family_notification": True
+            }
+        
+        # 优先级1.2: 其他生命体征异常
+        if (vital_signs.get("heart_rate_slow") or 
+            vital_signs.get("oxygen_low") or 
+            vital_signs.get("respiration_abnormal") or
+            vital_signs.get("blood_pressure_abnormal")):
+            description = vital_signs.get("description", "生命体征异常")
+            # 生命体征异常：不打扰患者，播放温柔音乐
+            return "vital_signs_critical", {
+                "severity": "critical",
+                "title": "生命体征异常",
+                "description": description,
+                "message": f"患者{patient_name}生命体征异常：{description}，需要立即处理！",
+                "patient_message": None,  # 生命体征异常不显示消息给患者，只播放音乐
+                "play_music": True,  # 播放温柔音乐，不打扰
+                "auto_notify": True,
+                "requires_phone_call": False
+            }
+
+    # ========== 优先级2: 跌倒检测 ==========
+    if detections.get("fall", {}).get("detected"):
+        fall_desc = detections["fall"].get("description", "检测到患者跌倒")
+        # 确保描述是中文
+        if not any('\u4e00' <= char <= '\u9fff' for char in fall_desc):
+            # 如果描述是英文，翻译成中文
+            fall_desc = fall_desc.replace("Patient is on the floor", "患者在地面上")
+            fall_desc = fall_desc.replace("near the nurse station", "靠近护士站")
+            fall_desc = fall_desc.replace("indicating a fall", "表明跌倒")
+            fall_desc = fall_desc.replace("Possible head trauma", "可能头部受伤")
+            fall_desc = fall_desc.replace("lying motionless", "躺着一动不动")
+            fall_desc = fall_desc.replace("on the floor", "在地面上")
+        
+        # 患者友好的消息：使用称呼（爷爷/奶奶）而不是姓名
+        patient_message = f"{patient_address}，您摔倒了，我已经发信息给您亲属。如果您还需要呼叫120，请您回复我。"
+        
+        return "fall_detected", {
+            "severity": "critical",
+            "title": "跌倒检测",
+            "description": fall_desc,
+            "message": f"患者{patient_name}检测到跌倒，请立即查看！",
+            "patient_message": patient_message,  # 患者端友好消息
+            "auto_notify": True
+        }
+    
+    # ========== 优先级3: 吊瓶监测 ==========
+    iv_drip = detections.get("iv_drip", {})
+    fluid_level = iv_drip.get("fluid_level", "")
+    description = iv_drip.get("description", "")
+    
+    # 优先级1: 完全空了 - 需要电话呼叫
+    if iv_drip.get("completely_empty") or fluid_level == "已打完":
+        patient_message = f"{patient_address}，您的吊液已完全输完，我已经通知亲属，请您立即联系护士更换。"
+        return "iv_drip_completely_empty", {
+            "severity": "critical",
+            "title": "吊瓶完全空",
+            "description": "吊瓶完全空了，需要立即电话呼叫护士",
+            "message": f"患者{patient_name}吊瓶完全空了，需要立即电话呼叫护士！",
+            "patient_message": patient_message,  # 患者端友好消息
+            "auto_notify": True,
+            "requires_phone_call": True
+        }
+    
+    # 优先级2: 袋子/玻璃瓶空（紧急警告）
+    # 关键判断：如果液体已经流到滴液管，但袋子/玻璃瓶上半部分已空，这是危险情况
+    # 1. 明确标记了袋子空
+    # 2. fluid_level是"袋子空"
+    # 3. 检测到"半满" - 根据我们的提示词，如果袋子/玻璃瓶上半部分还有液体，应该显示"满"或"接近打完"
+    #    如果显示"半满"，很可能意味着上半部分已经空了，液体已经流到滴液管
+    # 4. 描述中提到袋子空、上半部分空、滴液管等关键词
+    bag_empty_indicators = [
+        iv_drip.get("bag_empty"),
+        iv_drip.get("needs_emergency_alert"),
+        fluid_level == "袋子空",
+        # 如果显示"半满"，很可能是袋子空的情况（因为如果袋子还有液体，应该显示"满"）
+        fluid_level == "半满",
+        # 描述中提到的危险关键词
+        "空" in description if description else False,
+        "上半部分" in description if description else False,
+        "滴液管" in description if description else False,
+        "静脉滴注" in description if description else False
+    ]
+    
+    if any(bag_empty_indicators):
+        # 患者友好的消息：高情商提醒，使用称呼
+        patient_message = f"{patient_address}，您的吊液快输完了，我已经通知亲属，您可主动联系护士，避免耽误换液。"
+        return "iv_drip_bag_empty", {
+            "severity": "critical",
+            "title": "吊瓶袋子空",
+            "description": "吊瓶袋子/玻璃瓶已空，液体已流到滴液管，需要立即紧急处理",
+            "message": f"患者{patient_name}吊瓶袋子/玻璃瓶已空，液体已流到滴液管，需要立即紧急处理！请立即联系护士！",
+            "patient_message": patient_message,  # 患者端友好消息
+            "auto_notify": True,
+            "requires_phone_call": False
+        }
+    
+    # 优先级3: 需要更换（一般情况）
+    if iv_drip.get("needs_replacement"):
+        patient_message = f"{patient_address}，您的吊液快输完了，我已经通知亲属，您可主动联系护士，避免耽误换液。"
+        return "iv_drip_empty", {
+            "severity": "medium",
+            "title": "输液监测",
+            "description": "输液即将完成或已打完",
+            "message": f"患者{patient_name}输液即将完成，请准备更换",
+            "patient_message": patient_message,  # 患者端友好消息
+            "auto_notify": True
+        }
+    
+    # ========== 优先级4: 皮肤异常检测（包括面色紫绀和其他皮肤异常）==========
+    facial = detections.get("facial_analysis", {})
+    # 支持中英文肤色值
+    skin_color = facial.get("skin_color", "")
+    description = facial.get("description", "")
+    
+    # 检测皮肤异常的关键词
+    skin_abnormal_keywords = ["紫红色", "紫蓝色", "深红色", "青紫色", "瘀斑", "紫癜", "皮疹", "斑块", "病变", "异常"]
+    
+    # 检查是否为皮肤异常
+    is_skin_abnormal = (
+        skin_color in ["紫绀", "cyanotic", "异常", "abnormal"] or
+        any(keyword in description for keyword in skin_abnormal_keywords if description)
+    )
+    
+    if is_skin_abnormal:
+        # 根据描述判断严重程度
+        critical_keywords = ["紫绀", "紫红色", "紫蓝色", "深红色", "严重", "立即", "紧急"]
+        is_critical = any(keyword in description for keyword in critical_keywords if description) or skin_color in ["紫绀", "cyanotic"]
+        
+        severity = "critical" if is_critical else "high"
+        title = "皮肤异常" if skin_color == "异常" else "面色异常"
+        
+        # 生成详细描述
+        if description and len(description) > 20:
+            detail_desc = description[:200]  # 限制长度
+        else:
+            detail_desc = "患者皮肤出现异常，需要立即关注"
+        
+        return "facial_cyanotic", {
+            "severity": severity,
+            "title": title,
+            "description": detail_desc,
+            "message": f"患者{patient_name}检测到皮肤异常：{detail_desc[:100]}，请立即处理！",
+            "auto_notify": True
+        }
+    
+    # ========== 优先级5: 异常活动 ==========
+    activity = detections.get("activity", {})
+    if activity.get("abnormal"):
+        return "abnormal_activity", {
+            "severity": "high",
+            "title": "活动异常",
+            "description": activity.get("description", "检测到异常活动"),
+            "message": f"患者{patient_name}检测到异常活动：{activity.get('description', '异常活动')}",
+            "auto_notify": True
+        }
+    
+    # ========== 优先级6: 异常情绪/表情 ==========
+    expression = facial.get("expression", "")
+    
+    # 如果expression为null或"无法判断"，说明未检测到人脸，跳过表情分析
+    if expression in [None, "null", "无法判断", "N/A", ""]:
+        pass
+    else:
+        # 支持中英文情绪值
+        negative_emotions = ["痛苦", "pain", "恐惧", "fear", "焦虑", "anxiety", 
+                            "担忧", "worried", "沮丧", "depressed", "悲伤", "sad"]
+        
+        if expression in negative_emotions:
+            # 根据情绪类型生成不同的告警消息
+            emotion_messages = {
+                "痛苦": "表现出痛苦表情",
+                "pain": "表现出痛苦表情",
+                "恐惧": "表现出恐惧表情",
+                "fear": "表现出恐惧表情",
+                "焦虑": "表现出焦虑表情",
+                "anxiety": "表现出焦虑表情",
+                "担忧": "表现出担忧表情，情绪异常",
+                "worried": "表现出担忧表情，情绪异常",
+                "沮丧": "表现出沮丧表情，情绪低落",
+                "depressed": "表现出沮丧表情，情绪低落",
+                "悲伤": "表现出悲伤表情，情绪低落",
+                "sad": "表现出悲伤表情，情绪低落"
+            }
+            
+            emotion_desc = emotion_messages.get(expression, "情绪异常")
+            # 痛苦、恐惧、焦虑为中等优先级，担忧、沮丧、悲伤为低优先级但需要关注
+            severity = "medium" if expression in ["痛苦", "pain", "恐惧", "fear", "焦虑", "anxiety"] else "low"
+
+            return "facial_pain", {
+                "severity": severity,
+                "title": "表情异常",
+                "description": f"患者{emotion_desc}",
+                "message": f"患者{patient_name}{emotion_desc}，请关注",
+                "auto_notify": True
+            }
+    
+    return None, {}
+
+
+
+# 模型返回的典型长描述（常态帧）
+LONG_DESCRIPTION = "患者平卧于病床，神志清楚，面部表情平静，呼吸平稳，输液管路通畅，床旁无人陪护。" * 3
+
+# 各检测项字段的候选值（None 表示不返回该字段）
+FIELD_VALUES = {
+    "vital_signs": {
+        "detected": [None, True, False],
+        "heart_rate_flat": [None, True, False],
+        "critical_life_threat": [None, True, False],
+        "heart_rate_slow": [None, True, False],
+        "oxygen_low": [None, True, False],
+        "respiration_abnormal": [None, False, True],
+        "blood_pressure_abnormal": [None, False, True],
+        "description": [None, "", "心电监护仪显示心率45次/分", "SpO2 88%"],
+    },
+    "fall": {
+        "detected": [None, True, False],
+        "description": [None, "", "患者倒在床边地面上", "Patient is on the floor near the nurse station, lying motionless",
+                        "Possible head trauma, on the floor"],
+    },
+    "iv_drip": {
+        "completely_empty": [None, True, False],
+        "bag_empty": [None, True, False],
+        "needs_emergency_alert": [None, False, True],
+        "needs_replacement": [None, True, False],
+        "fluid_level": [None, "", "满", "半满", "接近打完", "袋子空", "已打完"],
+        "description": [None, "", "吊瓶液体充足", "上半部分已空", "液体已流到滴液管", "静脉滴注正常", "袋子空了",
+                        LONG_DESCRIPTION, LONG_DESCRIPTION + "上半部分已空"],
+    },
+    "facial_analysis": {
+        "skin_color": [None, "", "正常", "紫绀", "cyanotic", "异常", "abnormal", "pale"],
+        "expression": [None, "", "null", "无法判断", "N/A", "平静", "痛苦", "pain", "恐惧", "焦虑", "担忧",
+                       "worried", "沮丧", "悲伤", "sad", "happy"],
+        "description": [None, "", "面色红润", "面部可见紫红色瘀斑，需要立即处理", "皮疹",
+                        "患者面色苍白，口唇青紫色，情况严重需要紧急处理，建议立即通知医生" * 3,
+                        "面部皮肤呈深红色，范围较大，需要持续观察和记录变化情况",
+                        LONG_DESCRIPTION, LONG_DESCRIPTION + "左侧面颊可见斑块"],
+        "estimated_age": [None, 45, 72],
+        "gender": [None, "男", "女", "female"],
+    },
+    "activity": {
+        "abnormal": [None, True, False],
+        "description": [None, "", "患者频繁翻身", "患者试图拔除输液管"],
+    },
+    "bed_exit": {
+        "patient_in_bed": [None, True, False],
+    },
+}
+
+
+def random_detections(rng: random.Random) -> Dict:
+    """随机生成检测结果（各检测项随机缺失，字段值偏向正常值）"""
+    detections = {}
+    for group, fields in FIELD_VALUES.items():
+        if rng.random() < 0.2:
+            continue
+        item = {}
+        for field, values in fields.items():
+            # 约一半概率取第一个值（缺失），其余均匀取值
+            value = values[0] if rng.random() < 0.5 else rng.choice(values)
+            if value is not None:
+                item[field] = value
+        detections[group] = item
+    return detections
+
+
+FIXED_CASES: List[Dict] = [
+    {},
+    {"vital_signs": {"detected": True, "heart_rate_flat": True}},
+    {"vital_signs": {"detected": True, "oxygen_low": True, "description": "血氧85%"}, "fall": {"detected": True}},
+    {"fall": {"detected": True, "description": "Patient is on the floor"}},
+    {"iv_drip": {"fluid_level": "已打完"}, "fall": {"detected": False}},
+    {"iv_drip": {"fluid_level": "半满"}},
+    {"iv_drip": {"description": "袋子已空"}},
+    {"iv_drip": {"needs_replacement": True, "description": "液体剩余约20%"}},
+    {"facial_analysis": {"skin_color": "异常", "description": "短描述"}},
+    {"facial_analysis": {"skin_color": "紫绀"}},
+    {"facial_analysis": {"description": "面部可见紫癜，分布于双侧脸颊，颜色较深，边界清楚"}},
+    {"activity": {"abnormal": True}},
+    {"facial_analysis": {"expression": "痛苦"}},
+    {"facial_analysis": {"expression": "沮丧"}, "bed_exit": {"patient_in_bed": False}},
+    {"bed_exit": {"patient_in_bed": False}},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="告警规则校验与基准测试")
+    parser.add_argument("--rules", default=str(DEFAULT_RULES_FILE), help="规则文件路径")
+    parser.add_argument("--cases", type=int, default=20000, help="随机样例数")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-golden", action="store_true", help="只做语法校验和基准测试（规则有意修改、不再与原逻辑一致时使用）")
+    args = parser.parse_args()
+
+    with open(args.rules, "r", encoding="utf-8") as f:
+        ruleset = compile_rules(json.load(f), args.rules)
+    print(f"✅ 规则编译通过: {len(ruleset.rules)} 条 ({args.rules})")
+
+    rng = random.Random(args.seed)
+    cases = FIXED_CASES + [random_detections(rng) for _ in range(args.cases)]
+    names = [("张三", "您"), ("李奶奶", "奶奶")]
+
+    if not args.skip_golden:
+        mismatches = 0
+        counts: Dict[str, int] = {}
+        for index, detections in enumerate(cases):
+            patient_name, patient_address = names[index % len(names)]
+            expected = legacy_analyze_detections({"detections": detections}, patient_name, patient_address)
+            actual = ruleset.evaluate(detections, patient_name, patient_address)
+            counts[expected[0] or "无告警"] = counts.get(expected[0] or "无告警", 0) + 1
+            if expected != actual:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ 不一致: {json.dumps(detections, ensure_ascii=False)}")
+                    print(f"   原逻辑: {expected}")
+                    print(f"   规则表: {actual}")
+        print(f"📊 样例分布: {json.dumps(counts, ensure_ascii=False)}")
+        if mismatches:
+            print(f"❌ 对照测试失败: {mismatches}/{len(cases)} 个样例结果不一致")
+            sys.exit(1)
+        print(f"✅ 对照测试通过: {len(cases)} 个样例结果完全一致")
+
+    # 常态帧：各检测项都有长描述但无需告警（实际运行中绝大多数帧）
+    steady = {
+        "vital_signs": {"detected": False, "description": LONG_DESCRIPTION},
+        "fall": {"detected": False, "description": LONG_DESCRIPTION},
+        "iv_drip": {"fluid_level": "满", "needs_replacement": False, "description": LONG_DESCRIPTION},
+        "facial_analysis": {"skin_color": "正常", "expression": "平静", "description": LONG_DESCRIPTION},
+        "activity": {"abnormal": False, "description": LONG_DESCRIPTION},
+    }
+    for scenario, samples in (("随机样例", cases), ("常态帧", [steady] * len(cases))):
+        for label, evaluate in (
+            ("原 if/elif", lambda d, n, a: legacy_analyze_detections({"detections": d}, n, a)),
+            ("规则引擎", ruleset.evaluate),
+        ):
+            start = time.perf_counter()
+            for index, detections in enumerate(samples):
+                patient_name, patient_address = names[index % len(names)]
+                evaluate(detections, patient_name, patient_address)
+            elapsed = time.perf_counter() - start
+            print(f"⏱️ [{scenario}] {label}: {elapsed * 1000:.1f} ms / {len(samples)} 次, "
+                  f"平均 {elapsed / len(samples) * 1e6:.2f} μs")
+
+
+if __name__ == "__main__":
+    main()
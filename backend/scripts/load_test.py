@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+端到端压测工具
+模拟 N 个摄像头向 /api/analysis/analyze 和 /api/analysis/batch 上传帧，
+同时 M 个护士站 WebSocket 客户端监听告警推送
+
+配合 scripts/mock_vision_server.py 使用，避免压测真实 One-API:
+    python scripts/mock_vision_server.py --port 9100 &
+    ONE_API_BASE_URL=http://127.0.0.1:9100/v1 ONE_API_KEY=mock python run_production.py &
+    python scripts/load_test.py --cameras 20 --nurses 5 --duration 60 --server-pid <后端PID>
+
+输出：吞吐量、各接口及各处理阶段的 p50/p95/p99 延迟、数据库写入速率、内存占用
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+from PIL import Image
+
+project_root = Path(__file__).parent.parent
+DEFAULT_DB_PATH = project_root / "data" / "hospital_monitoring.db"
+
+# 统计写入速率的表
+DB_TABLES = ["ai_analysis_results", "alerts", "notifications"]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """计算分位数（q: 0-1）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+def make_frame(width: int, height: int) -> bytes:
+    """生成一张测试JPEG（带噪声，避免被过度压缩成不真实的小图）"""
+    image = Image.effect_noise((width, height), 40).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def count_db_rows(db_path: Path) -> Dict[str, int]:
+    """统计各表行数（只读方式打开，不影响后端）"""
+    counts = {}
+    if not db_path.exists():
+        return counts
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for table in DB_TABLES:
+            try:
+                counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.Error:
+                pass
+    finally:
+        conn.close()
+    return counts
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """读取进程常驻内存（MB），仅支持Linux /proc"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class LoadTest:
+    """压测运行器"""
+
+    def __init__(self, args):
+        self.args = args
+        self.frame = Path(args.image).read_bytes() if args.image else make_frame(args.width, args.height)
+        self.latencies: Dict[str, List[float]] = {"analyze": [], "batch": []}
+        self.stage_timings: Dict[str, List[float]] = {}
+        self.results = {"ok": 0, "failed": 0, "skipped": 0, "http_errors": 0, "frames": 0}
+        self.ws_messages = 0
+        self.ws_push_delays: List[float] = []
+        self.ws_connected = 0
+        self.memory_samples: List[float] = []
+        self.stop_at = 0.0
+
+    def _record_result(self, result: Dict):
+        """记录单帧分析结果和各阶段耗时"""
+        self.results["frames"] += 1
+        if result.get("status") == "success":
+            self.results["ok"] += 1
+        elif result.get("status") == "skipped":
+            # 超出token预算被降采样的帧
+            self.results["skipped"] += 1
+        else:
+            self.results["failed"] += 1
+        for stage, seconds in (result.get("timings") or {}).items():
+            if isinstance(seconds, (int, float)):
+                self.stage_timings.setdefault(stage, []).append(seconds)
+
+    async def camera(self, client: httpx.AsyncClient, camera_index: int, patient_id: str):
+        """单个摄像头：按间隔上传帧，部分通过批量接口"""
+        camera_id = f"loadtest-cam-{camera_index}"
+        # 错开启动时间，避免所有摄像头同时上传
+        await asyncio.sleep(random.random() * self.args.interval)
+        while time.time() < self.stop_at:
+            started = time.perf_counter()
+            try:
+                if random.random() < self.args.batch_ratio:
+                    await self._upload_batch(client, camera_id, patient_id)
+                    self.latencies["batch"].append(time.perf_counter() - started)
+                else:
+                    await self._upload_single(client, camera_id, patient_id)
+                    self.latencies["analyze"].append(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                self.results["http_errors"] += 1
+                print(f"⚠️ [{camera_id}] 请求失败: {type(e).__name__}: {e}", file=sys.stderr)
+            elapsed = time.perf_counter() - started
+            await asyncio.sleep(max(0.0, self.args.interval - elapsed))
+
+    async def _upload_single(self, client: httpx.AsyncClient, camera_id: str, patient_id: str):
+        response = await client.post(
+            "/api/analysis/analyze",
+            params={"patient_id": patient_id, "camera_id": camera_id, "timestamp_ms": int(time.time() * 1000)},
+            files={"file": ("frame.jpg", self.frame, "image/jpeg")},
+        )
+        if response.status_code != 200:
+            self.results["http_errors"] += 1
+            return
+        self._record_result(response.json())
+
+    async def _upload_batch(self, client: httpx.AsyncClient, camera_id: str, patient_id: str):
+        now_ms = int(time.time() * 1000)
+        frames = [
+            {"patient_id": patient_id, "camera_id": camera_id, "timestamp_ms": now_ms + i}
+            for i in range(self.args.batch_size)
+        ]
+        files = [("files", (f"frame_{i}.jpg", self.frame, "image/jpeg")) for i in range(self.args.batch_size)]
+        response = await client.post("/api/analysis/batch", data={"frames": json.dumps(frames)}, files=files)
+        if response.status_code != 200:
+            self.results["http_errors"] += 1
+            return
+        for item in response.json():
+            self._record_result(item.get("result") or {"status": item.get("status")})
+
+    async def nurse_listener(self, ws_url: str):
+        """护士站WebSocket客户端：统计收到的告警和推送延迟"""
+        try:
+            async with websockets.connect(ws_url, open_timeout=10) as ws:
+                self.ws_connected += 1
+                while time.time() < self.stop_at:
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        continue
+                    self.ws_messages += 1
+                    try:
+                        message = json.loads(raw)
+                        sent_at = datetime.fromisoformat(message["timestamp"])
+                        self.ws_push_delays.append((datetime.now() - sent_at).total_seconds())
+                    except (ValueError, KeyError, TypeError):
+                        pass
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            print(f"⚠️ WebSocket连接失败: {ws_url}: {e}", file=sys.stderr)
+
+    async def memory_sampler(self):
+        while time.time() < self.stop_at:
+            rss = read_rss_mb(self.args.server_pid)
+            if rss is not None:
+                self.memory_samples.append(rss)
+            await asyncio.sleep(1.0)
+
+    async def resolve_patients(self, client: httpx.AsyncClient) -> List[str]:
+        if self.args.patient_ids:
+            return self.args.patient_ids.split(",")
+        response = await client.get("/api/patients")
+        response.raise_for_status()
+        patient_ids = [p["patient_id"] for p in response.json()]
+        if not patient_ids:
+            raise SystemExit("❌ 数据库中没有患者，请先运行 scripts/init_db.py 或通过 --patient-ids 指定")
+        return patient_ids
+
+    async def resolve_nurse_id(self, client: httpx.AsyncClient) -> str:
+        if self.args.nurse_id:
+            return self.args.nurse_id
+        response = await client.post(
+            "/api/auth/login",
+            json={"username": self.args.nurse_username, "password": self.args.nurse_password},
+        )
+        if response.status_code == 200:
+            return response.json()["user_id"]
+        print("⚠️ 护士账号登录失败，WebSocket客户端将使用虚拟ID（收不到告警推送）", file=sys.stderr)
+        return "loadtest-nurse"
+
+    async def run(self) -> Dict:
+        args = self.args
+        ws_base = args.base_url.replace("http://", "ws://").replace("https://", "wss://")
+        timeout = httpx.Timeout(args.request_timeout)
+        limits = httpx.Limits(max_connections=args.cameras * 2 + 10)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+            patient_ids = await self.resolve_patients(client)
+            nurse_id = await self.resolve_nurse_id(client)
+            db_before = count_db_rows(Path(args.db))
+            started = time.time()
+            self.stop_at = started + args.duration
+
+            tasks = [asyncio.create_task(self.nurse_listener(f"{ws_base}/ws/{nurse_id}")) for _ in range(args.nurses)]
+            tasks += [
+                asyncio.create_task(self.camera(client, i, patient_ids[i % len(patient_ids)]))
+                for i in range(args.cameras)
+            ]
+            if args.server_pid:
+                tasks.append(asyncio.create_task(self.memory_sampler()))
+            await asyncio.gather(*tasks)
+
+            elapsed = time.time() - started
+            db_after = count_db_rows(Path(args.db))
+
+        return self.report(elapsed, db_before, db_after)
+
+    def report(self, elapsed: float, db_before: Dict[str, int], db_after: Dict[str, int]) -> Dict:
+        requests = sum(len(v) for v in self.latencies.values())
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "cameras": self.args.cameras,
+            "nurse_clients": self.args.nurses,
+            "requests": requests,
+            "frames": self.results["frames"],
+            "throughput": {
+                "requests_per_second": requests / elapsed if elapsed else 0,
+                "frames_per_second": self.results["frames"] / elapsed if elapsed else 0,
+            },
+            "results": self.results,
+            "endpoint_latency": {name: summarize(values) for name, values in self.latencies.items()},
+            "stage_latency": {stage: summarize(values) for stage, values in sorted(self.stage_timings.items())},
+            "websocket": {
+                "connected": self.ws_connected,
+                "messages": self.ws_messages,
+                "push_delay": summarize(self.ws_push_delays),
+            },
+            "db_writes_per_second": {
+                table: (db_after.get(table, 0) - db_before.get(table, 0)) / elapsed
+                for table in db_after
+            } if elapsed else {},
+            "server_memory_mb": {
+                "start": self.memory_samples[0] if self.memory_samples else None,
+                "peak": max(self.memory_samples) if self.memory_samples else None,
+                "end": self.memory_samples[-1] if self.memory_samples else None,
+            },
+        }
+
+
+def print_report(report: Dict):
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    print("=" * 70)
+    print(f"⏱️  持续时间: {report['duration_seconds']}秒  摄像头: {report['cameras']}  护士客户端: {report['nurse_clients']}")
+    print(f"📈 吞吐量: {report['throughput']['requests_per_second']:.2f} 请求/秒, "
+          f"{report['throughput']['frames_per_second']:.2f} 帧/秒")
+    print(f"📊 结果: {report['results']}")
+    print("-" * 70)
+    print(f"{'延迟(秒)':<24}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for section in ("endpoint_latency", "stage_latency"):
+        for name, s in report[section].items():
+            print(f"{name:<24}{s['count']:>8}{fmt(s['p50']):>10}{fmt(s['p95']):>10}{fmt(s['p99']):>10}")
+    ws = report["websocket"]
+    push = ws["push_delay"]
+    print(f"{'ws_push_delay':<24}{push['count']:>8}{fmt(push['p50']):>10}{fmt(push['p95']):>10}{fmt(push['p99']):>10}")
+    print("-" * 70)
+    print(f"🔌 WebSocket: 已连接 {ws['connected']}，收到消息 {ws['messages']}")
+    print(f"💾 数据库写入速率(行/秒): " + ", ".join(f"{k}={v:.2f}" for k, v in report["db_writes_per_second"].items()))
+    mem = report["server_memory_mb"]
+    print(f"🧠 后端内存(MB): 开始={fmt(mem['start'])} 峰值={fmt(mem['peak'])} 结束={fmt(mem['end'])}")
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能监护系统端到端压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--cameras", type=int, default=10, help="模拟摄像头数量 N")
+    parser.add_argument("--nurses", type=int, default=3, help="护士站WebSocket客户端数量 M")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长（秒）")
+    parser.add_argument("--interval", type=float, default=5.0, help="每个摄像头的上传间隔（秒）")
+    parser.add_argument("--batch-ratio", type=float, default=0.2, help="通过 /batch 上传的比例 0-1")
+    parser.add_argument("--batch-size", type=int, default=4, help="每次批量上传的帧数")
+    parser.add_argument("--patient-ids", help="逗号分隔的患者ID（默认从 /api/patients 获取）")
+    parser.add_argument("--nurse-id", help="护士用户ID（默认使用护士账号登录获取）")
+    parser.add_argument("--nurse-username", default="nurse001")
+    parser.add_argument("--nurse-password", default="nurse123")
+    parser.add_argument("--image", help="测试图片路径（默认生成噪声JPEG）")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--request-timeout", type=float, default=180)
+    parser.add_argument("--db", default=str(DEFAULT_DB_PATH), help="后端SQLite数据库路径（统计写入速率）")
+    parser.add_argument("--server-pid", type=int, help="后端进程PID（统计内存占用）")
+    parser.add_argument("--json-out", help="将报告写入JSON文件")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"📄 报告已写入: {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+本地模拟视觉模型服务（OpenAI兼容接口）
+用于压测和离线调试，替代真实的 One-API，不消耗模型额度
+
+用法:
+    python scripts/mock_vision_server.py --port 9100 --latency-median 2.0 --error-rate 0.02
+    然后设置 ONE_API_BASE_URL=http://127.0.0.1:9100/v1 ONE_API_KEY=mock 启动后端
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from datetime import datetime
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+app = FastAPI(title="Mock Vision API")
+
+# 运行参数（由命令行覆盖）
+config = {
+    "latency_median": 2.0,  # 延迟中位数（秒）
+    "latency_sigma": 0.5,  # 对数正态分布的sigma，越大长尾越明显
+    "latency_per_kb_ms": 0.0,  # 每KB请求体额外增加的延迟（毫秒），用于模拟大图片更慢
+    "error_rate": 0.0,  # 返回HTTP 500/429的概率
+    "malformed_rate": 0.0,  # 返回无法解析JSON的概率
+}
+
+stats = {
+    "requests": 0,
+    "errors": 0,
+    "malformed": 0,
+    "scenarios": {},
+}
+
+# 场景权重：大部分画面正常，少量异常
+SCENARIOS = [
+    ("normal", 0.80),
+    ("fall", 0.04),
+    ("iv_drip_bag_empty", 0.04),
+    ("iv_drip_completely_empty", 0.02),
+    ("bed_exit", 0.04),
+    ("facial_pain", 0.04),
+    ("heart_rate_flat", 0.02),
+]
+
+
+def _base_payload() -> dict:
+    """正常场景的检测结果（与提示词中的输出格式一致）"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "scene_type": "bed_patient",
+        "overall_status": "正常",
+        "detections": {
+            "fall": {"detected": False, "confidence": 0.97, "description": "患者平躺在床上，无跌倒迹象", "severity": "低"},
+            "bed_exit": {"patient_in_bed": True, "location": "床上", "duration_estimate": "无"},
+            "activity": {"type": "正常", "description": "患者安静休息", "abnormal": False},
+            "facial_analysis": {
+                "estimated_age": 72,
+                "gender": "男",
+                "skin_color": "正常",
+                "expression": "中性",
+                "emotion_confidence": 0.82,
+                "description": "面色红润，表情放松"
+            },
+            "iv_drip": {
+                "detected": True,
+                "fluid_level": "满",
+                "fill_percent": 85,
+                "bag_empty": False,
+                "completely_empty": False,
+                "needs_replacement": False,
+                "needs_emergency_alert": False,
+                "needs_phone_call": False,
+                "description": "袋子上半部分有液体，判定为满"
+            },
+            "vital_signs": {
+                "detected": False,
+                "heart_rate": None,
+                "heart_rate_slow": False,
+                "heart_rate_flat": False,
+                "oxygen_saturation": None,
+                "oxygen_low": False,
+                "respiration_rate": None,
+                "respiration_abnormal": False,
+                "blood_pressure": None,
+                "blood_pressure_abnormal": False,
+                "critical_life_threat": False,
+                "needs_family_notification": False,
+                "needs_emergency_rescue": False,
+                "description": "画面中未见生命监控设备"
+            }
+        },
+        "recommended_action": "无",
+        "alert_message": ""
+    }
+
+
+def build_detection_payload(scenario: str) -> dict:
+    """根据场景生成检测结果"""
+    payload = _base_payload()
+    detections = payload["detections"]
+
+    if scenario == "fall":
+        detections["fall"].update({"detected": True, "confidence": 0.93, "description": "患者侧躺在床边地面上，表明跌倒", "severity": "紧急"})
+        detections["bed_exit"].update({"patient_in_bed": False, "location": "房间"})
+        payload.update({"overall_status": "紧急", "recommended_action": "立即告警", "alert_message": "患者跌倒"})
+    elif scenario == "iv_drip_bag_empty":
+        detections["iv_drip"].update({"fluid_level": "袋子空", "fill_percent": 10, "bag_empty": True, "needs_emergency_alert": True,
+                                      "description": "袋子上半部分已空，滴液管中有液体，判定为袋子空"})
+        payload.update({"overall_status": "紧急", "recommended_action": "立即告警", "alert_message": "吊瓶袋子已空"})
+    elif scenario == "iv_drip_completely_empty":
+        detections["iv_drip"].update({"fluid_level": "已打完", "fill_percent": 0, "completely_empty": True, "needs_phone_call": True,
+                                      "description": "袋子完全空了，滴液管中也没有液体，判定为已打完"})
+        payload.update({"overall_status": "紧急", "recommended_action": "立即告警", "alert_message": "吊瓶已打完"})
+    elif scenario == "bed_exit":
+        detections["bed_exit"].update({"patient_in_bed": False, "location": "卫生间", "duration_estimate": "约5分钟"})
+        payload.update({"overall_status": "注意", "recommended_action": "监控"})
+    elif scenario == "facial_pain":
+        detections["facial_analysis"].update({"expression": "痛苦", "emotion_confidence": 0.77,
+                                              "description": "眉头紧锁，嘴角下拉，表现出痛苦"})
+        payload.update({"overall_status": "注意", "recommended_action": "监控"})
+    elif scenario == "heart_rate_flat":
+        payload["scene_type"] = "monitoring_device"
+        detections["vital_signs"].update({"detected": True, "heart_rate": 0, "heart_rate_flat": True,
+                                          "critical_life_threat": True, "needs_family_notification": True,
+                                          "needs_emergency_rescue": True, "description": "心电图显示为直线，无心跳波形"})
+        payload.update({"overall_status": "紧急", "recommended_action": "立即告警",
+                        "alert_message": "病人心跳变平，可能濒临死亡，需要立即通知家属到现场进行救护和临终陪伴！"})
+    return payload
+
+
+def pick_scenario() -> str:
+    """按权重随机选择场景"""
+    r = random.random()
+    cumulative = 0.0
+    for name, weight in SCENARIOS:
+        cumulative += weight
+        if r <= cumulative:
+            return name
+    return "normal"
+
+
+def sample_latency(body_size: int) -> float:
+    """对数正态分布延迟（中位数为 latency_median）"""
+    base = config["latency_median"] * math.exp(random.gauss(0, config["latency_sigma"]))
+    return base + config["latency_per_kb_ms"] * body_size / 1024 / 1000
+
+
+def _completion(content: str, model: str, prompt_tokens: int) -> dict:
+    completion_tokens = max(1, len(content) // 2)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI 兼容的 chat completions 接口"""
+    body = await request.body()
+    stats["requests"] += 1
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        return JSONResponse(status_code=400, content={"error": {"message": "invalid json"}})
+
+    model = data.get("model", "mock-vision")
+    # 估算提示词token：文本按每2字符1个token，图片按固定值计
+    prompt_chars = 0
+    image_count = 0
+    prompt_text = ""
+    for message in data.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            prompt_chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    prompt_chars += len(part.get("text", ""))
+                    prompt_text += part.get("text", "")
+                elif part.get("type") == "image_url":
+                    image_count += 1
+    prompt_tokens = prompt_chars // 2 + image_count * 258
+
+    await asyncio.sleep(sample_latency(len(body)))
+
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        status_code = random.choice([500, 502, 429])
+        return JSONResponse(status_code=status_code, content={"error": {"message": "mock upstream error"}})
+
+    if random.random() < config["malformed_rate"]:
+        stats["malformed"] += 1
+        content = '```json\n{"overall_status": "正常", "detections": {"fall": {"detected": false,, "description": "截断的'
+        return _completion(content, model, prompt_tokens)
+
+    scenario = pick_scenario()
+    stats["scenarios"][scenario] = stats["scenarios"].get(scenario, 0) + 1
+    payload = build_detection_payload(scenario)
+    if "区域定位" in prompt_text:
+        # 完整画面分析时返回吊瓶/监护仪的位置框（相对坐标）
+        payload["regions"] = {"iv_drip": [0.62, 0.05, 0.78, 0.45],
+                              "vital_monitor": [0.05, 0.1, 0.3, 0.35] if payload["scene_type"] == "monitoring_device" else None}
+    content = "```json\n" + json.dumps(payload, ensure_ascii=False, indent=2) + "\n```"
+    return _completion(content, model, prompt_tokens)
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock-vision", "object": "model"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    """模拟服务统计"""
+    return {"config": config, **stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟视觉模型服务（OpenAI兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-median", type=float, default=2.0, help="延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布sigma（长尾程度）")
+    parser.add_argument("--latency-per-kb-ms", type=float, default=0.0, help="每KB请求体额外延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="HTTP错误率 0-1")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="畸形JSON比例 0-1")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子（便于复现）")
+    args = parser.parse_args()
+
+    config.update({
+        "latency_median": args.latency_median,
+        "latency_sigma": args.latency_sigma,
+        "latency_per_kb_ms": args.latency_per_kb_ms,
+        "error_rate": args.error_rate,
+        "malformed_rate": args.malformed_rate,
+    })
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    print(f"🤖 模拟视觉模型服务: http://{args.host}:{args.port}/v1")
+    print(f"   配置: {config}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,12 +17,22 @@ class AppConfig {
   /// 将COS图片URL转换为代理URL（解决CORS跨域问题）
   /// 
   /// 如果URL是腾讯云COS地址，则通过后端代理访问
+  /// 本地图片存储（院内部署）的相对路径 /api/images/store/... 按后端地址补全
   /// 否则直接返回原URL
-  static String getProxiedImageUrl(String? originalUrl) {
+  /// 指定 [width]/[quality] 时由后端缩放为WebP后返回，减少移动端流量
+  static String getProxiedImageUrl(String? originalUrl, {int? width, int? quality}) {
     if (originalUrl == null || originalUrl.isEmpty) {
       return '';
     }
     
+    if (originalUrl.contains('/api/images/store/')) {
+      final absoluteUrl = originalUrl.startsWith('/') ? '$baseUrl$originalUrl' : originalUrl;
+      if (width == null && quality == null) {
+        return absoluteUrl;
+      }
+      return _proxyUrl(absoluteUrl, width: width, quality: quality);
+    }
+    
     // 检查是否为腾讯云COS地址
     final cosDomains = [
       'cos.na-siliconvalley.myqcloud.com',
@@ -37,12 +47,22 @@ class AppConfig {
     
     if (isCosUrl) {
       // 通过后端代理访问
-      final encodedUrl = Uri.encodeComponent(originalUrl);
-      return '$apiBaseUrl/images/proxy?url=$encodedUrl';
+      return _proxyUrl(originalUrl, width: width, quality: quality);
     }
     
     // 非COS地址直接返回
     return originalUrl;
   }
+  
+  static String _proxyUrl(String url, {int? width, int? quality}) {
+    final encodedUrl = Uri.encodeComponent(url);
+    var proxiedUrl = '$apiBaseUrl/images/proxy?url=$encodedUrl';
+    if (width != null || quality != null) {
+      if (width != null) proxiedUrl += '&w=$width';
+      if (quality != null) proxiedUrl += '&q=$quality';
+      proxiedUrl += '&format=webp';
+    }
+    return proxiedUrl;
+  }
 }
 
@@ -282,7 +282,8 @@ class _AlertDetailPageState extends State<AlertDetailPage> {
     final description = alert['description'] as String? ?? '';
     final originalImageUrl = alert['image_url'] as String?;
     // 使用代理URL解决CORS问题
-    final imageUrl = AppConfig.getProxiedImageUrl(originalImageUrl);
+    // 详情页按屏幕宽度加载缩放后的图片，不下载1080p原图
+    final imageUrl = AppConfig.getProxiedImageUrl(originalImageUrl, width: 1080);
     final createdAt = alert['created_at'] as String?;
     final severity = alert['severity'] as String?;
     
@@ -145,6 +145,19 @@ class _AlertsScreenState extends State<AlertsScreen> {
     );
   }
 
+  Widget _buildImagePlaceholder() {
+    return Container(
+      height: 80,
+      color: _hintColor.withOpacity(0.1),
+      child: Center(
+        child: Icon(
+          Icons.image_not_supported_outlined,
+          color: _hintColor,
+        ),
+      ),
+    );
+  }
+
   Widget _buildAlertCard(Map<String, dynamic> alert) {
     final severity = alert['severity'] as String?;
     final color = _getSeverityColor(severity);
@@ -188,20 +201,26 @@ class _AlertsScreenState extends State<AlertsScreen> {
                   child: ImageFiltered(
                     imageFilter: ImageFilter.blur(sigmaX: 2, sigmaY: 2),
                     child: Image.network(
-                      AppConfig.getProxiedImageUrl(alert['image_url']),
+                      // 列表使用小尺寸缩略图，没有缩略图时使用原图
+                      AppConfig.getProxiedImageUrl(
+                          (alert['image_variants'] as Map?)?['small'] ?? alert['image_url']),
                       height: 80,
                       width: double.infinity,
                       fit: BoxFit.cover,
                       errorBuilder: (context, error, stackTrace) {
-                        return Container(
+                        final thumbnail = (alert['image_variants'] as Map?)?['small'];
+                        if (thumbnail == null || thumbnail == alert['image_url']) {
+                          return _buildImagePlaceholder();
+                        }
+                        // 缩略图加载失败（生成失败或已被清理）时改用原图
+                        return Image.network(
+                          AppConfig.getProxiedImageUrl(alert['image_url']),
                           height: 80,
-                          color: _hintColor.withOpacity(0.1),
-                          child: Center(
-                            child: Icon(
-                              Icons.image_not_supported_outlined,
-                              color: _hintColor,
-                            ),
-                          ),
+                          width: double.infinity,
+                          fit: BoxFit.cover,
+                          errorBuilder: (context, error, stackTrace) {
+                            return _buildImagePlaceholder();
+                          },
                         );
                       },
                     ),